@@ -1,22 +1,93 @@
 # app.py
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response
 import json
 import os
+import sqlite3
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
+from typing import Optional
 from bouldering_agent import BoulderDatabase, BoulderingRecommendationAgent, Boulder
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
+from autocomplete import AutocompleteIndex
+from boulder_snapshot import SnapshotStore
+from bulk_import import boulder_from_record, import_records, iter_csv, iter_ndjson
+from dedup import find_duplicate
+from geocode_cache import CachedGeocoder, GeocodeCache, Gazetteer, GeocodingUnavailable
+import metrics
+from metrics import timed
+from map_tiles import TileCache, tile_cache_dir, valid_tile
+from serialization import encoded_response, json_response, ndjson_response, parse_fields, project
+from serving import PoolSaturated, RecommendationPool, geocode_pool_from_env
 
 app = Flask(__name__)
 
 # Initialize the database and agent
 db = BoulderDatabase('boulders.db')
-agent = BoulderingRecommendationAgent(db)
-geocoder = Nominatim(user_agent="boulderbot")
+
+# With BOULDER_SNAPSHOT_DIR set, workers read the shared memory-mapped snapshot
+# published after ingest (python -m boulder_snapshot publish) instead of SQLite
+snapshot_dir = os.environ.get('BOULDER_SNAPSHOT_DIR')
+agent = BoulderingRecommendationAgent(SnapshotStore(snapshot_dir, fallback=db) if snapshot_dir else db)
+
+# Recommendations and remote geocoding run in bounded pools so that neither
+# can take every request thread (see serving.py)
+recommender = RecommendationPool.from_env(agent, db.db_path, snapshot_dir)
+geocode_pool, geocode_timeout = geocode_pool_from_env()
+
+def _nominatim():
+    # geopy is only imported once a query misses the cache and gazetteer
+    from geopy.geocoders import Nominatim
+    # NOMINATIM_DOMAIN points at a self-hosted server, e.g. "nominatim.internal:8080"
+    domain = os.environ.get('NOMINATIM_DOMAIN')
+    if domain:
+        return Nominatim(user_agent="boulderbot", domain=domain,
+                         scheme=os.environ.get('NOMINATIM_SCHEME', 'https'))
+    return Nominatim(user_agent="boulderbot")
+
+geocoder = CachedGeocoder(
+    _nominatim,
+    GeocodeCache(os.path.join(os.path.dirname(os.path.abspath(db.db_path)), 'geocode_cache.db')),
+    gazetteer_factory=lambda: Gazetteer.from_database(db.db_path),
+    remote_pool=geocode_pool,
+    remote_timeout=geocode_timeout
+)
+
+# GeoJSON tiles for the map, invalidated as routes are added
+tiles = TileCache(db.db_path, tile_cache_dir(db.db_path))
+
+# Name prefix index for autocomplete, built in the background at startup
+_autocomplete = None
+_autocomplete_builder = None
+_autocomplete_lock = threading.Lock()
+
+def _build_autocomplete():
+    global _autocomplete
+    _autocomplete = AutocompleteIndex.from_database(db.db_path)
+
+def autocomplete_index() -> Optional[AutocompleteIndex]:
+    """The autocomplete index, or None while it is being built"""
+    global _autocomplete_builder
+    if _autocomplete is None:
+        with _autocomplete_lock:
+            # Started here too, so a failed build is retried by the next request
+            if _autocomplete is None and not (_autocomplete_builder and _autocomplete_builder.is_alive()):
+                _autocomplete_builder = threading.Thread(target=_build_autocomplete,
+                                                         name='autocomplete-build', daemon=True)
+                _autocomplete_builder.start()
+    return _autocomplete
+
+def refresh_autocomplete():
+    """Pick up new routes in an already built index"""
+    if _autocomplete is not None:
+        _autocomplete.refresh()
 
 # Sample data for testing
-def initialize_sample_data():
-    """Add sample bouldering data for testing"""
+def initialize_sample_data() -> int:
+    """Add the sample bouldering data for testing, skipping samples already stored
+
+    Returns:
+        The number of samples added
+    """
     sample_boulders = [
         Boulder(
             name="The Nose",
@@ -110,23 +181,92 @@ def initialize_sample_data():
         )
     ]
     
-    # Check if data already exists
-    existing = db.get_boulders_near_location(37.0, -119.0, 500)
-    if len(existing) < 5:  # Add sample data if not enough exists
-        for boulder in sample_boulders:
-            db.add_boulder(boulder)
+    conn = sqlite3.connect(db.db_path)
+    stored = {url for url, in conn.execute(
+        f"SELECT url FROM boulders WHERE url IN ({', '.join('?' * len(sample_boulders))})",
+        [boulder.url for boulder in sample_boulders])}
+    conn.close()
+    missing = [boulder for boulder in sample_boulders if boulder.url not in stored]
+    if missing:
+        db.add_boulders(missing)
+        tiles.invalidate((boulder.latitude, boulder.longitude) for boulder in missing)
+    return len(missing)
+
+@app.cli.command('seed')
+def seed_command():
+    """Add the sample boulders to the database"""
+    print(f"Added {initialize_sample_data()} sample boulders")
+
+# Seed an empty database on startup; a cheap existence check, not a scan
+if not db.has_boulders():
+    initialize_sample_data()
+autocomplete_index()
+
+# BOULDERBOT_SERVER_TIMING=1 adds per-request stage timings as a Server-Timing header
+SERVER_TIMING = os.environ.get('BOULDERBOT_SERVER_TIMING') == '1'
+
+@app.before_request
+def start_server_timing():
+    if SERVER_TIMING and metrics.REGISTRY.enabled:
+        request.server_timing_token = metrics.start_request_timing()
+
+@app.after_request
+def add_server_timing(response):
+    token = getattr(request, 'server_timing_token', None)
+    if token is not None:
+        header = metrics.finish_request_timing(token)
+        if header:
+            response.headers['Server-Timing'] = header
+    return response
 
-# Initialize sample data on startup
-initialize_sample_data()
+@app.route('/metrics')
+def prometheus_metrics():
+    """Per-stage latency histograms in Prometheus text format"""
+    return Response(metrics.REGISTRY.render_prometheus(),
+                    mimetype='text/plain; version=0.0.4')
 
 @app.route('/')
 def index():
     """Main page with search interface"""
     return render_template('index.html')
 
+# Fields a recommendation can be projected to with fields=
+RECOMMENDATION_FIELDS = ('id', 'name', 'grade', 'location', 'latitude', 'longitude',
+                         'approach_distance', 'route_type', 'holds', 'description', 'url',
+                         'rating', 'height', 'fa', 'distance', 'recommendation_score')
+
+# Upper bound on the limit parameter
+MAX_RECOMMENDATIONS = 1000
+
+def _wants_ndjson(data) -> bool:
+    requested = request.args.get('format') or data.get('format')
+    if requested:
+        return requested == 'ndjson'
+    return request.accept_mimetypes.best == 'application/x-ndjson'
+
+@app.route('/tiles/<int:z>/<int:x>/<int:y>.geojson')
+def map_tile(z, x, y):
+    """GeoJSON problems (or clusters, when zoomed out) inside one map tile"""
+    if not valid_tile(z, x, y):
+        return jsonify({
+            'success': False,
+            'error': 'Tile out of range'
+        }), 404
+    
+    response = encoded_response(tiles.get(z, x, y), 'application/geo+json')
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    return response
+
 @app.route('/api/recommend', methods=['POST'])
 def get_recommendations():
-    """API endpoint for getting route recommendations"""
+    """API endpoint for getting route recommendations
+    
+    Optional parameters, in the JSON body or the query string:
+        fields: Comma-separated list (or array) of recommendation fields to return
+        limit: Number of recommendations, up to MAX_RECOMMENDATIONS (default 10)
+        format: "ndjson" streams one recommendation per line without statistics;
+            sending Accept: application/x-ndjson does the same
+    """
     try:
         data = request.get_json()
         
@@ -137,59 +277,132 @@ def get_recommendations():
         preferred_holds = data.get('holds', [])
         max_approach = float(data.get('max_approach', 2.0))
         search_radius = float(data.get('search_radius', 100.0))
+        limit = min(max(int(request.args.get('limit', data.get('limit', 10))), 1), MAX_RECOMMENDATIONS)
+        fields = parse_fields(request.args.get('fields', data.get('fields')), RECOMMENDATION_FIELDS)
         
-        # Get recommendations
-        recommendations = agent.recommend_routes(
-            user_location=(latitude, longitude),
-            preferred_grades=preferred_grades,
-            preferred_holds=preferred_holds,
-            max_approach_distance=max_approach,
-            search_radius=search_radius,
-            limit=10
-        )
+        # Get recommendations, plus area statistics unless streaming
+        streaming = _wants_ndjson(data)
+        recommendations, stats = recommender.recommend({
+            'user_location': (latitude, longitude),
+            'preferred_grades': preferred_grades,
+            'preferred_holds': preferred_holds,
+            'max_approach_distance': max_approach,
+            'search_radius': search_radius,
+            'limit': limit
+        }, with_statistics=not streaming)
         
-        # Get area statistics
-        stats = agent.get_area_statistics((latitude, longitude), search_radius)
+        if streaming:
+            return ndjson_response(project(recommendations, fields))
         
-        return jsonify({
-            'success': True,
-            'recommendations': recommendations,
-            'statistics': stats
-        })
+        with timed('app.encode'):
+            return json_response({
+                'success': True,
+                'recommendations': list(project(recommendations, fields)),
+                'statistics': stats
+            })
         
+    except (PoolSaturated, FutureTimeoutError):
+        return _overloaded('Too many recommendation requests in progress')
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 400
 
+def _overloaded(message: str):
+    response = jsonify({'success': False, 'error': message})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
 @app.route('/api/add_route', methods=['POST'])
 def add_route():
     """API endpoint for adding new routes"""
     try:
         data = request.get_json()
         
-        boulder = Boulder(
-            name=data['name'],
-            grade=data['grade'],
-            location=data['location'],
-            latitude=float(data['latitude']),
-            longitude=float(data['longitude']),
-            approach_distance=float(data.get('approach_distance', 0)),
-            route_type='boulder',
-            holds=data.get('holds', []),
-            description=data.get('description', ''),
-            url=data.get('url', ''),
-            rating=float(data.get('rating', 0)),
-            height=float(data.get('height', 0)) if data.get('height') else None,
-            fa=data.get('fa', '')
-        )
+        boulder = boulder_from_record(data)
+        
+        # A problem already stored under a similar name is kept but linked to it
+        duplicate_of = find_duplicate(db.db_path, boulder)
+        db.add_boulder(boulder, duplicate_of)
+        geocoder.add_location(boulder.location, boulder.latitude, boulder.longitude)
+        if duplicate_of is None:
+            tiles.invalidate([(boulder.latitude, boulder.longitude)])
+            refresh_autocomplete()
         
-        db.add_boulder(boulder)
+        return jsonify({
+            'success': True,
+            'message': 'Route added successfully' if duplicate_of is None
+                       else 'Route recorded as a duplicate of an existing route',
+            'duplicate_of': duplicate_of
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/api/import', methods=['POST'])
+def import_routes():
+    """API endpoint for bulk-importing routes from an NDJSON or CSV body
+    
+    The body is read incrementally and written in batched transactions, so
+    uploads of any size use bounded memory. Pick the format with the
+    Content-Type (application/x-ndjson or text/csv) or ?format=ndjson|csv.
+    """
+    content_type = (request.mimetype or '').lower()
+    body_format = request.args.get('format')
+    if body_format is None:
+        if content_type in ('text/csv', 'application/csv'):
+            body_format = 'csv'
+        elif content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl',
+                              'application/json-lines'):
+            body_format = 'ndjson'
+    if body_format not in ('csv', 'ndjson'):
+        return jsonify({
+            'success': False,
+            'error': 'Send text/csv or application/x-ndjson, or pass ?format=csv|ndjson'
+        }), 415
+    
+    try:
+        batch_size = min(max(int(request.args.get('batch_size', 500)), 1), 5000)
+        records = iter_csv(request.stream) if body_format == 'csv' else iter_ndjson(request.stream)
         
+        def index_batch(boulders):
+            for boulder in boulders:
+                geocoder.add_location(boulder.location, boulder.latitude, boulder.longitude)
+            tiles.invalidate((boulder.latitude, boulder.longitude) for boulder in boulders)
+        
+        report = import_records(db, records, batch_size=batch_size, on_batch=index_batch)
+        refresh_autocomplete()
+        
+        return jsonify({
+            'success': report['failed'] == 0,
+            **report
+        })
+        
+    except Exception as e:
         return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/api/autocomplete')
+def autocomplete():
+    """API endpoint suggesting problems and areas whose names start with ?q="""
+    try:
+        query = request.args.get('q', '')
+        limit = int(request.args.get('limit', 10))
+        
+        # No suggestions until the index is built, rather than a request
+        # that waits seconds for it
+        index = autocomplete_index()
+        return json_response({
             'success': True,
-            'message': 'Route added successfully'
+            'ready': index is not None,
+            'suggestions': index.search(query, limit) if index is not None else []
         })
         
     except Exception as e:
@@ -211,12 +424,7 @@ def geocode_location():
                 'error': 'Location text is required'
             }), 400
 
-        # Add 'USA' if not specified and input looks like a city or state
-        if not any(country in location_text.lower() for country in ['usa', 'united states', 'america']):
-            if not location_text.replace('.', '').replace('-', '').isdigit():  # Not a zip code
-                location_text += ', USA'
-        
-        # Try to geocode the location
+        # Answer from the cache or gazetteer, falling back to Nominatim on a miss
         location = geocoder.geocode(location_text)
         
         if location is None:
@@ -229,14 +437,11 @@ def geocode_location():
             'success': True,
             'latitude': location.latitude,
             'longitude': location.longitude,
-            'display_name': location.address
+            'display_name': location.display_name
         })
         
-    except (GeocoderTimedOut, GeocoderUnavailable) as e:
-        return jsonify({
-            'success': False,
-            'error': 'Geocoding service temporarily unavailable'
-        }), 503
+    except GeocodingUnavailable:
+        return _overloaded('Geocoding service temporarily unavailable')
     except Exception as e:
         return jsonify({
             'success': False,
@@ -0,0 +1,341 @@
+"""Prefix index over problem names and area names for autocomplete
+
+Keys are normalized names kept in a sorted array and searched with
+bisect. Every problem is indexed under its full name and under the name
+starting at each later word, so "lightning" finds "Midnight Lightning".
+Areas are the location breadcrumb segments ("Buttermilks"), aggregated
+over the problems filed under them.
+
+Problems are ranked by rating. Areas are ranked by their average rating
+plus a bonus that grows with the number of problems they hold. Prefixes
+matching more than HEAVY_PREFIX keys have their best matches precomputed,
+so one-letter queries on a million names cost a dict lookup. Other
+prefixes scan at most HEAVY_PREFIX keys.
+
+New rows are picked up incrementally: refresh() reads boulders with ids
+above the last one indexed and inserts them into a small sorted side array,
+which is merged into the main array once it grows past MERGE_AT keys.
+Rows a re-crawl refetched since the last refresh are re-read too, and keys
+of a new name are added. Keys of the old name stay in the arrays, but a
+problem is only suggested when its current name matches the query. Changes
+to a row's location or rating are not picked up until the index is rebuilt
+(when the web workers restart).
+"""
+import math
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+from geocode_cache import normalize_query
+from metrics import timed
+
+# Prefixes matching more keys than this get precomputed results
+HEAVY_PREFIX = 256
+
+# Results precomputed per heavy prefix, and the most a query can ask for
+TOP_K = 20
+
+# Side-array size at which pending keys are merged into the main array
+MERGE_AT = 50000
+
+# Later words of a problem name indexed as extra keys, at most
+MAX_EXTRA_WORDS = 3
+
+_KEY_END = '\U0010ffff'
+
+def normalize_name(text: str) -> str:
+    """Lowercase, accent-free, punctuation-free form of a name or query"""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return normalize_query(text)
+
+def _problem_keys(name: str) -> List[str]:
+    key = normalize_name(name)
+    if not key:
+        return []
+    keys = [key]
+    start = key.find(' ')
+    while start != -1 and len(keys) <= MAX_EXTRA_WORDS:
+        # Numbers ("Problem 3") are not worth a key of their own
+        if not key[start + 1].isdigit():
+            keys.append(key[start + 1:])
+        start = key.find(' ', start + 1)
+    return keys
+
+def _segments(location: str) -> List[str]:
+    return [segment.strip() for segment in location.split('>') if segment.strip()]
+
+class AutocompleteIndex:
+    """In-memory prefix index over the boulders table
+
+    Problem keys refer to boulder ids, whose details are read back from
+    SQLite for the few results returned. Area keys refer to entries in
+    self._areas by negative id. Stored weights are the problem ratings;
+    area weights are computed from their running totals when ranked.
+    """
+
+    def __init__(self, db_path: str, refresh_interval: float = 5.0):
+        self.db_path = db_path
+        self.refresh_interval = refresh_interval
+        self._keys: List[str] = []
+        self._refs = array('q')
+        self._weights = array('d')
+        self._pending_keys: List[str] = []
+        self._pending_refs: List[int] = []
+        self._pending_weights: List[float] = []
+        # Heavy prefix -> best (stored weight, ref) pairs, best first
+        self._top: Dict[str, List[Tuple[float, int]]] = {}
+        # Per area: [name, path, count, located, sum_lat, sum_lon, sum_rating], where
+        # located counts the problems with coordinates, which the sums cover
+        self._areas: List[list] = []
+        self._area_ids: Dict[str, int] = {}
+        self._touched_areas = set()
+        self._max_id = 0
+        self._fetched_after = 0.0  # Rows fetched after this are re-read on refresh
+        self._last_refresh = 0.0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_database(cls, db_path: str, refresh_interval: float = 5.0) -> 'AutocompleteIndex':
+        """Build an index over every boulder currently in the database"""
+        index = cls(db_path, refresh_interval)
+        with timed('autocomplete.build'):
+            # Taken first, so rows refetched while building are re-read later
+            index._fetched_after = index._latest_fetch()
+            entries = list(index._read_new_rows())
+            for area_id in range(len(index._areas)):
+                entries.extend((key, -(area_id + 1), 0.0) for key in index._area_keys(area_id))
+            entries.sort()
+            index._set_main(entries)
+        index._touched_areas.clear()
+        index._last_refresh = time.monotonic()
+        return index
+
+    def _set_main(self, entries: List[Tuple[str, int, float]]):
+        self._keys = [entry[0] for entry in entries]
+        self._refs = array('q', (entry[1] for entry in entries))
+        self._weights = array('d', (entry[2] for entry in entries))
+        self._build_top()
+
+    def _read_new_rows(self) -> Iterable[Tuple[str, int, float]]:
+        """Yield (key, boulder id, weight) for rows above the last indexed id, updating areas"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.execute('''
+            SELECT id, name, location, latitude, longitude, rating FROM boulders
+            WHERE id > ? AND duplicate_of IS NULL ORDER BY id
+        ''', (self._max_id,))
+        for boulder_id, name, location, latitude, longitude, rating in cursor:
+            self._max_id = boulder_id
+            if location:
+                self._add_to_areas(location, latitude, longitude, rating)
+            for key in _problem_keys(name or ''):
+                yield key, boulder_id, rating or 0.0
+        conn.close()
+
+    def _latest_fetch(self) -> float:
+        conn = sqlite3.connect(self.db_path)
+        latest = conn.execute('SELECT MAX(last_fetched) FROM boulders').fetchone()[0]
+        conn.close()
+        return latest or 0.0
+
+    def _read_refetched_rows(self) -> Iterable[Tuple[str, int, float]]:
+        """Yield (key, boulder id, weight) for keys not yet indexed of rows refetched since the last read"""
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute('''
+            SELECT id, name, rating, last_fetched FROM boulders
+            WHERE last_fetched > ? AND id <= ? AND duplicate_of IS NULL
+        ''', (self._fetched_after, self._max_id)).fetchall()
+        conn.close()
+        for boulder_id, name, rating, last_fetched in rows:
+            self._fetched_after = max(self._fetched_after, last_fetched)
+            for key in _problem_keys(name or ''):
+                if not self._has_entry(key, boulder_id):
+                    yield key, boulder_id, rating or 0.0
+
+    def _has_entry(self, key: str, ref: int) -> bool:
+        for keys, refs in ((self._keys, self._refs), (self._pending_keys, self._pending_refs)):
+            i = bisect_left(keys, key)
+            while i < len(keys) and keys[i] == key:
+                if refs[i] == ref:
+                    return True
+                i += 1
+        return False
+
+    def _add_to_areas(self, location: str, latitude, longitude, rating):
+        """Count a problem towards every area in its breadcrumb"""
+        segments = _segments(location)
+        for depth, segment in enumerate(segments):
+            path = ' > '.join(segments[:depth + 1])
+            area_id = self._area_ids.get(path)
+            if area_id is None:
+                area_id = self._area_ids[path] = len(self._areas)
+                self._areas.append([segment, path, 0, 0, 0.0, 0.0, 0.0])
+            area = self._areas[area_id]
+            area[2] += 1
+            # Scraped routes are stored at 0, 0 until they are geocoded
+            if latitude is not None and longitude is not None and (latitude, longitude) != (0.0, 0.0):
+                area[3] += 1
+                area[4] += latitude
+                area[5] += longitude
+            area[6] += rating or 0.0
+            self._touched_areas.add(area_id)
+
+    def _area_keys(self, area_id: int) -> List[str]:
+        key = normalize_name(self._areas[area_id][0])
+        return [key] if key else []
+
+    def _area_weight(self, area_id: int) -> float:
+        name, path, count, located, sum_lat, sum_lon, sum_rating = self._areas[area_id]
+        return sum_rating / count + math.log2(1 + count)
+
+    def _rank(self, pair: Tuple[float, int]) -> float:
+        weight, ref = pair
+        return self._area_weight(-ref - 1) if ref < 0 else weight
+
+    def _best(self, pairs: Iterable[Tuple[float, int]], limit: int) -> List[Tuple[float, int]]:
+        """Highest ranked (weight, ref) pairs with distinct refs"""
+        best, seen = [], set()
+        for pair in sorted(pairs, key=self._rank, reverse=True):
+            if pair[1] not in seen:
+                seen.add(pair[1])
+                best.append(pair)
+                if len(best) == limit:
+                    break
+        return best
+
+    def _build_top(self):
+        """Precompute the best matches of every prefix matching more than HEAVY_PREFIX keys"""
+        self._top = {}
+        keys, refs, weights = self._keys, self._refs, self._weights
+
+        def collect(prefix: str, lo: int, hi: int) -> List[Tuple[float, int]]:
+            # Light ranges are scanned; heavy ones combine their children's results
+            if hi - lo <= HEAVY_PREFIX:
+                return [(weights[i], refs[i]) for i in range(lo, hi)]
+            depth = len(prefix)
+            pairs = []
+            i = lo
+            while i < hi and len(keys[i]) == depth:
+                pairs.append((weights[i], refs[i]))
+                i += 1
+            while i < hi:
+                child = keys[i][:depth + 1]
+                j = bisect_left(keys, child + _KEY_END, i, hi)
+                pairs.extend(collect(child, i, j))
+                i = j
+            best = self._best(pairs, TOP_K)
+            if prefix:
+                self._top[prefix] = best
+            return best
+
+        collect('', 0, len(keys))
+
+    def _offer(self, key: str, ref: int, weight: float):
+        """Let a new or re-weighted ref into the precomputed matches of its prefixes"""
+        for end in range(1, len(key) + 1):
+            prefix = key[:end]
+            top = self._top.get(prefix)
+            if top is None:
+                break  # Longer prefixes match fewer keys, so none are heavy
+            pairs = [pair for pair in top if pair[1] != ref]
+            pairs.append((weight, ref))
+            pairs.sort(key=self._rank, reverse=True)
+            self._top[prefix] = pairs[:TOP_K]
+
+    def _insert(self, key: str, ref: int, weight: float):
+        i = bisect_left(self._pending_keys, key)
+        self._pending_keys.insert(i, key)
+        self._pending_refs.insert(i, ref)
+        self._pending_weights.insert(i, weight)
+        self._offer(key, ref, weight)
+
+    def refresh(self) -> int:
+        """Index boulders added since the last refresh; return how many keys were added"""
+        with self._lock:
+            self._last_refresh = time.monotonic()
+            areas_before = len(self._areas)
+            added = 0
+            for key, ref, weight in list(self._read_refetched_rows()) + list(self._read_new_rows()):
+                self._insert(key, ref, weight)
+                added += 1
+            for area_id in sorted(self._touched_areas):
+                for key in self._area_keys(area_id):
+                    if area_id >= areas_before:
+                        self._insert(key, -(area_id + 1), 0.0)
+                        added += 1
+                    else:
+                        # Gained problems, so it may now outrank other matches
+                        self._offer(key, -(area_id + 1), 0.0)
+            self._touched_areas.clear()
+
+            if len(self._pending_keys) >= MERGE_AT:
+                with timed('autocomplete.merge'):
+                    self._set_main(sorted(zip(
+                        self._keys + self._pending_keys,
+                        list(self._refs) + self._pending_refs,
+                        list(self._weights) + self._pending_weights)))
+                    self._pending_keys, self._pending_refs, self._pending_weights = [], [], []
+            return added
+
+    @staticmethod
+    def _range(keys: List[str], prefix: str) -> Tuple[int, int]:
+        return bisect_left(keys, prefix), bisect_left(keys, prefix + _KEY_END)
+
+    def search(self, query: str, limit: int = 10) -> List[Dict]:
+        """Best matches for a name prefix, areas and problems mixed by weight"""
+        prefix = normalize_name(query)
+        if not prefix:
+            return []
+        limit = max(1, min(limit, TOP_K))
+        if time.monotonic() - self._last_refresh > self.refresh_interval:
+            self.refresh()
+
+        with self._lock, timed('autocomplete.search'):
+            best = self._top.get(prefix)
+            if best is None:
+                lo, hi = self._range(self._keys, prefix)
+                pairs = [(self._weights[i], self._refs[i]) for i in range(lo, hi)]
+                lo, hi = self._range(self._pending_keys, prefix)
+                pairs.extend((self._pending_weights[i], self._pending_refs[i]) for i in range(lo, hi))
+                best = self._best(pairs, limit)
+            refs = [ref for weight, ref in best[:limit]]
+            areas = {ref: self._area_suggestion(-ref - 1) for ref in refs if ref < 0}
+        problems = self._problem_suggestions([ref for ref in refs if ref >= 0])
+        # A renamed problem is still indexed under its old name
+        problems = {ref: problem for ref, problem in problems.items()
+                    if any(key.startswith(prefix) for key in _problem_keys(problem['name']))}
+        return [areas[ref] if ref < 0 else problems[ref] for ref in refs if ref < 0 or ref in problems]
+
+    def _area_suggestion(self, area_id: int) -> Dict:
+        name, path, count, located, sum_lat, sum_lon, sum_rating = self._areas[area_id]
+        return {
+            'type': 'area',
+            'name': name,
+            'location': path,
+            'latitude': sum_lat / located if located else None,
+            'longitude': sum_lon / located if located else None,
+            'count': count,
+        }
+
+    def _problem_suggestions(self, boulder_ids: List[int]) -> Dict[int, Dict]:
+        if not boulder_ids:
+            return {}
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(f'''
+            SELECT id, name, grade, location, latitude, longitude, rating FROM boulders
+            WHERE id IN ({','.join('?' * len(boulder_ids))}) AND duplicate_of IS NULL
+              AND latitude IS NOT NULL AND longitude IS NOT NULL
+              AND NOT (latitude = 0 AND longitude = 0)
+        ''', boulder_ids).fetchall()
+        conn.close()
+        return {row[0]: {
+            'type': 'problem', 'id': row[0], 'name': row[1], 'grade': row[2], 'location': row[3],
+            'latitude': row[4], 'longitude': row[5], 'rating': row[6]
+        } for row in rows}
+
+    def __len__(self) -> int:
+        return len(self._keys) + len(self._pending_keys)
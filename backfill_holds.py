@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Backfill hold types from the descriptions already in the boulders table
+
+The table is split into id ranges that a process pool scans in parallel.
+Each worker opens its own read connection and returns only the rows whose
+holds change. The parent writes each range's updates and the checkpoint in
+one transaction, in id order, so an interrupted run resumes where it
+stopped:
+
+    python -m backfill_holds --db boulders.db --processes 4
+    python -m backfill_holds --db boulders.db --restart   # from the first row again
+
+Holds already on a row are kept; extracted holds are added after them.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import sqlite3
+import time
+from typing import List, Optional, Tuple
+
+from hold_extractor import extract_holds, merge_holds
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = 'holds'
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    # Readers and the writer share the file; wait out each other's locks
+    return sqlite3.connect(db_path, timeout=60)
+
+def init_checkpoints(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+            job TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    conn.commit()
+
+def _checkpoint(conn: sqlite3.Connection) -> int:
+    row = conn.execute('SELECT last_id FROM backfill_checkpoints WHERE job = ?', (JOB_NAME,)).fetchone()
+    return row[0] if row else 0
+
+def extract_range(task: Tuple[str, int, int]) -> Tuple[int, int, List[Tuple[str, int]]]:
+    """
+    Extract holds for ids in (lo, hi]
+
+    Returns:
+        lo, hi, and (holds JSON, id) for every row whose holds change
+    """
+    db_path, lo, hi = task
+    conn = _connect(db_path)
+    rows = conn.execute('''
+        SELECT id, description, holds FROM boulders WHERE id > ? AND id <= ?
+    ''', (lo, hi)).fetchall()
+    conn.close()
+
+    updates = []
+    for boulder_id, description, holds_json in rows:
+        existing = json.loads(holds_json) if holds_json else []
+        holds = merge_holds(existing, extract_holds(description))
+        if holds != existing:
+            updates.append((json.dumps(holds), boulder_id))
+    return lo, hi, updates
+
+def backfill_holds(db_path: str, processes: int = 4, chunk_size: int = 5000,
+                   restart: bool = False, limit: Optional[int] = None) -> dict:
+    """
+    Extract holds from every description after the checkpoint and write them back
+
+    Args:
+        db_path: Database holding the boulders table
+        processes: Worker processes scanning id ranges
+        chunk_size: Ids per range (and per write transaction)
+        restart: Ignore the checkpoint and start from the first row
+        limit: Stop after this many ranges (for trial runs)
+
+    Returns:
+        Rows scanned (by id range), rows updated and elapsed seconds
+    """
+    conn = _connect(db_path)
+    init_checkpoints(conn)
+    start_id = 0 if restart else _checkpoint(conn)
+    max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM boulders').fetchone()[0]
+
+    tasks = [(db_path, lo, min(lo + chunk_size, max_id))
+             for lo in range(start_id, max_id, chunk_size)]
+    if limit is not None:
+        tasks = tasks[:limit]
+    logger.info(f"Backfilling holds for ids {start_id + 1}..{max_id} in {len(tasks)} ranges")
+
+    started = time.perf_counter()
+    updated = 0
+    with multiprocessing.Pool(processes) as pool:
+        # imap keeps id order, so the checkpoint only ever moves forward
+        for lo, hi, updates in pool.imap(extract_range, tasks):
+            with conn:
+                conn.executemany('UPDATE boulders SET holds = ? WHERE id = ?', updates)
+                conn.execute('''
+                    INSERT OR REPLACE INTO backfill_checkpoints (job, last_id, updated_at)
+                    VALUES (?, ?, ?)
+                ''', (JOB_NAME, hi, time.time()))
+            updated += len(updates)
+            elapsed = time.perf_counter() - started
+            logger.info(f"ids up to {hi}: {updated} rows updated ({(hi - start_id) / elapsed:.0f} ids/s)")
+    conn.close()
+
+    return {
+        'scanned_ids': (tasks[-1][2] - start_id) if tasks else 0,
+        'updated': updated,
+        'seconds': round(time.perf_counter() - started, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill hold types from route descriptions")
+    parser.add_argument('--db', default='boulders.db')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start over')
+    parser.add_argument('--limit', type=int, help='Process at most this many id ranges')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    result = backfill_holds(args.db, args.processes, args.chunk_size, args.restart, args.limit)
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
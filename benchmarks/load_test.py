@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""Load test: recommendation throughput during a burst of slow geocodes
+
+Starts the app under gunicorn twice against the same synthetic database,
+once with plain sync workers and once with the serving config
+(gunicorn.conf.py: threaded workers, bounded geocode and recommendation
+pools). Both serve recommendations from a published snapshot, as in
+production. Geocoding points at a local fake Nominatim that answers after
+--geocode-delay seconds. Every geocode query is new, so each one goes remote.
+Both runs use the same number of worker processes:
+
+    python benchmarks/load_test.py --rows 20000 --duration 20 --json load.json
+
+Reported per run: completed recommendations per second with p50/p95
+latency, and geocode answers, refusals (503) and errors.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+from synthetic import REPO_ROOT, build_database
+
+from boulder_snapshot import publish_snapshot
+
+import requests
+
+# Queries are centred on the densest synthetic region
+CENTER = (37.3635, -118.3951)
+
+MODES = {
+    'sync': [],
+    'serving': ['--config', os.path.join(REPO_ROOT, 'gunicorn.conf.py')],
+}
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_fake_nominatim(delay: float) -> ThreadingHTTPServer:
+    """A Nominatim stand-in that answers every search after `delay` seconds"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            body = json.dumps([{'place_id': 1, 'lat': str(CENTER[0]), 'lon': str(CENTER[1]),
+                                'display_name': 'Load test place'}]).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', _free_port()), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def start_app(mode: str, workdir: str, workers: int, nominatim: str) -> subprocess.Popen:
+    port = _free_port()
+    env = dict(os.environ, NOMINATIM_DOMAIN=nominatim, NOMINATIM_SCHEME='http',
+               BOULDER_SNAPSHOT_DIR=os.path.join(workdir, 'snapshots'),
+               PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    command = [sys.executable, '-m', 'gunicorn', 'app:app', *MODES[mode],
+               '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning']
+    process = subprocess.Popen(command, cwd=workdir, env=env)
+    process.base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if requests.get(process.base_url + '/', timeout=1).status_code == 200:
+                return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{mode} server did not start")
+
+def _client(base_url: str, endpoint: str, deadline: float, results: List):
+    session = requests.Session()
+    while time.time() < deadline:
+        if endpoint == 'geocode':
+            payload = {'location': f'load test {uuid.uuid4().hex}'}
+        else:
+            payload = {'latitude': CENTER[0], 'longitude': CENTER[1], 'search_radius': 5}
+        start = time.perf_counter()
+        try:
+            status = session.post(f'{base_url}/api/{endpoint}', json=payload, timeout=60).status_code
+        except requests.RequestException:
+            status = None
+        results.append((endpoint, status, time.perf_counter() - start))
+
+def run_load(base_url: str, geocode_clients: int, recommend_clients: int, duration: float) -> Dict:
+    """Hit both endpoints concurrently for `duration` seconds and summarize"""
+    results: List = []
+    deadline = time.time() + duration
+    threads = [threading.Thread(target=_client, args=(base_url, endpoint, deadline, results))
+               for endpoint, count in (('geocode', geocode_clients), ('recommend', recommend_clients))
+               for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    recommend = sorted(latency for endpoint, status, latency in results
+                       if endpoint == 'recommend' and status == 200)
+    geocode = [status for endpoint, status, _ in results if endpoint == 'geocode']
+    return {
+        'recommend_per_s': round(len(recommend) / duration, 2),
+        'recommend_p50_ms': round(statistics.median(recommend) * 1000, 1) if recommend else None,
+        'recommend_p95_ms': round(recommend[int(len(recommend) * 0.95)] * 1000, 1) if recommend else None,
+        'recommend_errors': sum(1 for endpoint, status, _ in results
+                                if endpoint == 'recommend' and status != 200),
+        'geocode_ok': geocode.count(200),
+        'geocode_refused': geocode.count(503),
+        'geocode_errors': sum(1 for status in geocode if status not in (200, 503)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=20000, help='Synthetic table size')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds of load per run')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn worker processes in both runs')
+    parser.add_argument('--geocode-clients', type=int, default=16)
+    parser.add_argument('--recommend-clients', type=int, default=4)
+    parser.add_argument('--geocode-delay', type=float, default=0.5,
+                        help='Seconds the fake Nominatim takes per answer')
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--json', help='Write the results to this file')
+    args = parser.parse_args()
+
+    nominatim = start_fake_nominatim(args.geocode_delay)
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'boulders.db')
+        build_database(db_path, args.rows)
+        publish_snapshot(db_path, os.path.join(workdir, 'snapshots'))
+        for mode in args.modes.split(','):
+            process = start_app(mode, workdir, args.workers, f'127.0.0.1:{nominatim.server_port}')
+            try:
+                results[mode] = run_load(process.base_url, args.geocode_clients,
+                                         args.recommend_clients, args.duration)
+            finally:
+                process.terminate()
+                process.wait()
+            print(f"{mode:<8} {json.dumps(results[mode])}")
+    nominatim.shutdown()
+
+    if 'sync' in results and 'serving' in results and results['sync']['recommend_per_s']:
+        gain = results['serving']['recommend_per_s'] / results['sync']['recommend_per_s']
+        print(f"Recommendation throughput under geocode load: {gain:.1f}x")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'params': vars(args), 'results': results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""Benchmarks for the database, recommendation and HTTP paths
+
+Builds synthetic tables of each requested size and times inserts, bulk
+ingest, radius queries, recommendations, area statistics and the Flask
+endpoints through the test client. Everything runs offline. Results go to
+JSON so runs from different commits can be compared:
+
+    python benchmarks/run_benchmarks.py --sizes 10000,100000 --out before.json
+    python benchmarks/run_benchmarks.py --sizes 10000,100000 --out after.json --compare before.json
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from synthetic import REPO_ROOT, generate_boulders
+
+from bouldering_agent import BoulderDatabase, BoulderingRecommendationAgent
+
+# Queries are centred on the densest synthetic region
+CENTER = (37.3635, -118.3951)
+
+def time_call(fn: Callable, repeats: int) -> Dict:
+    """Run fn `repeats` times and summarize the wall-clock samples"""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        'repeats': repeats,
+        'median_s': round(statistics.median(samples), 6),
+        'min_s': round(samples[0], 6),
+        'max_s': round(samples[-1], 6),
+    }
+
+def run_size(size: int, radii: List[float], repeats: int, workdir: str) -> List[Dict]:
+    """Run every benchmark against a table of `size` rows"""
+    results = []
+
+    def record(name: str, params: Dict, timing: Dict):
+        results.append({'benchmark': name, 'size': size, 'params': params, **timing})
+        print(f"  {name:<28} {json.dumps(params):<32} median {timing['median_s'] * 1000:10.2f} ms")
+
+    os.chdir(workdir)
+    boulders = list(generate_boulders(size))
+
+    # Single-row inserts, one connection each, into a scratch table
+    scratch = BoulderDatabase(os.path.join(workdir, 'scratch.db'))
+    rows = iter(boulders)
+    record('add_boulder', {'rows': 1}, time_call(lambda: scratch.add_boulder(next(rows)), min(200, size)))
+
+    # Bulk ingest of the whole table
+    db_path = os.path.join(workdir, 'boulders.db')
+    start = time.perf_counter()
+    db = BoulderDatabase(db_path)
+    db.add_boulders(boulders)
+    elapsed = time.perf_counter() - start
+    record('bulk_ingest', {'rows': size},
+           {'repeats': 1, 'median_s': round(elapsed, 6), 'min_s': round(elapsed, 6), 'max_s': round(elapsed, 6)})
+    del boulders
+
+    agent = BoulderingRecommendationAgent(db)
+    for radius in radii:
+        params = {'radius': radius}
+        record('get_boulders_near_location', params,
+               time_call(lambda: db.get_boulders_near_location(CENTER[0], CENTER[1], radius), repeats))
+        record('recommend_routes', params,
+               time_call(lambda: agent.recommend_routes(CENTER, ['V3', 'V4', 'V5'], ['crimps'],
+                                                        max_approach_distance=2.0,
+                                                        search_radius=radius), repeats))
+        record('get_area_statistics', params,
+               time_call(lambda: agent.get_area_statistics(CENTER, radius), repeats))
+
+    # Endpoints through the Flask test client; the app opens boulders.db in the cwd
+    import app as app_module
+    app_module = importlib.reload(app_module)
+    client = app_module.app.test_client()
+    for radius in radii:
+        body = {'latitude': CENTER[0], 'longitude': CENTER[1], 'grades': ['V3', 'V4', 'V5'],
+                'holds': [], 'max_approach': 2.0, 'search_radius': radius}
+        record('POST /api/recommend', {'radius': radius},
+               time_call(lambda: client.post('/api/recommend', json=body), repeats))
+    # Gazetteer hit: local data only, never the remote geocoder
+    client.post('/api/geocode', json={'location': 'Bishop'})
+    record('POST /api/geocode', {'query': 'Bishop'},
+           time_call(lambda: client.post('/api/geocode', json={'location': 'Bishop'}), repeats))
+
+    return results
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def compare(current: List[Dict], baseline_path: str, threshold: float = 1.2):
+    """Print median ratios against a previous results file"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    def key(result):
+        return (result['benchmark'], result['size'], json.dumps(result['params'], sort_keys=True))
+
+    previous = {key(result): result for result in baseline['results']}
+    print(f"\nCompared with {baseline_path} (commit {baseline['meta']['commit'][:10]}):")
+    for result in current:
+        before = previous.get(key(result))
+        if before is None or not before['median_s']:
+            continue
+        ratio = result['median_s'] / before['median_s']
+        flag = '  REGRESSION' if ratio > threshold else ''
+        print(f"  {result['benchmark']:<28} size {result['size']:<8} {json.dumps(result['params']):<32} "
+              f"{ratio:6.2f}x{flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks on synthetic data")
+    parser.add_argument('--sizes', default='10000', help='Comma-separated table sizes, up to 1000000')
+    parser.add_argument('--radii', default='10,50,200', help='Comma-separated search radii in miles')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--out', default='benchmark_results.json')
+    parser.add_argument('--compare', metavar='FILE', help='Earlier results to compare against')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    radii = [float(radius) for radius in args.radii.split(',')]
+
+    results = []
+    cwd = os.getcwd()
+    try:
+        for size in sizes:
+            print(f"size {size}")
+            with tempfile.TemporaryDirectory() as workdir:
+                results.extend(run_size(size, radii, args.repeats, workdir))
+                os.chdir(cwd)
+    finally:
+        os.chdir(cwd)
+
+    output = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'sizes': sizes,
+            'radii': radii,
+            'repeats': args.repeats,
+        },
+        'results': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"\nWrote {len(results)} results to {args.out}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Cold-start benchmark for the web app
+
+Imports app.py in fresh interpreters, the way each gunicorn worker boots,
+and reports how long the import takes and which heavy modules it loaded.
+
+    python benchmarks/startup.py --runs 10 --json startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['pandas', 'numpy', 'sklearn', 'geopy', 'bs4', 'requests']
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "import_seconds": elapsed,
+    "heavy_modules": [m for m in %r if m in sys.modules],
+}))
+''' % (HEAVY_MODULES,)
+
+def measure(runs: int) -> dict:
+    """Import app in `runs` fresh interpreters against a seeded database"""
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    with tempfile.TemporaryDirectory() as workdir:
+        # The first import seeds the empty database; time the warm-database boots
+        subprocess.run([sys.executable, '-c', 'import app'], cwd=workdir, env=env,
+                       check=True, capture_output=True)
+
+        imports, heavy = [], []
+        for _ in range(runs):
+            result = subprocess.run([sys.executable, '-c', CHILD], cwd=workdir, env=env,
+                                    check=True, capture_output=True, text=True)
+            sample = json.loads(result.stdout.strip().splitlines()[-1])
+            imports.append(sample['import_seconds'])
+            heavy = sample['heavy_modules']
+
+    return {
+        'runs': runs,
+        'import_seconds_median': round(statistics.median(imports), 4),
+        'import_seconds_min': round(min(imports), 4),
+        'import_seconds_max': round(max(imports), 4),
+        'heavy_modules_loaded': heavy,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app cold-start time")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', metavar='FILE', help='Also write the results to a JSON file')
+    args = parser.parse_args()
+
+    results = measure(args.runs)
+    print(f"app import: median {results['import_seconds_median'] * 1000:.1f} ms "
+          f"(min {results['import_seconds_min'] * 1000:.1f}, max {results['import_seconds_max'] * 1000:.1f}) "
+          f"over {results['runs']} runs")
+    print(f"heavy modules loaded: {', '.join(results['heavy_modules_loaded']) or 'none'}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""Read-only, memory-mapped snapshot of the boulders table
+
+A builder writes the snapshot once after ingest; every web worker maps the
+same file, so the page cache holds one copy of the data however many
+workers there are, and loading a snapshot costs a header parse rather than
+a table scan.
+
+File layout (native byte order, every section 8-byte aligned):
+
+    header    magic, format version, row count, snapshot version
+    sections  (offset, nbytes) for each entry of SECTIONS, in order
+    data      one packed array per numeric column; for each string column
+              a uint32 offsets array (count + 1) and a UTF-8 blob
+
+Rows are sorted by latitude so radius queries can binary-search a band.
+
+    python -m boulder_snapshot publish --db boulders.db --dir snapshots
+"""
+import argparse
+import bisect
+import json
+import math
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+from bouldering_agent import COLUMNS, BoulderRow
+from grades import grade_ordinal
+from hold_extractor import HOLD_TYPES
+from metrics import timed
+
+MAGIC = b'BSNAP\x00\x00\x01'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sIIQ')
+SECTION = struct.Struct('<QQ')
+
+
+NUMERIC_COLUMNS = [
+    ('id', 'q'),
+    ('latitude', 'd'),
+    ('longitude', 'd'),
+    ('approach_distance', 'd'),  # NaN for NULL
+    ('rating', 'd'),             # NaN for NULL
+    ('height', 'd'),             # NaN for NULL
+    ('grade_ordinal', 'h'),      # -1 for unrecognized grades
+    ('hold_mask', 'I'),
+]
+STRING_COLUMNS = ['name', 'grade', 'location', 'route_type', 'holds', 'description', 'url', 'fa']
+
+SECTIONS = ([(name, fmt) for name, fmt in NUMERIC_COLUMNS] +
+            [(f"{name}{suffix}", fmt) for name in STRING_COLUMNS
+             for suffix, fmt in (('_offsets', 'I'), ('_data', 'B'))])
+
+CURRENT_FILE = 'CURRENT'
+
+def hold_mask(holds: List[str]) -> int:
+    """Bit mask of the known hold types in a list; bit i stands for HOLD_TYPES[i]"""
+    mask = 0
+    for i, hold in enumerate(HOLD_TYPES):
+        if hold in holds:
+            mask |= 1 << i
+    return mask
+
+def _float_or_nan(value) -> float:
+    return float('nan') if value is None else float(value)
+
+def _none_if_nan(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+def build_snapshot(db_path: str, path: str, version: Optional[int] = None) -> int:
+    """Write a snapshot of the boulders table to `path`; return its row count"""
+    version = version if version is not None else time.time_ns()
+    columns = {name: array(fmt) for name, fmt in NUMERIC_COLUMNS}
+    blobs = {name: bytearray() for name in STRING_COLUMNS}
+    offsets = {name: array('I', [0]) for name in STRING_COLUMNS}
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.execute('''
+        SELECT id, name, grade, location, latitude, longitude, approach_distance,
+               route_type, holds, description, url, rating, height, fa
+        FROM boulders
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL AND duplicate_of IS NULL
+        ORDER BY latitude
+    ''')
+    for row in cursor:
+        (row_id, name, grade, location, latitude, longitude, approach,
+         route_type, holds, description, url, rating, height, fa) = row
+        columns['id'].append(row_id)
+        columns['latitude'].append(latitude)
+        columns['longitude'].append(longitude)
+        columns['approach_distance'].append(_float_or_nan(approach))
+        columns['rating'].append(_float_or_nan(rating))
+        columns['height'].append(_float_or_nan(height))
+        columns['grade_ordinal'].append(grade_ordinal(grade))
+        columns['hold_mask'].append(hold_mask(json.loads(holds) if holds else []))
+
+        strings = {'name': name, 'grade': grade, 'location': location, 'route_type': route_type,
+                   'holds': holds, 'description': description, 'url': url, 'fa': fa}
+        for field, value in strings.items():
+            blobs[field] += (value or '').encode('utf-8')
+            offsets[field].append(len(blobs[field]))
+    conn.close()
+
+    count = len(columns['id'])
+    payloads = [columns[name] for name, _ in NUMERIC_COLUMNS]
+    for name in STRING_COLUMNS:
+        payloads.append(offsets[name])
+        payloads.append(blobs[name])
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, count, version))
+        table_start = f.tell()
+        f.write(b'\0' * SECTION.size * len(SECTIONS))
+
+        table = []
+        for payload in payloads:
+            f.write(b'\0' * (-f.tell() % 8))
+            data = payload.tobytes() if isinstance(payload, array) else bytes(payload)
+            table.append((f.tell(), len(data)))
+            f.write(data)
+
+        f.seek(table_start)
+        for offset, nbytes in table:
+            f.write(SECTION.pack(offset, nbytes))
+        f.flush()
+        os.fsync(f.fileno())
+
+    return count
+
+def publish_snapshot(db_path: str, directory: str = 'snapshots', keep: int = 2) -> str:
+    """
+    Build a new snapshot version and make it current
+
+    The snapshot is written under a unique name and then the CURRENT pointer
+    is swapped with an atomic rename, so readers only ever see complete
+    files. Old versions beyond `keep` are removed; workers still mapping one
+    keep working from it until they switch.
+
+    Returns:
+        Path of the published snapshot
+    """
+    os.makedirs(directory, exist_ok=True)
+    version = time.time_ns()
+    filename = f"boulders-{version}.snap"
+    path = os.path.join(directory, filename)
+
+    build_snapshot(db_path, path + '.tmp', version)
+    os.replace(path + '.tmp', path)
+
+    pointer = os.path.join(directory, CURRENT_FILE)
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(filename)
+    os.replace(pointer + '.tmp', pointer)
+
+    snapshots = sorted(name for name in os.listdir(directory)
+                       if name.startswith('boulders-') and name.endswith('.snap'))
+    for old in snapshots[:-keep]:
+        os.remove(os.path.join(directory, old))
+    return path
+
+class BoulderSnapshot:
+    """Zero-copy view of one snapshot file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mmap)
+
+        magic, format_version, self.count, self.version = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} boulder snapshot")
+
+        self._columns = {}
+        for i, (name, fmt) in enumerate(SECTIONS):
+            offset, nbytes = SECTION.unpack_from(buf, HEADER.size + i * SECTION.size)
+            self._columns[name] = buf[offset:offset + nbytes].cast(fmt)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def column(self, name: str) -> memoryview:
+        """Typed view of a numeric column (or string offsets/data section)"""
+        return self._columns[name]
+
+    def string(self, field: str, i: int) -> str:
+        offsets = self._columns[f"{field}_offsets"]
+        data = self._columns[f"{field}_data"]
+        return bytes(data[offsets[i]:offsets[i + 1]]).decode('utf-8')
+
+    def row(self, i: int) -> Dict:
+        """Decode row i into the dict shape BoulderDatabase rows convert to"""
+        return SnapshotRow(self, i).to_dict()
+
+    def candidates_in_band(self, lat: float, lon: float, radius_miles: float) -> List[int]:
+        """Row indexes inside a lat/lon box that contains the search circle"""
+        lat_delta = radius_miles / 68.7 * 1.01
+        latitudes = self._columns['latitude']
+        start = bisect.bisect_left(latitudes, lat - lat_delta)
+        end = bisect.bisect_right(latitudes, lat + lat_delta)
+
+        cos_lat = math.cos(math.radians(min(89.0, abs(lat) + lat_delta)))
+        lon_delta = radius_miles / (69.17 * cos_lat) * 1.01
+        if lon_delta >= 180 or abs(lon) + lon_delta > 180:
+            return list(range(start, end))  # Box wraps the antimeridian; no longitude cut
+
+        longitudes = self._columns['longitude']
+        return [i for i in range(start, end) if abs(longitudes[i] - lon) <= lon_delta]
+
+    def get_boulders_near_location(self, lat: float, lon: float,
+                                   radius_miles: float = 50) -> List[BoulderRow]:
+        """Same contract as BoulderDatabase.get_boulders_near_location"""
+        from geopy.distance import geodesic
+
+        latitudes = self._columns['latitude']
+        longitudes = self._columns['longitude']
+        user_location = (lat, lon)
+        nearby_boulders = []
+        with timed('snapshot.band'):
+            band = self.candidates_in_band(lat, lon, radius_miles)
+        with timed('snapshot.distance'):
+            for i in band:
+                distance = geodesic(user_location, (latitudes[i], longitudes[i])).miles
+                if distance <= radius_miles:
+                    nearby_boulders.append(SnapshotRow(self, i, distance))
+        nearby_boulders.sort(key=lambda boulder: boulder.distance)
+        return nearby_boulders
+
+# Snapshot columns stored as NaN for NULL
+_NULLABLE_FLOATS = {'approach_distance', 'rating', 'height'}
+
+class SnapshotRow(BoulderRow):
+    """BoulderRow reading its columns from the mapped snapshot on access"""
+    __slots__ = ('_snapshot', '_index')
+
+    def __init__(self, snapshot: BoulderSnapshot, index: int, distance: Optional[float] = None):
+        super().__init__((), distance)
+        self._snapshot = snapshot
+        self._index = index
+
+    def _value(self, name: str):
+        if name in _NULLABLE_FLOATS:
+            return _none_if_nan(self._snapshot.column(name)[self._index])
+        if name in ('id', 'latitude', 'longitude'):
+            return self._snapshot.column(name)[self._index]
+        if name not in COLUMNS:
+            raise KeyError(name)
+        value = self._snapshot.string(name, self._index)
+        if name == 'fa':
+            return value or None
+        return value
+
+class SnapshotStore:
+    """The current published snapshot, swapped in when a new version appears
+
+    Falls back to a database (anything with get_boulders_near_location)
+    until a snapshot has been published.
+    """
+
+    def __init__(self, directory: str = 'snapshots', fallback=None, check_interval: float = 1.0):
+        self.directory = directory
+        self.fallback = fallback
+        self.check_interval = check_interval
+        self._snapshot: Optional[BoulderSnapshot] = None
+        self._filename: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[BoulderSnapshot]:
+        """The newest published snapshot, or None if there is none yet"""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._snapshot
+
+        with self._lock:
+            self._checked_at = now
+            try:
+                with open(os.path.join(self.directory, CURRENT_FILE)) as f:
+                    filename = f.read().strip()
+            except FileNotFoundError:
+                return self._snapshot
+            if filename != self._filename:
+                # Readers holding the old snapshot keep it alive until they finish
+                self._snapshot = BoulderSnapshot(os.path.join(self.directory, filename))
+                self._filename = filename
+            return self._snapshot
+
+    def get_boulders_near_location(self, lat: float, lon: float,
+                                   radius_miles: float = 50) -> List[BoulderRow]:
+        snapshot = self.current()
+        if snapshot is None:
+            return self.fallback.get_boulders_near_location(lat, lon, radius_miles)
+        return snapshot.get_boulders_near_location(lat, lon, radius_miles)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and publish boulder snapshots")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    publish = subparsers.add_parser('publish', help='Build a snapshot and make it current')
+    publish.add_argument('--db', default='boulders.db')
+    publish.add_argument('--dir', default='snapshots')
+    publish.add_argument('--keep', type=int, default=2, help='Snapshot versions to keep')
+    args = parser.parse_args()
+
+    if args.command == 'publish':
+        path = publish_snapshot(args.db, args.dir, args.keep)
+        snapshot = BoulderSnapshot(path)
+        print(f"Published {len(snapshot)} boulders to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,43 @@
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
-import numpy as np
-from dataclasses import dataclass
-from typing import List, Dict, Optional, Tuple
+from heapq import nlargest
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+import hashlib
 import json
-import time
-from geopy.distance import geodesic
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import sqlite3
-from datetime import datetime
+import time
+from grades import GRADE_DIFFICULTY, canonical_grades, parse_grade
+from hold_extractor import merge_holds
+from metrics import REGISTRY, timed
+
+# Kept lean on purpose: this module is on the web serving import path, so
+# heavy dependencies (geopy, scrapers) are imported where they are used.
+
+# Columns recording when a route page was last fetched and whether it changed
+FETCH_COLUMNS = (
+    ('first_fetched', 'REAL'),
+    ('last_fetched', 'REAL'),
+    ('content_hash', 'TEXT'),
+    ('fetch_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ('change_count', 'INTEGER NOT NULL DEFAULT 0'),
+)
+
+# Columns added after the original schema, migrated by init_database
+ADDED_COLUMNS = FETCH_COLUMNS + (
+    ('duplicate_of', 'INTEGER'),  # Canonical row id; set rows are hidden from reads
+)
+
+# Boulder fields a route page provides; a change to any of them is a change
+# to the page. Rating, height and FA are not on the scraped page (the scraper
+# leaves placeholders), so a refetch never touches them.
+PAGE_FIELDS = ('name', 'grade', 'location', 'description', 'route_type')
 
-@dataclass
-class Boulder:
-    """Data class for boulder route information"""
+class FetchResult(NamedTuple):
+    """What BoulderDatabase.record_fetch did with a scraped route"""
+    status: str  # 'new', 'changed', 'unchanged' or 'baseline'
+    latitude: Optional[float]  # Of the stored row, for tile invalidation
+    longitude: Optional[float]
+
+class Boulder(NamedTuple):
+    """Immutable record of boulder route information"""
     name: str
     grade: str
     location: str
@@ -28,80 +51,104 @@ class Boulder:
     rating: float
     height: Optional[float] = None
     fa: Optional[str] = None  # First ascent
-    
-class BoulderingScraper:
-    """Scraper for Mountain Project and TheCrag"""
-    
-    def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
-        
-    def scrape_mountain_project(self, area_url: str) -> List[Boulder]:
-        """Scrape boulder routes from Mountain Project"""
-        boulders = []
-        
-        # Note: Mountain Project has an API - recommend using that instead
-        # This is a simplified example of web scraping approach
+
+# Columns of a boulders row as BoulderRow exposes them, in table order
+COLUMNS = ('id', 'name', 'grade', 'location', 'latitude', 'longitude', 'approach_distance',
+           'route_type', 'holds', 'description', 'url', 'rating', 'height', 'fa')
+
+# Large text columns left out of radius scans and read only for returned rows
+DETAIL_COLUMNS = ('description', 'url', 'fa')
+SCAN_COLUMNS = tuple(name for name in COLUMNS if name not in DETAIL_COLUMNS)
+
+_SCAN_INDEX = {name: i for i, name in enumerate(SCAN_COLUMNS)}
+_DETAIL_INDEX = {name: i for i, name in enumerate(DETAIL_COLUMNS)}
+
+class BoulderRow:
+    """Read-only view of one boulders row and its distance from the query point
+
+    Columns are read by name, as from the dicts this replaces, straight out
+    of the scanned row tuple (SCAN_COLUMNS order). Holds are JSON-decoded on
+    first access (or used as is when the source already stores a list) and
+    the DETAIL_COLUMNS are fetched on first access, so rows
+    dropped by a filter pay for neither. load_details() fetches them for
+    many rows in one query.
+    """
+    __slots__ = ('_row', '_holds', '_details', '_db_path', 'distance')
+
+    def __init__(self, row: tuple, distance: Optional[float] = None, db_path: Optional[str] = None):
+        self._row = row
+        self._holds = None
+        self._details = None
+        self._db_path = db_path
+        self.distance = distance
+
+    def _value(self, name: str):
+        index = _SCAN_INDEX.get(name)
+        if index is not None:
+            return self._row[index]
+        if name not in _DETAIL_INDEX:
+            raise KeyError(name)
+        if self._details is None:
+            load_details([self])
+        return self._details[_DETAIL_INDEX[name]]
+
+    def __getitem__(self, name: str):
+        if name == 'holds':
+            if self._holds is None:
+                holds = self._value('holds')
+                if isinstance(holds, str):
+                    holds = json.loads(holds) if holds else []
+                self._holds = holds or []
+            return self._holds
+        if name == 'distance':
+            return self.distance
+        return self._value(name)
+
+    def get(self, name: str, default=None):
         try:
-            response = self.session.get(area_url)
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Parse route information (structure varies by page)
-            route_elements = soup.find_all('div', class_='route-row')
-            
-            for route in route_elements:
-                try:
-                    name = route.find('a', class_='route-name').text.strip()
-                    grade = route.find('span', class_='grade').text.strip()
-                    
-                    # Extract additional details
-                    boulder = Boulder(
-                        name=name,
-                        grade=self._normalize_grade(grade),
-                        location="",  # Extract from page context
-                        latitude=0.0,  # Would need to extract coordinates
-                        longitude=0.0,
-                        approach_distance=0.0,
-                        route_type="boulder",
-                        holds=[],
-                        description="",
-                        url=area_url,
-                        rating=0.0
-                    )
-                    boulders.append(boulder)
-                    
-                except Exception as e:
-                    print(f"Error parsing route: {e}")
-                    
-            time.sleep(1)  # Be respectful with requests
-            
-        except Exception as e:
-            print(f"Error scraping {area_url}: {e}")
-            
-        return boulders
-    
-    def scrape_thecrag(self, area_url: str) -> List[Boulder]:
-        """Scrape boulder routes from TheCrag"""
-        # Similar implementation for TheCrag
-        # TheCrag also has API access which would be preferred
-        pass
-    
-    def _normalize_grade(self, grade: str) -> str:
-        """Normalize different grading systems to V-scale"""
-        # Convert Font, British, etc. to V-scale
-        grade_map = {
-            "4": "V0", "4+": "V0+", "5": "V1", "5+": "V1",
-            "6A": "V3", "6A+": "V3", "6B": "V4", "6B+": "V4",
-            "6C": "V5", "6C+": "V5", "7A": "V6", "7A+": "V7",
-            "7B": "V8", "7B+": "V9", "7C": "V10", "7C+": "V11"
-        }
-        return grade_map.get(grade.upper(), grade)
+            return self[name]
+        except KeyError:
+            return default
+
+    def __contains__(self, name: str) -> bool:
+        return name == 'distance' or name in COLUMNS
+
+    def keys(self) -> Tuple[str, ...]:
+        return COLUMNS + ('distance',)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """All columns and the distance as a plain dict"""
+        return {name: self[name] for name in self.keys()}
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(id={self['id']!r}, name={self['name']!r})"
+
+def load_details(rows: Iterable) -> None:
+    """Fetch the detail columns of database rows that lack them, one query per database"""
+    pending: Dict[str, Dict[int, BoulderRow]] = {}
+    for row in rows:
+        if isinstance(row, BoulderRow) and row._details is None and row._db_path is not None:
+            pending.setdefault(row._db_path, {})[row['id']] = row
+
+    for db_path, by_id in pending.items():
+        conn = sqlite3.connect(db_path)
+        found = conn.execute(f'''
+            SELECT id, {', '.join(DETAIL_COLUMNS)} FROM boulders
+            WHERE id IN ({','.join('?' * len(by_id))})
+        ''', list(by_id)).fetchall()
+        conn.close()
+        for boulder_id, *details in found:
+            by_id[boulder_id]._details = tuple(details)
+        for row in by_id.values():
+            if row._details is None:
+                row._details = (None,) * len(DETAIL_COLUMNS)  # Deleted since the scan
 
 class BoulderDatabase:
     """SQLite database for storing boulder route data"""
     
+    # Rows fetched per round trip when scanning
+    FETCH_CHUNK = 2000
+    
     def __init__(self, db_path: str = "boulders.db"):
         self.db_path = db_path
         self.init_database()
@@ -131,6 +178,12 @@ class BoulderDatabase:
             )
         ''')
         
+        # Columns added to databases created before they existed
+        existing = {row[1] for row in cursor.execute('PRAGMA table_info(boulders)')}
+        for column, definition in ADDED_COLUMNS:
+            if column not in existing:
+                cursor.execute(f'ALTER TABLE boulders ADD COLUMN {column} {definition}')
+        
         cursor.execute('''
             CREATE INDEX IF NOT EXISTS idx_location ON boulders(latitude, longitude);
         ''')
@@ -139,73 +192,176 @@ class BoulderDatabase:
             CREATE INDEX IF NOT EXISTS idx_grade ON boulders(grade);
         ''')
         
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_url ON boulders(url);
+        ''')
+        
+        # Lets readers such as the autocomplete index find refetched rows
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_last_fetched ON boulders(last_fetched)
+            WHERE last_fetched IS NOT NULL;
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_duplicate_of ON boulders(duplicate_of)
+            WHERE duplicate_of IS NOT NULL;
+        ''')
+        
         conn.commit()
         conn.close()
     
-    def add_boulder(self, boulder: Boulder):
-        """Add a boulder to the database"""
+    def has_boulders(self) -> bool:
+        """Cheap check for whether the table holds any rows"""
         conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO boulders (name, grade, location, latitude, longitude, 
-                                approach_distance, route_type, holds, description, 
-                                url, rating, height, fa)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        row = conn.execute('SELECT 1 FROM boulders LIMIT 1').fetchone()
+        conn.close()
+        return row is not None
+    
+    def _boulder_params(self, boulder: Boulder) -> Tuple:
+        """Column values for inserting a boulder"""
+        return (
             boulder.name, boulder.grade, boulder.location, boulder.latitude,
             boulder.longitude, boulder.approach_distance, boulder.route_type,
             json.dumps(boulder.holds), boulder.description, boulder.url,
             boulder.rating, boulder.height, boulder.fa
-        ))
+        )
+    
+    def add_boulder(self, boulder: Boulder, duplicate_of: Optional[int] = None):
+        """Add a boulder to the database, optionally linked to the row it duplicates"""
+        self.add_boulders([boulder], [duplicate_of])
+    
+    def add_boulders(self, boulders: List[Boulder],
+                     duplicate_of: Optional[List[Optional[int]]] = None) -> int:
+        """
+        Add many boulders in a single transaction; return the number added
         
-        conn.commit()
+        Args:
+            boulders: Rows to insert
+            duplicate_of: Per boulder, the id of the row it duplicates or None
+        """
+        duplicate_of = duplicate_of or [None] * len(boulders)
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        with timed('db.insert'):
+            cursor.executemany('''
+                INSERT INTO boulders (name, grade, location, latitude, longitude, 
+                                    approach_distance, route_type, holds, description, 
+                                    url, rating, height, fa, duplicate_of)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [self._boulder_params(boulder) + (canonical,)
+                  for boulder, canonical in zip(boulders, duplicate_of)])
+            
+            conn.commit()
         conn.close()
+        return len(boulders)
     
-    def get_boulders_near_location(self, lat: float, lon: float, 
-                                 radius_miles: float = 50) -> List[Dict]:
-        """Get boulders within radius of a location"""
+    def record_fetch(self, boulder: Boulder, fetched_at: Optional[float] = None) -> FetchResult:
+        """
+        Store a boulder just scraped from its route page, keyed by URL
+        
+        New URLs are inserted. For known URLs the fetch time is recorded and,
+        when the page content differs from the last fetch, the page fields
+        are updated and the change counted. Empty page fields keep the stored
+        value, and coordinates, rating, height and FA are left alone.
+        
+        Returns:
+            The status ('new', 'changed', 'unchanged', or 'baseline' for a
+            row stored before fetches were tracked) and the stored point
+        """
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+        content_hash = hashlib.sha1(
+            json.dumps([getattr(boulder, field) for field in PAGE_FIELDS]).encode('utf-8')
+        ).hexdigest()
+        
         conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        row = conn.execute(
+            'SELECT content_hash, holds, latitude, longitude FROM boulders WHERE url = ? ORDER BY id LIMIT 1',
+            (boulder.url,)
+        ).fetchone()
+        with timed('db.insert'), conn:
+            if row is None:
+                conn.execute('''
+                    INSERT INTO boulders (name, grade, location, latitude, longitude, 
+                                        approach_distance, route_type, holds, description, 
+                                        url, rating, height, fa, first_fetched, last_fetched,
+                                        content_hash, fetch_count)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+                ''', self._boulder_params(boulder) + (fetched_at, fetched_at, content_hash))
+                status = 'new'
+            elif row[0] == content_hash:
+                conn.execute('''
+                    UPDATE boulders SET last_fetched = ?, fetch_count = fetch_count + 1
+                    WHERE url = ?
+                ''', (fetched_at, boulder.url))
+                status = 'unchanged'
+            else:
+                status = 'changed' if row[0] is not None else 'baseline'
+                holds = merge_holds(json.loads(row[1]) if row[1] else [], boulder.holds)
+                conn.execute(f'''
+                    UPDATE boulders SET {', '.join(f"{field} = COALESCE(NULLIF(?, ''), {field})"
+                                                   for field in PAGE_FIELDS)},
+                                        holds = ?, content_hash = ?, last_fetched = ?,
+                                        first_fetched = COALESCE(first_fetched, ?),
+                                        fetch_count = fetch_count + 1,
+                                        change_count = change_count + ?
+                    WHERE url = ?
+                ''', tuple(getattr(boulder, field) for field in PAGE_FIELDS) + (
+                    json.dumps(holds), content_hash, fetched_at, fetched_at,
+                    int(status == 'changed'), boulder.url))
+        conn.close()
+        if row is None:
+            return FetchResult(status, boulder.latitude, boulder.longitude)
+        return FetchResult(status, row[2], row[3])
+    
+    def get_boulders_near_location(self, lat: float, lon: float, 
+                                 radius_miles: float = 50) -> List[BoulderRow]:
+        """Get boulders within radius of a location, nearest first"""
+        from geopy.distance import geodesic
         
-        cursor.execute('''
-            SELECT * FROM boulders 
-            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.execute(f'''
+            SELECT {', '.join(SCAN_COLUMNS)} FROM boulders 
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL AND duplicate_of IS NULL
         ''')
         
-        all_boulders = cursor.fetchall()
+        # Rows are streamed in chunks, so only rows inside the radius are
+        # kept; fetch and distance time are still reported as separate stages
+        lat_index, lon_index = _SCAN_INDEX['latitude'], _SCAN_INDEX['longitude']
+        user_location = (lat, lon)
         nearby_boulders = []
-        
-        for boulder in all_boulders:
-            boulder_location = (boulder[4], boulder[5])  # lat, lon
-            user_location = (lat, lon)
+        fetch_seconds = distance_seconds = 0.0
+        while True:
+            start = time.perf_counter()
+            rows = cursor.fetchmany(self.FETCH_CHUNK)
+            fetch_seconds += time.perf_counter() - start
+            if not rows:
+                break
             
-            distance = geodesic(user_location, boulder_location).miles
-            
-            if distance <= radius_miles:
-                boulder_dict = {
-                    'id': boulder[0], 'name': boulder[1], 'grade': boulder[2],
-                    'location': boulder[3], 'latitude': boulder[4], 'longitude': boulder[5],
-                    'approach_distance': boulder[6], 'route_type': boulder[7],
-                    'holds': json.loads(boulder[8]) if boulder[8] else [],
-                    'description': boulder[9], 'url': boulder[10], 'rating': boulder[11],
-                    'height': boulder[12], 'fa': boulder[13], 'distance': distance
-                }
-                nearby_boulders.append(boulder_dict)
+            start = time.perf_counter()
+            for row in rows:
+                distance = geodesic(user_location, (row[lat_index], row[lon_index])).miles
+                if distance <= radius_miles:
+                    nearby_boulders.append(BoulderRow(row, distance, self.db_path))
+            distance_seconds += time.perf_counter() - start
         
         conn.close()
-        return sorted(nearby_boulders, key=lambda x: x['distance'])
+        if REGISTRY.enabled:
+            REGISTRY.observe('db.fetch', fetch_seconds)
+            REGISTRY.observe('db.distance', distance_seconds)
+        nearby_boulders.sort(key=lambda boulder: boulder.distance)
+        return nearby_boulders
+
+def _mean(values: List[float]) -> float:
+    """Arithmetic mean, NaN for no values (as numpy.mean gives)"""
+    return sum(values) / len(values) if values else float('nan')
 
 class BoulderingRecommendationAgent:
     """AI agent for recommending bouldering routes"""
     
     def __init__(self, database: BoulderDatabase):
         self.db = database
-        self.grade_difficulty = {
-            'VB': 0, 'V0-': 1, 'V0': 2, 'V0+': 3, 'V1': 4, 'V2': 5,
-            'V3': 6, 'V4': 7, 'V5': 8, 'V6': 9, 'V7': 10, 'V8': 11,
-            'V9': 12, 'V10': 13, 'V11': 14, 'V12': 15, 'V13': 16, 'V14': 17
-        }
+        self.grade_difficulty = GRADE_DIFFICULTY
     
     def recommend_routes(self, user_location: Tuple[float, float],
                         preferred_grades: List[str] = None,
@@ -218,7 +374,8 @@ class BoulderingRecommendationAgent:
         
         Args:
             user_location: (latitude, longitude)
-            preferred_grades: List of grades like ['V3', 'V4', 'V5']
+            preferred_grades: List of grades like ['V3', 'V4', 'V5'], in any form
+                grades.parse_grade accepts
             preferred_holds: List of hold types like ['crimps', 'jugs', 'slopers']
             max_approach_distance: Maximum approach distance in miles
             search_radius: Search radius from user location in miles
@@ -230,34 +387,40 @@ class BoulderingRecommendationAgent:
             user_location[0], user_location[1], search_radius
         )
         
-        # Filter by approach distance
-        candidates = [b for b in candidates 
-                     if b['approach_distance'] <= max_approach_distance]
-        
-        # Apply strict grade filtering if preferred grades are specified
-        if preferred_grades:
-            candidates = [b for b in candidates if b['grade'] in preferred_grades]
-        
-        # Apply strict hold filtering if preferred holds are specified
-        if preferred_holds:
+        with timed('agent.filter'):
+            # Filter by approach distance
             candidates = [b for b in candidates 
-                        if all(hold in b['holds'] for hold in preferred_holds)]
-        
-        # Score remaining candidates
-        scored_routes = []
-        for boulder in candidates:
-            score = self._calculate_base_score(boulder)
-            boulder['recommendation_score'] = score
-            scored_routes.append(boulder)
+                         if b['approach_distance'] <= max_approach_distance]
+            
+            # Apply strict grade filtering if preferred grades are specified;
+            # both sides are compared as canonical grades, so "v4", "V4+" and
+            # "6B" all match V4, and unrecognized grades must match exactly
+            if preferred_grades:
+                wanted = set(preferred_grades) | set(canonical_grades(preferred_grades))
+                wanted.discard(None)
+                candidates = [b for b in candidates
+                              if b['grade'] in wanted or parse_grade(b['grade']) in wanted]
+            
+            # Apply strict hold filtering if preferred holds are specified
+            if preferred_holds:
+                candidates = [b for b in candidates 
+                            if all(hold in b['holds'] for hold in preferred_holds)]
         
-        # Sort by score and return top recommendations
-        recommendations = sorted(scored_routes, 
-                               key=lambda x: x['recommendation_score'], 
-                               reverse=True)[:limit]
+        with timed('agent.score'):
+            # Score remaining candidates; only the top ones become dicts
+            scored_routes = [(self._calculate_base_score(boulder), boulder) for boulder in candidates]
+            best = nlargest(limit, scored_routes, key=lambda scored: scored[0])
+            load_details(boulder for score, boulder in best)
+            
+            recommendations = []
+            for score, boulder in best:
+                route = boulder.to_dict() if isinstance(boulder, BoulderRow) else dict(boulder)
+                route['recommendation_score'] = score
+                recommendations.append(route)
         
         return recommendations
     
-    def _calculate_base_score(self, boulder: Dict) -> float:
+    def _calculate_base_score(self, boulder: BoulderRow) -> float:
         """Calculate base score for a boulder without grade/hold preferences"""
         score = 0.0
         
@@ -284,20 +447,21 @@ class BoulderingRecommendationAgent:
         if not boulders:
             return {"total_routes": 0}
         
-        grades = [b['grade'] for b in boulders if b['grade']]
-        grade_counts = {}
-        for grade in grades:
-            grade_counts[grade] = grade_counts.get(grade, 0) + 1
-        
-        avg_rating = np.mean([b['rating'] for b in boulders if b['rating']])
-        
-        return {
-            "total_routes": len(boulders),
-            "grade_distribution": grade_counts,
-            "average_rating": round(avg_rating, 2),
-            "average_approach": round(np.mean([b['approach_distance'] 
-                                            for b in boulders]), 2)
-        }
+        with timed('agent.statistics'):
+            grades = [b['grade'] for b in boulders if b['grade']]
+            grade_counts = {}
+            for grade in grades:
+                grade_counts[grade] = grade_counts.get(grade, 0) + 1
+            
+            avg_rating = _mean([b['rating'] for b in boulders if b['rating']])
+            
+            return {
+                "total_routes": len(boulders),
+                "grade_distribution": grade_counts,
+                "average_rating": round(avg_rating, 2),
+                "average_approach": round(_mean([b['approach_distance'] 
+                                              for b in boulders]), 2)
+            }
 
 # Example usage
 def main():
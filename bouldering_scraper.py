@@ -0,0 +1,70 @@
+import requests
+from bs4 import BeautifulSoup
+from typing import List
+import time
+from bouldering_agent import Boulder
+from grades import parse_grade
+
+class BoulderingScraper:
+    """Scraper for Mountain Project and TheCrag"""
+    
+    def __init__(self):
+        self.session = requests.Session()
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        })
+        
+    def scrape_mountain_project(self, area_url: str) -> List[Boulder]:
+        """Scrape boulder routes from Mountain Project"""
+        boulders = []
+        
+        # Note: Mountain Project has an API - recommend using that instead
+        # This is a simplified example of web scraping approach
+        try:
+            response = self.session.get(area_url)
+            soup = BeautifulSoup(response.content, 'html.parser')
+            
+            # Parse route information (structure varies by page)
+            route_elements = soup.find_all('div', class_='route-row')
+            
+            for route in route_elements:
+                try:
+                    name = route.find('a', class_='route-name').text.strip()
+                    grade = route.find('span', class_='grade').text.strip()
+                    
+                    # Extract additional details
+                    boulder = Boulder(
+                        name=name,
+                        grade=self._normalize_grade(grade),
+                        location="",  # Extract from page context
+                        latitude=0.0,  # Would need to extract coordinates
+                        longitude=0.0,
+                        approach_distance=0.0,
+                        route_type="boulder",
+                        holds=[],
+                        description="",
+                        url=area_url,
+                        rating=0.0
+                    )
+                    boulders.append(boulder)
+                    
+                except Exception as e:
+                    print(f"Error parsing route: {e}")
+                    
+            time.sleep(1)  # Be respectful with requests
+            
+        except Exception as e:
+            print(f"Error scraping {area_url}: {e}")
+            
+        return boulders
+    
+    def scrape_thecrag(self, area_url: str) -> List[Boulder]:
+        """Scrape boulder routes from TheCrag"""
+        # Similar implementation for TheCrag
+        # TheCrag also has API access which would be preferred
+        pass
+    
+    def _normalize_grade(self, grade: str) -> str:
+        """Normalize different grading systems to V-scale"""
+        # V, Font and range grades; anything else is kept as given
+        return parse_grade(grade) or grade
@@ -0,0 +1,201 @@
+import csv
+import json
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from bouldering_agent import Boulder, BoulderDatabase
+from dedup import duplicate_links
+from grades import parse_grade
+
+REQUIRED_FIELDS = ('name', 'grade', 'location', 'latitude', 'longitude')
+
+# Longest line accepted from an upload; longer lines are reported, not buffered
+MAX_LINE_BYTES = 1 << 20
+
+# A CSV field may be as long as a whole line (the csv default is 128 KiB)
+csv.field_size_limit(MAX_LINE_BYTES)
+
+def _optional_float(value) -> Optional[float]:
+    if value is None or value == '':
+        return None
+    return float(value)
+
+def _parse_holds(value) -> List[str]:
+    """Holds as a list, a JSON array string, or a comma/semicolon/pipe separated string"""
+    if not value:
+        return []
+    if isinstance(value, list):
+        return [str(hold).strip() for hold in value if str(hold).strip()]
+    value = str(value).strip()
+    if value.startswith('['):
+        return _parse_holds(json.loads(value))
+    for separator in ('|', ';'):
+        value = value.replace(separator, ',')
+    return [hold.strip() for hold in value.split(',') if hold.strip()]
+
+def boulder_from_record(data: Dict) -> Boulder:
+    """
+    Validate one submitted route into a Boulder
+
+    Raises:
+        ValueError: A required field is missing, a value is malformed or the
+            grade is not one grades.parse_grade recognizes
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Route must be an object')
+    missing = [field for field in REQUIRED_FIELDS if data.get(field) in (None, '')]
+    if missing:
+        raise ValueError(f"Missing required field(s): {', '.join(missing)}")
+
+    latitude = float(data['latitude'])
+    longitude = float(data['longitude'])
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise ValueError(f"Coordinates out of range: {latitude}, {longitude}")
+    grade = parse_grade(str(data['grade']))
+    if grade is None:
+        raise ValueError(f"Unrecognized grade: {data['grade']!r} (write V5 or Font 6B, not a bare number)")
+
+    return Boulder(
+        name=str(data['name']),
+        grade=grade,
+        location=str(data['location']),
+        latitude=latitude,
+        longitude=longitude,
+        approach_distance=_optional_float(data.get('approach_distance')) or 0.0,
+        route_type='boulder',
+        holds=_parse_holds(data.get('holds')),
+        description=data.get('description') or '',
+        url=data.get('url') or '',
+        rating=_optional_float(data.get('rating')) or 0.0,
+        height=_optional_float(data.get('height')) or None,
+        fa=data.get('fa') or ''
+    )
+
+def _lines(stream, max_line_bytes: int = MAX_LINE_BYTES) -> Iterator[bytes]:
+    """Read a binary stream line by line without buffering the whole body"""
+    while True:
+        line = stream.readline(max_line_bytes)
+        if not line:
+            return
+        yield line
+
+def _oversized(line: bytes) -> bool:
+    return not line.endswith(b'\n') and len(line) >= MAX_LINE_BYTES
+
+def _skip_rest(stream):
+    """Skip the rest of an oversized line"""
+    for rest in _lines(stream):
+        if rest.endswith(b'\n'):
+            break
+
+def iter_ndjson(stream) -> Iterator[Tuple[int, object]]:
+    """Yield (line number, record or exception) for each non-blank NDJSON line"""
+    for line_no, line in enumerate(_lines(stream), 1):
+        if not line.strip():
+            continue
+        if _oversized(line):
+            yield line_no, ValueError(f"Line longer than {MAX_LINE_BYTES} bytes")
+            _skip_rest(stream)
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError as e:
+            yield line_no, ValueError(f"Invalid JSON: {e}")
+
+def iter_csv(stream) -> Iterator[Tuple[int, object]]:
+    """
+    Yield (line number, record or exception) for each CSV data row
+
+    The first row is the header. A line that is not UTF-8 or is longer than
+    MAX_LINE_BYTES fails on its own and is left out of the parsed rows, as
+    does a row the csv module cannot parse (e.g. an unclosed quote running
+    past the field size limit).
+    """
+    failures: List[Tuple[int, Exception]] = []
+
+    def text_lines() -> Iterator[str]:
+        for line_no, line in enumerate(_lines(stream), 1):
+            if _oversized(line):
+                failures.append((line_no, ValueError(f"Line longer than {MAX_LINE_BYTES} bytes")))
+                _skip_rest(stream)
+                yield '\n'  # A blank line, which the reader skips
+                continue
+            try:
+                yield line.decode('utf-8', errors='strict')
+            except UnicodeDecodeError as e:
+                failures.append((line_no, ValueError(f"Invalid UTF-8: {e}")))
+                yield '\n'
+
+    reader = csv.DictReader(text_lines())
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            break
+        except csv.Error as e:
+            # line_num has not yet counted the line that failed
+            row = ValueError(f"Invalid CSV: {e}")
+            row_no = reader.line_num + 1
+        else:
+            row_no = reader.line_num
+        # Failed lines come before the row the reader just finished
+        yield from failures
+        failures.clear()
+        yield row_no, row
+    yield from failures
+
+def import_records(db: BoulderDatabase, records: Iterable[Tuple[int, object]],
+                   batch_size: int = 500, max_errors: int = 100,
+                   on_batch: Optional[Callable[[List[Boulder]], None]] = None,
+                   link_duplicates: bool = True) -> Dict:
+    """
+    Validate records and insert them in batched transactions
+
+    Only one batch and at most `max_errors` error entries are held at a
+    time, so memory stays flat however long the upload is.
+
+    Args:
+        db: Database to insert into
+        records: (row number, record dict or exception) pairs
+        batch_size: Rows per insert transaction
+        max_errors: Error entries to report in full; later ones are only counted
+        on_batch: Called with each batch after it is committed
+        link_duplicates: Insert rows that duplicate a stored problem linked to it
+
+    Returns:
+        Counts of imported, duplicate and failed rows plus the per-row error report
+    """
+    imported = duplicates = failed = 0
+    errors = []
+    batch: List[Boulder] = []
+
+    def flush():
+        nonlocal imported, duplicates, batch
+        if batch:
+            links = duplicate_links(db.db_path, batch) if link_duplicates else None
+            imported += db.add_boulders(batch, links)
+            duplicates += sum(link is not None for link in links or ())
+            if on_batch:
+                on_batch(batch)
+            batch = []
+
+    for row_no, record in records:
+        try:
+            if isinstance(record, Exception):
+                raise record
+            batch.append(boulder_from_record(record))
+        except (ValueError, TypeError) as e:
+            failed += 1
+            if len(errors) < max_errors:
+                errors.append({'row': row_no, 'error': str(e)})
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    return {
+        'imported': imported,
+        'duplicates': duplicates,
+        'failed': failed,
+        'errors': errors,
+        'errors_truncated': failed > len(errors)
+    }
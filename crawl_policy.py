@@ -0,0 +1,242 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying; anything else non-2xx is treated as final
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class CrawlStats:
+    """Thread-safe counters describing how a crawl went"""
+
+    FIELDS = ('pages_fetched', 'retries', 'backoffs', 'backoff_seconds',
+              'throttled', 'breaker_trips', 'failures')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {field: 0 for field in self.FIELDS}
+
+    def incr(self, field: str, amount: float = 1):
+        with self._lock:
+            self._counts[field] += amount
+
+    def record_backoff(self, seconds: float):
+        """Count one backoff pause and the time spent in it"""
+        with self._lock:
+            self._counts['backoffs'] += 1
+            self._counts['backoff_seconds'] += seconds
+
+    def as_dict(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._counts)
+        stats['backoff_seconds'] = round(stats['backoff_seconds'], 2)
+        return stats
+
+class RetryPolicy:
+    """Exponential backoff with jitter that honours Retry-After"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 2.0,
+                 max_delay: float = 600.0, jitter: float = 0.5):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retry number `attempt` (0-based)"""
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return delay * random.uniform(1.0 - self.jitter, 1.0)
+
+    def retry_after(self, response: requests.Response) -> Optional[float]:
+        """Parse a Retry-After header given in seconds or as an HTTP date"""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            seconds = float(value)
+        else:
+            try:
+                when = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            if when.tzinfo is None:
+                when = when.replace(tzinfo=timezone.utc)
+            seconds = (when - datetime.now(timezone.utc)).total_seconds()
+        return min(self.max_delay, max(0.0, seconds))
+
+class HostCircuitBreaker:
+    """Per-host circuit breaker shared by every fetcher in the process
+
+    A throttle response opens the breaker for the Retry-After period (or the
+    backoff delay), and repeated failures open it for a cooldown. While it is
+    open every worker hitting that host waits, instead of each one retrying
+    on its own.
+    """
+
+    _registry: Dict[str, 'HostCircuitBreaker'] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, host: str, failure_threshold: int = 5, cooldown: float = 60.0):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._open_until = 0.0
+        self._consecutive_failures = 0
+
+    @classmethod
+    def for_host(cls, host: str) -> 'HostCircuitBreaker':
+        """Return the shared breaker for a host, creating it on first use"""
+        with cls._registry_lock:
+            breaker = cls._registry.get(host)
+            if breaker is None:
+                breaker = cls._registry[host] = cls(host)
+            return breaker
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return time.monotonic() < self._open_until
+
+    def wait(self) -> float:
+        """Block while the breaker is open; return the seconds waited"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                remaining = self._open_until - time.monotonic()
+            if remaining <= 0:
+                return waited
+            time.sleep(remaining)
+            waited += remaining
+
+    def trip(self, seconds: float):
+        """Open the breaker for at least `seconds`"""
+        with self._lock:
+            self._open_until = max(self._open_until, time.monotonic() + seconds)
+        logger.warning(f"Circuit breaker open for {self.host} ({seconds:.1f}s)")
+
+    def record_failure(self) -> bool:
+        """Count a failure; return True if it tripped the breaker"""
+        with self._lock:
+            self._consecutive_failures += 1
+            tripped = self._consecutive_failures >= self.failure_threshold
+            if tripped:
+                self._consecutive_failures = 0
+        if tripped:
+            self.trip(self.cooldown)
+        return tripped
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+
+class RateLimiter:
+    """Per-host minimum interval between requests, shared by threads in a process
+
+    Same interface as crawl_queue.SharedRateLimiter, which coordinates the
+    limit across processes instead.
+    """
+
+    def __init__(self, min_interval: float = 1.0):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_slot: Dict[str, float] = {}
+
+    def wait(self, url: str) -> float:
+        """Sleep until this caller's reserved slot; return the seconds waited"""
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def throttle(self, url: str, seconds: float):
+        """Push the next slot for a host at least `seconds` out"""
+        host = urlparse(url).netloc
+        with self._lock:
+            until = time.monotonic() + seconds
+            self._next_slot[host] = max(self._next_slot.get(host, until), until)
+
+def fetch_with_policy(session: requests.Session, url: str, policy: RetryPolicy,
+                      stats: CrawlStats, timeout: float = 30,
+                      rate_limiter=None) -> Optional[requests.Response]:
+    """
+    GET a URL, retrying throttled and transient failures
+
+    Args:
+        session: Session to issue the request with
+        url: URL to fetch
+        policy: Retry and backoff policy
+        stats: Counters to record fetches, retries and backoffs into
+        timeout: Per-request timeout in seconds
+        rate_limiter: Optional limiter with wait(url) and throttle(url, seconds),
+            consulted before every attempt and told about throttle responses
+
+    Returns:
+        The successful response, or None once retries are exhausted or the
+        server answers with a non-retryable status
+    """
+    breaker = HostCircuitBreaker.for_host(urlparse(url).netloc)
+
+    for attempt in range(policy.max_attempts):
+        waited = breaker.wait()
+        if waited:
+            stats.record_backoff(waited)
+        if rate_limiter is not None:
+            rate_limiter.wait(url)
+
+        delay = None
+        try:
+            response = session.get(url, timeout=timeout)
+        except requests.RequestException as e:
+            logger.error(f"Error fetching {url}: {str(e)}")
+        else:
+            if response.ok:
+                breaker.record_success()
+                stats.incr('pages_fetched')
+                return response
+            if response.status_code not in RETRY_STATUSES:
+                logger.warning(f"Got status code {response.status_code} for {url}")
+                stats.incr('failures')
+                return None
+
+            retry_after = policy.retry_after(response)
+            if response.status_code == 429 or retry_after is not None:
+                # Throttled: pause every worker on this host, not just this one
+                logger.warning(f"Rate limited on {url} (status {response.status_code})")
+                stats.incr('throttled')
+                stats.incr('breaker_trips')
+                delay = retry_after if retry_after is not None else policy.backoff(attempt)
+                breaker.trip(delay)
+                if rate_limiter is not None:
+                    rate_limiter.throttle(url, delay)
+            else:
+                logger.warning(f"Got status code {response.status_code} for {url}")
+
+        if attempt == policy.max_attempts - 1:
+            break
+        stats.incr('retries')
+        if delay is None:
+            if breaker.record_failure():
+                stats.incr('breaker_trips')
+            else:
+                delay = policy.backoff(attempt)
+                logger.info(f"Retrying {url} in {delay:.2f} seconds...")
+                time.sleep(delay)
+                stats.record_backoff(delay)
+
+    stats.incr('failures')
+    return None
@@ -0,0 +1,352 @@
+import hashlib
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# Job kinds understood by crawl_worker
+AREA = 'area'    # An area page: discover sub-areas and route links
+ROUTE = 'route'  # A route page: parse and insert the boulder
+
+# Jobs columns added after the original schema, migrated by init_database
+JOB_ADDED_COLUMNS = (
+    ('not_before', 'REAL'),  # A failed job is not leased again before this time
+)
+
+# Delay before the first retry of a failed job, doubled on each later attempt
+RETRY_BACKOFF_SECONDS = 60.0
+
+# Columns recording when an area page was last fetched and whether it changed
+AREA_FETCH_COLUMNS = (
+    ('first_fetched', 'REAL'),
+    ('last_fetched', 'REAL'),
+    ('content_hash', 'TEXT'),
+    ('fetch_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ('change_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ('route_count', 'INTEGER NOT NULL DEFAULT 0'),
+)
+
+@dataclass
+class CrawlJob:
+    """A leased unit of crawl work"""
+    id: int
+    url: str
+    kind: str
+    attempts: int
+
+class CrawlQueue:
+    """Crawl job queue shared by worker processes through a local SQLite file
+
+    Jobs are leased rather than popped: a worker that dies simply stops
+    heartbeating, its lease expires and another worker picks the job up.
+    The same file coordinates a global per-host request rate so that adding
+    workers adds parsing capacity without adding load on the site.
+    """
+
+    def __init__(self, path: str = "crawl_queue.db", max_attempts: int = 3):
+        self.path = path
+        self.max_attempts = max_attempts
+        # Autocommit mode so write transactions can be opened with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self.init_database()
+
+    def init_database(self):
+        """Initialize the queue schema"""
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',  -- pending, leased, done, failed
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                heartbeat_at REAL,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, lease_expires);
+
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                host TEXT PRIMARY KEY,
+                next_slot REAL NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS areas (
+                url TEXT PRIMARY KEY,
+                name TEXT NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS refresh_budget (
+                day TEXT PRIMARY KEY,  -- UTC date
+                scheduled INTEGER NOT NULL
+            );
+        ''')
+        # Columns added to queues created before they existed
+        for table, columns in (('jobs', JOB_ADDED_COLUMNS), ('areas', AREA_FETCH_COLUMNS)):
+            existing = {row[1] for row in self._conn.execute(f'PRAGMA table_info({table})')}
+            for column, definition in columns:
+                if column not in existing:
+                    self._conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+    @contextmanager
+    def _transaction(self):
+        """Run a block inside a write-locked transaction"""
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield self._conn
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        else:
+            self._conn.execute('COMMIT')
+
+    def enqueue(self, url: str, kind: str) -> bool:
+        """Add a job unless the URL was ever queued; return True if it was added"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO jobs (url, kind) VALUES (?, ?)', (url, kind)
+            )
+        return cursor.rowcount > 0
+
+    def enqueue_many(self, urls: List[str], kind: str) -> int:
+        """Add several jobs in one transaction; return how many were new"""
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT OR IGNORE INTO jobs (url, kind) VALUES (?, ?)',
+                [(url, kind) for url in urls]
+            )
+            return conn.total_changes - before
+
+    def lease(self, worker_id: str, lease_seconds: float = 300) -> Optional[CrawlJob]:
+        """Claim the oldest available job, including ones whose lease expired
+
+        Failed jobs waiting out their retry backoff are skipped.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            # Jobs abandoned by a dead worker on their final attempt are given up on
+            conn.execute('''
+                UPDATE jobs SET status = 'failed', last_error = 'lease expired',
+                                lease_owner = NULL, lease_expires = NULL
+                WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?
+            ''', (now, self.max_attempts))
+
+            row = conn.execute('''
+                SELECT id, url, kind, attempts FROM jobs
+                WHERE (status = 'pending' AND (not_before IS NULL OR not_before <= ?))
+                   OR (status = 'leased' AND lease_expires < ?)
+                ORDER BY id
+                LIMIT 1
+            ''', (now, now)).fetchone()
+            if row is None:
+                return None
+
+            conn.execute('''
+                UPDATE jobs SET status = 'leased', attempts = attempts + 1,
+                                lease_owner = ?, lease_expires = ?, heartbeat_at = ?
+                WHERE id = ?
+            ''', (worker_id, now + lease_seconds, now, row[0]))
+
+        return CrawlJob(id=row[0], url=row[1], kind=row[2], attempts=row[3] + 1)
+
+    def heartbeat(self, job: CrawlJob, worker_id: str, lease_seconds: float = 300) -> bool:
+        """Extend a lease; return False if the job is no longer ours"""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute('''
+                UPDATE jobs SET lease_expires = ?, heartbeat_at = ?
+                WHERE id = ? AND status = 'leased' AND lease_owner = ?
+            ''', (now + lease_seconds, now, job.id, worker_id))
+        return cursor.rowcount > 0
+
+    def complete(self, job: CrawlJob, worker_id: str):
+        """Mark a leased job as done"""
+        with self._transaction() as conn:
+            conn.execute('''
+                UPDATE jobs SET status = 'done', lease_owner = NULL, lease_expires = NULL
+                WHERE id = ? AND lease_owner = ?
+            ''', (job.id, worker_id))
+
+    def fail(self, job: CrawlJob, worker_id: str, error: str):
+        """
+        Return a job to the queue after a backoff, or give up once it is out of attempts
+
+        The backoff is RETRY_BACKOFF_SECONDS, doubled for every earlier
+        attempt, so a persistently failing URL does not spin.
+        """
+        status = 'failed' if job.attempts >= self.max_attempts else 'pending'
+        not_before = time.time() + RETRY_BACKOFF_SECONDS * 2 ** (job.attempts - 1)
+        with self._transaction() as conn:
+            conn.execute('''
+                UPDATE jobs SET status = ?, last_error = ?, lease_owner = NULL, lease_expires = NULL,
+                                not_before = ?
+                WHERE id = ? AND lease_owner = ?
+            ''', (status, error, not_before, job.id, worker_id))
+
+    def has_unfinished(self) -> bool:
+        """True while any job is pending or leased"""
+        row = self._conn.execute(
+            "SELECT 1 FROM jobs WHERE status IN ('pending', 'leased') LIMIT 1"
+        ).fetchone()
+        return row is not None
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        rows = self._conn.execute(
+            'SELECT status, COUNT(*) FROM jobs GROUP BY status'
+        ).fetchall()
+        return dict(rows)
+
+    def add_area(self, name: str, url: str):
+        """Record a discovered bouldering area"""
+        with self._transaction() as conn:
+            conn.execute('''
+                INSERT INTO areas (url, name) VALUES (?, ?)
+                ON CONFLICT(url) DO UPDATE SET name = excluded.name
+            ''', (url, name))
+
+    def record_area_fetch(self, name: str, url: str, sub_areas: Iterable[str],
+                          route_links: Iterable[str], fetched_at: Optional[float] = None) -> str:
+        """
+        Record a fetch of a bouldering area page
+
+        The page's content is its sub-area and route links, so a new problem
+        or sub-area counts as a change.
+
+        Returns:
+            'new', 'changed' or 'unchanged'
+        """
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+        route_links = sorted(set(route_links))
+        content_hash = hashlib.sha1(
+            json.dumps([sorted(set(sub_areas)), route_links]).encode('utf-8')
+        ).hexdigest()
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT content_hash FROM areas WHERE url = ?', (url,)
+            ).fetchone()
+            previous = row[0] if row else None
+            changed = previous is not None and previous != content_hash
+            conn.execute('''
+                INSERT INTO areas (url, name, first_fetched, last_fetched, content_hash,
+                                   fetch_count, route_count)
+                VALUES (?, ?, ?, ?, ?, 1, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    name = excluded.name,
+                    first_fetched = COALESCE(first_fetched, excluded.first_fetched),
+                    last_fetched = excluded.last_fetched,
+                    content_hash = excluded.content_hash,
+                    fetch_count = fetch_count + 1,
+                    change_count = change_count + ?,
+                    route_count = excluded.route_count
+            ''', (url, name, fetched_at, fetched_at, content_hash, len(route_links), int(changed)))
+        if previous is None:
+            return 'new'
+        return 'changed' if changed else 'unchanged'
+
+    def area_fetch_stats(self) -> List[Tuple]:
+        """(url, route_count, first_fetched, last_fetched, change_count) for every area"""
+        return self._conn.execute('''
+            SELECT url, route_count, first_fetched, last_fetched, change_count FROM areas
+        ''').fetchall()
+
+    def active_urls(self) -> set:
+        """URLs of jobs that are pending or leased"""
+        rows = self._conn.execute(
+            "SELECT url FROM jobs WHERE status IN ('pending', 'leased')"
+        ).fetchall()
+        return {url for url, in rows}
+
+    def refresh_scheduled(self, day: str) -> int:
+        """Refetches already scheduled on a UTC day"""
+        row = self._conn.execute(
+            'SELECT scheduled FROM refresh_budget WHERE day = ?', (day,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def schedule_refresh(self, jobs: List[Tuple[str, str]], day: str, budget: int) -> int:
+        """
+        Queue (url, kind) jobs for refetching, within a daily budget
+
+        Finished and failed jobs go back to pending with their attempts
+        reset; URLs never queued are added. Jobs beyond what is left of the
+        day's budget, or already pending or leased, are skipped.
+
+        Returns:
+            The number of jobs queued
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT scheduled FROM refresh_budget WHERE day = ?', (day,)
+            ).fetchone()
+            remaining = budget - (row[0] if row else 0)
+            before = conn.total_changes
+            for url, kind in jobs[:max(remaining, 0)]:
+                conn.execute('''
+                    INSERT INTO jobs (url, kind) VALUES (?, ?)
+                    ON CONFLICT(url) DO UPDATE SET
+                        status = 'pending', attempts = 0, last_error = NULL, not_before = NULL
+                    WHERE status IN ('done', 'failed')
+                ''', (url, kind))
+            queued = conn.total_changes - before
+            conn.execute('''
+                INSERT INTO refresh_budget (day, scheduled) VALUES (?, ?)
+                ON CONFLICT(day) DO UPDATE SET scheduled = scheduled + excluded.scheduled
+            ''', (day, queued))
+        return queued
+
+    def areas(self) -> List[Dict]:
+        """All discovered bouldering areas, in the format AreaDiscovery saves"""
+        rows = self._conn.execute('SELECT name, url FROM areas ORDER BY name').fetchall()
+        return [{'name': name, 'url': url} for name, url in rows]
+
+    def reserve_slot(self, host: str, min_interval: float) -> float:
+        """Reserve the next request slot for a host; return seconds to wait for it"""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT next_slot FROM rate_limits WHERE host = ?', (host,)
+            ).fetchone()
+            slot = max(now, row[0]) if row else now
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_limits (host, next_slot) VALUES (?, ?)',
+                (host, slot + min_interval)
+            )
+        return slot - now
+
+    def throttle(self, host: str, seconds: float):
+        """Push every worker's next slot for a host at least `seconds` out"""
+        until = time.time() + seconds
+        with self._transaction() as conn:
+            conn.execute('''
+                INSERT INTO rate_limits (host, next_slot) VALUES (?, ?)
+                ON CONFLICT(host) DO UPDATE SET next_slot = MAX(next_slot, excluded.next_slot)
+            ''', (host, until))
+
+    def close(self):
+        self._conn.close()
+
+class SharedRateLimiter:
+    """Global per-host rate limit coordinated through a CrawlQueue file"""
+
+    def __init__(self, queue: CrawlQueue, min_interval: float = 5.0):
+        self.queue = queue
+        self.min_interval = min_interval
+
+    def wait(self, url: str) -> float:
+        """Sleep until this process's reserved slot; return the seconds waited"""
+        delay = self.queue.reserve_slot(urlparse(url).netloc, self.min_interval)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def throttle(self, url: str, seconds: float):
+        self.queue.throttle(urlparse(url).netloc, seconds)
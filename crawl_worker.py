@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""Crawl worker processes fed from a shared SQLite job queue
+
+Seed the queue, then start as many workers as you like on one machine:
+
+    python -m crawl_worker seed https://www.mountainproject.com/route-guide
+    python -m crawl_worker work --processes 4
+    python -m crawl_worker status
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from bouldering_agent import BoulderDatabase
+from crawl_queue import AREA, ROUTE, CrawlJob, CrawlQueue, SharedRateLimiter
+from map_tiles import invalidate_cached_tiles
+from mp_area_discovery import AreaDiscovery
+from mp_scraper import MountainProjectScraper
+
+logger = logging.getLogger(__name__)
+
+class Heartbeat:
+    """Keeps the lease of a worker's current job alive from a background thread
+
+    One thread and one queue connection serve every job the worker runs.
+    """
+
+    def __init__(self, queue_path: str, worker_id: str, lease_seconds: float):
+        self.queue_path = queue_path
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self._job: Optional[CrawlJob] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        # SQLite connections are per-thread, so the heartbeat gets its own
+        queue = CrawlQueue(self.queue_path)
+        try:
+            while not self._stop.wait(self.lease_seconds / 3):
+                # Held across the update so holding() cannot release the job,
+                # and the caller complete it, while a heartbeat is in flight
+                with self._lock:
+                    job = self._job
+                    if job is not None and not queue.heartbeat(job, self.worker_id, self.lease_seconds):
+                        logger.warning(f"Lost lease on {job.url}")
+                        self._job = None
+        finally:
+            queue.close()
+
+    @contextmanager
+    def holding(self, job: CrawlJob):
+        """
+        Keep `job`'s lease alive for the duration of a block
+
+        Complete or fail the job after the block, so no heartbeat races it.
+        """
+        with self._lock:
+            self._job = job
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._job = None
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+class CrawlWorker:
+    """Leases jobs from the queue and runs them through the scrapers"""
+
+    def __init__(self, queue_path: str, db_path: str, worker_id: str,
+                 min_interval: float = 5.0, lease_seconds: float = 300):
+        self.queue_path = queue_path
+        self.queue = CrawlQueue(queue_path)
+        self.db = BoulderDatabase(db_path)
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+
+        # Each worker has its own sessions; the rate limit is shared through the queue
+        limiter = SharedRateLimiter(self.queue, min_interval)
+        self.discoverer = AreaDiscovery(rate_limiter=limiter)
+        self.scraper = MountainProjectScraper(rate_limiter=limiter)
+
+    def run(self, poll_interval: float = 5.0) -> int:
+        """Work until the queue is drained; return the number of jobs completed"""
+        completed = 0
+        with Heartbeat(self.queue_path, self.worker_id, self.lease_seconds) as heartbeat:
+            while True:
+                job = self.queue.lease(self.worker_id, self.lease_seconds)
+                if job is None:
+                    # Other workers may still add jobs from pages they hold,
+                    # and failed jobs come back once their backoff ends
+                    if not self.queue.has_unfinished():
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                try:
+                    with heartbeat.holding(job):
+                        self.process(job)
+                except Exception as e:
+                    logger.error(f"Job {job.url} failed (attempt {job.attempts}): {e}")
+                    self.queue.fail(job, self.worker_id, str(e))
+                else:
+                    self.queue.complete(job, self.worker_id)
+                    completed += 1
+
+        stats = self.scraper.stats.as_dict()
+        for field, value in self.discoverer.stats.as_dict().items():
+            stats[field] += value
+        logger.info(f"Worker {self.worker_id} done: {completed} jobs, crawl stats: {stats}")
+        return completed
+
+    def process(self, job: CrawlJob):
+        """Run one job; raise to have it retried"""
+        if job.kind == AREA:
+            self._process_area(job.url)
+        elif job.kind == ROUTE:
+            self._process_route(job.url)
+        else:
+            raise ValueError(f"Unknown job kind: {job.kind}")
+
+    def _process_area(self, url: str):
+        soup = self.scraper._get_page(url)
+        if soup is None:
+            raise RuntimeError(f"Could not fetch {url}")
+
+        area, sub_areas = self.discoverer._analyze_page(url, soup)
+        self.queue.enqueue_many(sorted(sub_areas), AREA)
+        if area:
+            route_links = self.scraper._get_route_links(soup)
+            status = self.queue.record_area_fetch(area['name'], area['url'], sub_areas, route_links)
+            # Only links never queued are added, so a refetch queues just new problems
+            added = self.queue.enqueue_many(route_links, ROUTE)
+            logger.info(f"Area {area['name']} {status}: {added} new routes")
+
+    def _process_route(self, url: str):
+        soup = self.scraper._get_page(url)
+        if soup is None:
+            raise RuntimeError(f"Could not fetch {url}")
+
+        mp_data = self.scraper._parse_boulder_soup(url, soup)
+        if mp_data:
+            boulder = self.scraper.convert_to_boulder(mp_data)
+            status, latitude, longitude = self.db.record_fetch(boulder)
+            if status != 'unchanged':
+                invalidate_cached_tiles(self.db.db_path, [(latitude, longitude)])
+            logger.info(f"{boulder.name} ({boulder.grade}): {status}")
+
+def run_worker(queue_path: str, db_path: str, min_interval: float, lease_seconds: float):
+    """Entry point for one worker process"""
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    worker = CrawlWorker(queue_path, db_path, worker_id, min_interval, lease_seconds)
+    try:
+        worker.run()
+    finally:
+        worker.queue.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed Mountain Project crawl workers")
+    parser.add_argument('--queue', default='crawl_queue.db', help='Shared job queue database')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    seed = subparsers.add_parser('seed', help='Add start URLs to the queue')
+    seed.add_argument('urls', nargs='+')
+    seed.add_argument('--kind', choices=[AREA, ROUTE], default=AREA)
+
+    work = subparsers.add_parser('work', help='Run worker processes until the queue is drained')
+    work.add_argument('--db', default='boulders.db', help='Boulder database to insert into')
+    work.add_argument('--processes', type=int, default=1)
+    work.add_argument('--min-interval', type=float, default=5.0,
+                      help='Minimum seconds between requests to a host, across all workers')
+    work.add_argument('--lease-seconds', type=float, default=300)
+
+    status = subparsers.add_parser('status', help='Show job counts')
+    status.add_argument('--export-areas', metavar='FILE',
+                        help='Write discovered bouldering areas to a JSON file')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'seed':
+        queue = CrawlQueue(args.queue)
+        added = queue.enqueue_many(args.urls, args.kind)
+        queue.close()
+        print(f"Queued {added} new {args.kind} jobs")
+    elif args.command == 'work':
+        worker_args = (args.queue, args.db, args.min_interval, args.lease_seconds)
+        if args.processes == 1:
+            run_worker(*worker_args)
+        else:
+            processes = [multiprocessing.Process(target=run_worker, args=worker_args)
+                         for _ in range(args.processes)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+    elif args.command == 'status':
+        queue = CrawlQueue(args.queue)
+        print(json.dumps(queue.counts(), indent=2))
+        if args.export_areas:
+            with open(args.export_areas, 'w') as f:
+                json.dump(queue.areas(), f, indent=2)
+            print(f"Saved {len(queue.areas())} areas to {args.export_areas}")
+        queue.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""Find problems stored more than once under slightly different names
+
+The scraper, the API client and /api/add_route can each store the same
+problem with a slightly different name ("The Mandala" / "Mandala") and
+coordinates a few metres apart. Two rows are duplicates when they are within
+MATCH_METERS of each other, their normalized names are similar and their
+grades are at most MAX_GRADE_GAP apart.
+
+Rows are bucketed into a grid of cells MATCH_METERS wide and each row is
+compared only with rows in its own and the eight neighbouring cells, so the
+bulk job is a single pass over the table in latitude order, keeping just
+three rows of cells in memory:
+
+    python -m dedup link --db boulders.db --dry-run   # show what would be linked
+    python -m dedup link --db boulders.db             # link duplicates
+    python -m dedup merge --db boulders.db            # fold linked rows into their canonical row
+
+Linking sets duplicate_of on the newer row to the id of the oldest matching
+row, which hides it from recommendations, tiles, autocomplete and exports
+while keeping it on disk. Merging copies anything the canonical row lacks
+(description, holds, rating, ...) from its duplicates and deletes them.
+
+After link or merge, the affected map tiles are invalidated and problem
+suggestions in autocomplete are filtered at query time. Artifacts built
+earlier still hold the old rows: pass --export to re-export a Parquet
+dataset in full and --publish-snapshot to publish a fresh snapshot. The
+autocomplete area counts are corrected when the web workers restart.
+
+New rows are checked on insert as well, against the same neighbourhood of
+the stored rows (duplicate_links), and inserted already linked.
+"""
+import argparse
+import difflib
+import json
+import logging
+import math
+import re
+import sqlite3
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from autocomplete import normalize_name
+from bouldering_agent import Boulder, BoulderDatabase
+from grades import grade_ordinal
+from hold_extractor import merge_holds
+
+logger = logging.getLogger(__name__)
+
+# Furthest apart two entries of the same problem are expected to be
+MATCH_METERS = 100.0
+
+# Normalized-name similarity (difflib ratio) needed for a match
+MIN_NAME_SIMILARITY = 0.85
+
+# Largest grade difference between entries of the same problem (V0 / V0+)
+MAX_GRADE_GAP = 1
+
+METERS_PER_DEGREE = 111320.0
+CELL_DEGREES = MATCH_METERS / METERS_PER_DEGREE
+
+_LEADING_ARTICLE = re.compile(r'^(?:the|a|an|le|la|les) ')
+_NUMBER = re.compile(r'\d+')
+
+class Problem(NamedTuple):
+    """The fields of a row that decide whether it duplicates another"""
+    id: int
+    latitude: float
+    longitude: float
+    name: str                # match_name() of the name
+    grade: Union[int, str]   # grade_key() of the grade
+    numbers: Tuple[str, ...]  # Numbers in the name
+
+def match_name(name: Optional[str]) -> str:
+    """Name normalized for comparison, without a leading article"""
+    return _LEADING_ARTICLE.sub('', normalize_name(name or ''))
+
+def grade_key(grade: Optional[str]):
+    """Ordinal of a recognized grade, otherwise the cleaned-up grade text"""
+    ordinal = grade_ordinal(grade)
+    return ordinal if ordinal >= 0 else (grade or '').strip().upper()
+
+def _problem(row_id: int, latitude: float, longitude: float, name: str, grade: str) -> Problem:
+    name = match_name(name)
+    return Problem(row_id, latitude, longitude, name, grade_key(grade), tuple(_NUMBER.findall(name)))
+
+def _meters(a: Problem, b: Problem) -> float:
+    # Equirectangular approximation; exact enough at MATCH_METERS
+    x = (b.longitude - a.longitude) * math.cos(math.radians(a.latitude))
+    return METERS_PER_DEGREE * math.hypot(x, b.latitude - a.latitude)
+
+def _names_match(a: Problem, b: Problem) -> bool:
+    # "Problem 3" and "Problem 4" are different problems
+    return a.numbers == b.numbers and _similar(a.name, b.name)
+
+def _similar(a: str, b: str) -> bool:
+    if a == b:
+        return bool(a)
+    matcher = difflib.SequenceMatcher(None, a, b)
+    return (matcher.real_quick_ratio() >= MIN_NAME_SIMILARITY and
+            matcher.quick_ratio() >= MIN_NAME_SIMILARITY and
+            matcher.ratio() >= MIN_NAME_SIMILARITY)
+
+def _grades_match(a, b) -> bool:
+    if isinstance(a, int) and isinstance(b, int):
+        return abs(a - b) <= MAX_GRADE_GAP
+    return a == b
+
+def _grade_neighbours(grade) -> Tuple:
+    if isinstance(grade, int):
+        return tuple(range(grade - MAX_GRADE_GAP, grade + MAX_GRADE_GAP + 1))
+    return (grade,)
+
+def is_duplicate(a: Problem, b: Problem) -> bool:
+    """True if two rows describe the same problem"""
+    return (_grades_match(a.grade, b.grade) and _meters(a, b) <= MATCH_METERS
+            and _names_match(a, b))
+
+def _has_coordinates(latitude: Optional[float], longitude: Optional[float]) -> bool:
+    # Scraped routes are stored at 0, 0 until they are geocoded
+    return latitude is not None and longitude is not None and (latitude, longitude) != (0.0, 0.0)
+
+class ProblemGrid:
+    """Canonical problems bucketed by grid cell
+
+    Cells are CELL_DEGREES tall; their width in longitude grows with
+    latitude so every cell is about MATCH_METERS wide. A match is always in
+    the same or a neighbouring cell. Each cell is further split by grade so
+    only problems of a matching grade are compared at all.
+    """
+
+    def __init__(self):
+        # row -> column -> grade key -> problems
+        self._rows: Dict[int, Dict[int, Dict[object, List[Problem]]]] = {}
+
+    @staticmethod
+    def _row(latitude: float) -> int:
+        return math.floor(latitude / CELL_DEGREES)
+
+    @staticmethod
+    def _column(longitude: float, row: int) -> int:
+        scale = max(math.cos(math.radians((row + 0.5) * CELL_DEGREES)), 1e-6)
+        return math.floor(longitude * scale / CELL_DEGREES)
+
+    def matches(self, problem: Problem) -> List[Problem]:
+        """Problems in the grid that problem duplicates"""
+        found = []
+        grades = _grade_neighbours(problem.grade)
+        # _meters with its invariants hoisted: this loop is the bulk job's hot path
+        latitude, longitude, numbers = problem.latitude, problem.longitude, problem.numbers
+        lon_scale = math.cos(math.radians(latitude))
+        max_degrees = (MATCH_METERS / METERS_PER_DEGREE) ** 2
+        row = self._row(latitude)
+        for r in (row - 1, row, row + 1):
+            cells = self._rows.get(r)
+            if not cells:
+                continue
+            column = self._column(longitude, r)
+            for c in (column - 1, column, column + 1):
+                cell = cells.get(c)
+                if not cell:
+                    continue
+                for grade in grades:
+                    for other in cell.get(grade, ()):
+                        if other.numbers != numbers:
+                            continue
+                        dy = other.latitude - latitude
+                        dx = (other.longitude - longitude) * lon_scale
+                        if dx * dx + dy * dy <= max_degrees and _similar(problem.name, other.name):
+                            found.append(other)
+        return found
+
+    def _cell(self, problem: Problem) -> List[Problem]:
+        row = self._row(problem.latitude)
+        columns = self._rows.setdefault(row, {})
+        grades = columns.setdefault(self._column(problem.longitude, row), {})
+        return grades.setdefault(problem.grade, [])
+
+    def add(self, problem: Problem):
+        self._cell(problem).append(problem)
+
+    def remove(self, problem: Problem):
+        self._cell(problem).remove(problem)
+
+    def evict_below(self, latitude: float):
+        """Forget rows of cells too far south to match anything at latitude or above"""
+        lowest = self._row(latitude) - 1
+        for row in [row for row in self._rows if row < lowest]:
+            del self._rows[row]
+
+def find_duplicates(db_path: str) -> Iterator[Tuple[int, int]]:
+    """
+    Yield (duplicate id, canonical id) for every duplicate among the canonical rows
+
+    The canonical row of a group is its oldest (lowest id). A canonical row
+    may later be yielded as the duplicate of an older one; resolve chains
+    with _resolve.
+    """
+    grid = ProblemGrid()
+    conn = sqlite3.connect(db_path)
+    cursor = conn.execute('''
+        SELECT id, latitude, longitude, name, grade FROM boulders
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL AND duplicate_of IS NULL
+        ORDER BY latitude
+    ''')
+    for row_id, latitude, longitude, name, grade in cursor:
+        if not _has_coordinates(latitude, longitude):
+            continue
+        problem = _problem(row_id, latitude, longitude, name, grade)
+        grid.evict_below(latitude)
+        matches = grid.matches(problem)
+        if not matches:
+            grid.add(problem)
+            continue
+        canonical = min(matches)
+        if canonical.id < problem.id:
+            yield problem.id, canonical.id
+        else:
+            # The newcomer is older: it becomes the canonical entry
+            grid.remove(canonical)
+            grid.add(problem)
+            yield canonical.id, problem.id
+    conn.close()
+
+def _resolve(links: Dict[int, int]) -> Dict[int, int]:
+    """Point every duplicate straight at the end of its chain"""
+    resolved = {}
+    for duplicate in links:
+        canonical = links[duplicate]
+        while canonical in links:
+            canonical = links[canonical]
+        resolved[duplicate] = canonical
+    return resolved
+
+def link_duplicates(db_path: str, dry_run: bool = False) -> Dict:
+    """
+    Link every duplicate row to its canonical row
+
+    Args:
+        db_path: Database holding the boulders table
+        dry_run: Find duplicates without writing anything
+
+    Returns:
+        Number of rows linked, (duplicate id, canonical id) pairs and elapsed seconds
+    """
+    BoulderDatabase(db_path)  # Brings older schemas up to date
+    started = time.perf_counter()
+    links = _resolve(dict(find_duplicates(db_path)))
+    pairs = sorted(links.items())
+    if pairs and not dry_run:
+        conn = sqlite3.connect(db_path)
+        with conn:
+            conn.executemany('UPDATE boulders SET duplicate_of = ? WHERE id = ?',
+                             [(canonical, duplicate) for duplicate, canonical in pairs])
+            # Rows linked on insert to a row that has just been linked itself
+            conn.executemany('UPDATE boulders SET duplicate_of = ? WHERE duplicate_of = ?',
+                             [(canonical, duplicate) for duplicate, canonical in pairs])
+        conn.close()
+    return {
+        'linked': len(pairs),
+        'pairs': pairs,
+        'seconds': round(time.perf_counter() - started, 2)
+    }
+
+# Fields merge_linked fills in on the canonical row from its duplicates
+_MERGE_COLUMNS = ('id', 'description', 'url', 'rating', 'height', 'fa', 'holds',
+                  'approach_distance', 'duplicate_of')
+
+def _merged(canonical: Dict, duplicates: List[Dict]) -> Dict:
+    merged = dict(canonical)
+    holds = json.loads(canonical['holds']) if canonical['holds'] else []
+    for duplicate in duplicates:
+        if len(duplicate['description'] or '') > len(merged['description'] or ''):
+            merged['description'] = duplicate['description']
+        for field in ('url', 'height', 'fa', 'approach_distance'):
+            if not merged[field]:
+                merged[field] = duplicate[field]
+        merged['rating'] = max(merged['rating'] or 0.0, duplicate['rating'] or 0.0)
+        holds = merge_holds(holds, json.loads(duplicate['holds']) if duplicate['holds'] else [])
+    merged['holds'] = json.dumps(holds)
+    return merged
+
+def merge_linked(db_path: str) -> Dict:
+    """
+    Fold every linked row into its canonical row and delete it
+
+    If the canonical row is gone, the oldest of its duplicates takes its
+    place, so the problem keeps one row.
+
+    Returns:
+        Canonical rows updated, duplicates promoted to canonical, rows
+        deleted and the (lat, lon) points of every row changed
+    """
+    BoulderDatabase(db_path)
+    conn = sqlite3.connect(db_path)
+    columns = ', '.join(_MERGE_COLUMNS)
+    linked = conn.execute(f'''
+        SELECT {columns}, latitude, longitude FROM boulders
+        WHERE duplicate_of IS NOT NULL ORDER BY duplicate_of, id
+    ''').fetchall()
+
+    groups: Dict[int, List[Dict]] = {}
+    points = []
+    for row in linked:
+        record = dict(zip(_MERGE_COLUMNS, row))
+        groups.setdefault(record['duplicate_of'], []).append(record)
+        points.append(row[-2:])
+
+    deleted = promoted = 0
+    with conn:
+        for canonical_id, duplicates in groups.items():
+            row = conn.execute(f'SELECT {columns} FROM boulders WHERE id = ?',
+                               (canonical_id,)).fetchone()
+            if row is not None:
+                canonical = dict(zip(_MERGE_COLUMNS, row))
+            else:
+                canonical, duplicates = duplicates[0], duplicates[1:]
+                canonical_id = canonical['id']
+                conn.execute('UPDATE boulders SET duplicate_of = NULL WHERE id = ?', (canonical_id,))
+                promoted += 1
+            merged = _merged(canonical, duplicates)
+            conn.execute('''
+                UPDATE boulders SET description = ?, url = ?, rating = ?, height = ?,
+                                    fa = ?, holds = ?, approach_distance = ?
+                WHERE id = ?
+            ''', (merged['description'], merged['url'], merged['rating'], merged['height'],
+                  merged['fa'], merged['holds'], merged['approach_distance'], canonical_id))
+            conn.executemany('DELETE FROM boulders WHERE id = ?',
+                             [(record['id'],) for record in duplicates])
+            deleted += len(duplicates)
+    conn.close()
+    return {'merged_into': len(groups), 'promoted': promoted, 'deleted': deleted, 'points': points}
+
+def duplicate_links(db_path: str, boulders: Sequence[Boulder]) -> List[Optional[int]]:
+    """
+    For each boulder about to be inserted, the id of the stored row it duplicates
+
+    Only stored rows are compared, not the boulders with one another; the
+    bulk job catches duplicates within one batch.
+    """
+    links = []
+    conn = sqlite3.connect(db_path)
+    for boulder in boulders:
+        if not _has_coordinates(boulder.latitude, boulder.longitude):
+            links.append(None)
+            continue
+        problem = _problem(0, boulder.latitude, boulder.longitude, boulder.name, boulder.grade)
+        lat_delta = 2 * CELL_DEGREES
+        lon_delta = lat_delta / max(math.cos(math.radians(boulder.latitude)), 1e-6)
+        rows = conn.execute('''
+            SELECT id, latitude, longitude, name, grade FROM boulders
+            WHERE latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?
+              AND duplicate_of IS NULL
+            ORDER BY id
+        ''', (boulder.latitude - lat_delta, boulder.latitude + lat_delta,
+              boulder.longitude - lon_delta, boulder.longitude + lon_delta)).fetchall()
+        match = next((row[0] for row in rows if is_duplicate(problem, _problem(*row))), None)
+        links.append(match)
+    conn.close()
+    return links
+
+def find_duplicate(db_path: str, boulder: Boulder) -> Optional[int]:
+    """Id of the stored row a boulder duplicates, if any"""
+    return duplicate_links(db_path, [boulder])[0]
+
+def _refresh_artifacts(args, points: List[Tuple[float, float]]):
+    """Bring the artifacts built from the table up to date after link or merge"""
+    from map_tiles import invalidate_cached_tiles
+
+    if points:
+        logger.info(f"Invalidated {invalidate_cached_tiles(args.db, points)} map tiles")
+    if args.export:
+        from parquet_export import export_parquet, read_state
+
+        state = read_state(args.export)
+        partition_by = state['partition_by'] if state else 'region'
+        state = export_parquet(args.db, args.export, partition_by, full=True)
+        logger.info(f"Re-exported {state['rows']} rows to {args.export}")
+    if args.publish_snapshot:
+        from boulder_snapshot import publish_snapshot
+
+        logger.info(f"Published snapshot {publish_snapshot(args.db, args.publish_snapshot)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Find and link or merge duplicate problems")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    link = subparsers.add_parser('link', help='Link duplicates to their canonical rows')
+    link.add_argument('--dry-run', action='store_true', help='Print duplicates without linking them')
+    merge = subparsers.add_parser('merge', help='Fold linked rows into their canonical rows and delete them')
+    for command in (link, merge):
+        command.add_argument('--db', default='boulders.db')
+        command.add_argument('--export', metavar='DIR', help='Re-export this Parquet dataset in full afterwards')
+        command.add_argument('--publish-snapshot', metavar='DIR',
+                             help='Publish a fresh snapshot for the web workers afterwards')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'link':
+        result = link_duplicates(args.db, dry_run=args.dry_run)
+        if args.dry_run:
+            conn = sqlite3.connect(args.db)
+            for duplicate, canonical in result['pairs']:
+                names = dict(conn.execute('SELECT id, name FROM boulders WHERE id IN (?, ?)',
+                                          (duplicate, canonical)).fetchall())
+                print(f"{duplicate} {names.get(duplicate)!r} -> {canonical} {names.get(canonical)!r}")
+            conn.close()
+        else:
+            conn = sqlite3.connect(args.db)
+            points = [conn.execute('SELECT latitude, longitude FROM boulders WHERE id = ?',
+                                   (duplicate,)).fetchone() for duplicate, _ in result['pairs']]
+            conn.close()
+            _refresh_artifacts(args, points)
+        print(f"{result['linked']} duplicates {'found' if args.dry_run else 'linked'} "
+              f"in {result['seconds']}s")
+    elif args.command == 'merge':
+        result = merge_linked(args.db)
+        _refresh_artifacts(args, result['points'])
+        print(f"Merged {result['deleted']} rows into {result['merged_into']} "
+              f"({result['promoted']} duplicates promoted in place of a missing canonical row)")
+
+if __name__ == "__main__":
+    main()
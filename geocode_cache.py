@@ -0,0 +1,293 @@
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from serving import BoundedExecutor, PoolSaturated
+
+class GeocodingUnavailable(Exception):
+    """The remote geocoder timed out or is down"""
+
+# Marker cached for queries the remote geocoder could not resolve
+NOT_FOUND = object()
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_query(text: str) -> str:
+    """Canonical form of a place query: lowercase, no punctuation, single spaces"""
+    text = _PUNCTUATION.sub(' ', text.lower())
+    return _WHITESPACE.sub(' ', text).strip()
+
+@dataclass
+class GeocodeResult:
+    """A resolved location"""
+    latitude: float
+    longitude: float
+    display_name: str
+    source: str  # 'cache', 'gazetteer' or 'remote'
+
+class GeocodeCache:
+    """Normalized-query geocode cache: an in-memory LRU in front of SQLite with a TTL"""
+
+    def __init__(self, db_path: str = "geocode_cache.db", ttl: float = 30 * 86400,
+                 negative_ttl: float = 86400, memory_size: int = 4096):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.memory_size = memory_size
+        self._memory: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.init_database()
+
+    def init_database(self):
+        """Initialize the cache schema"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS geocode_cache (
+                query TEXT PRIMARY KEY,
+                latitude REAL,
+                longitude REAL,
+                display_name TEXT,
+                cached_at REAL NOT NULL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _remember(self, query: str, value, expires: float):
+        with self._lock:
+            self._memory[query] = (value, expires)
+            self._memory.move_to_end(query)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, query: str):
+        """Return a cached GeocodeResult, NOT_FOUND, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(query)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(query)
+                    return entry[0]
+                del self._memory[query]
+
+        conn = sqlite3.connect(self.db_path)
+        row = conn.execute('''
+            SELECT latitude, longitude, display_name, cached_at FROM geocode_cache WHERE query = ?
+        ''', (query,)).fetchone()
+        conn.close()
+        if row is None:
+            return None
+
+        latitude, longitude, display_name, cached_at = row
+        if latitude is None:
+            value, expires = NOT_FOUND, cached_at + self.negative_ttl
+        else:
+            value = GeocodeResult(latitude, longitude, display_name, 'cache')
+            expires = cached_at + self.ttl
+        if expires <= now:
+            return None
+        self._remember(query, value, expires)
+        return value
+
+    def put(self, query: str, result: Optional[GeocodeResult]):
+        """Cache a result, or None to remember that the query was not found"""
+        now = time.time()
+        if result is None:
+            value, expires, params = NOT_FOUND, now + self.negative_ttl, (None, None, None)
+        else:
+            value = GeocodeResult(result.latitude, result.longitude, result.display_name, 'cache')
+            expires, params = now + self.ttl, (result.latitude, result.longitude, result.display_name)
+        self._remember(query, value, expires)
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            INSERT OR REPLACE INTO geocode_cache (query, latitude, longitude, display_name, cached_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (query, *params, now))
+        conn.commit()
+        conn.close()
+
+class Gazetteer:
+    """Local place lookup built from our own boulder locations
+
+    Every location breadcrumb segment ("Bishop", "Buttermilks") and every
+    full location string ("Bishop, CA") maps to the centroid of the boulders
+    filed under it.
+    """
+
+    def __init__(self):
+        self._places: Dict[str, List] = {}  # normalized name -> [display, sum_lat, sum_lon, count]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _names(location: str) -> List[str]:
+        segments = [s.strip() for s in re.split(r'\s*>\s*', location) if s.strip()]
+        names = list(segments)
+        if segments and ',' in segments[-1]:
+            # "Bishop, CA" is also known as just "Bishop"
+            names.append(segments[-1].split(',')[0])
+        if len(segments) > 1:
+            # Most specific segment with its parent, e.g. "Buttermilks, Bishop"
+            names.append(f"{segments[-1]}, {segments[-2]}")
+        names.append(location)
+        return names
+
+    def add(self, location: str, latitude: float, longitude: float):
+        """Add one boulder's location to the gazetteer"""
+        if not location or latitude is None or longitude is None:
+            return
+        if latitude == 0.0 and longitude == 0.0:
+            return  # Scraped rows without coordinates
+        with self._lock:
+            for name in self._names(location):
+                key = normalize_query(name)
+                if not key:
+                    continue
+                place = self._places.get(key)
+                if place is None:
+                    self._places[key] = [name, latitude, longitude, 1]
+                else:
+                    place[1] += latitude
+                    place[2] += longitude
+                    place[3] += 1
+
+    @classmethod
+    def from_database(cls, db_path: str) -> 'Gazetteer':
+        """Build a gazetteer from the boulders table"""
+        gazetteer = cls()
+        conn = sqlite3.connect(db_path)
+        cursor = conn.execute('''
+            SELECT location, latitude, longitude FROM boulders
+            WHERE location IS NOT NULL AND latitude IS NOT NULL AND longitude IS NOT NULL
+        ''')
+        for location, latitude, longitude in cursor:
+            gazetteer.add(location, latitude, longitude)
+        conn.close()
+        return gazetteer
+
+    def lookup(self, query: str) -> Optional[GeocodeResult]:
+        """Resolve a normalized query, or None if it is not a known place"""
+        with self._lock:
+            place = self._places.get(query)
+            if place is None:
+                return None
+            display, sum_lat, sum_lon, count = place
+        return GeocodeResult(sum_lat / count, sum_lon / count, display, 'gazetteer')
+
+    def __len__(self) -> int:
+        return len(self._places)
+
+class CachedGeocoder:
+    """Answers from the cache or gazetteer and falls back to a remote geocoder on a miss"""
+
+    def __init__(self, remote_factory: Callable[[], object], cache: GeocodeCache,
+                 gazetteer_factory: Optional[Callable[[], Gazetteer]] = None,
+                 remote_pool: Optional[BoundedExecutor] = None, remote_timeout: Optional[float] = None):
+        """
+        Args:
+            remote_factory: Builds the remote geocoder on the first cache miss
+            cache: Cache of earlier answers
+            gazetteer_factory: Builds a gazetteer of known places, on first use
+            remote_pool: Pool bounding concurrent remote calls; without one
+                remote calls run on the caller's thread
+            remote_timeout: Seconds to wait for a pooled remote call
+        """
+        self._remote_factory = remote_factory
+        self._remote = None
+        self._remote_lock = threading.Lock()
+        self.remote_pool = remote_pool
+        self.remote_timeout = remote_timeout
+        self.cache = cache
+        self._gazetteer_factory = gazetteer_factory
+        self._gazetteer: Optional[Gazetteer] = None
+        self._gazetteer_lock = threading.Lock()
+
+    @property
+    def remote(self):
+        """The remote geocoder, created on the first cache miss"""
+        if self._remote is None:
+            with self._remote_lock:
+                if self._remote is None:
+                    self._remote = self._remote_factory()
+        return self._remote
+
+    @property
+    def gazetteer(self) -> Optional[Gazetteer]:
+        """The gazetteer, built on first use so it costs nothing at startup"""
+        if self._gazetteer is None and self._gazetteer_factory is not None:
+            with self._gazetteer_lock:
+                if self._gazetteer is None:
+                    self._gazetteer = self._gazetteer_factory()
+        return self._gazetteer
+
+    def add_location(self, location: str, latitude: float, longitude: float):
+        """Keep an already built gazetteer current with a newly added boulder"""
+        if self._gazetteer is not None:
+            self._gazetteer.add(location, latitude, longitude)
+
+    @staticmethod
+    def _remote_query(location_text: str) -> str:
+        # Add 'USA' if not specified and input looks like a city or state
+        if not any(country in location_text.lower() for country in ['usa', 'united states', 'america']):
+            if not location_text.replace('.', '').replace('-', '').isdigit():  # Not a zip code
+                location_text += ', USA'
+        return location_text
+
+    def geocode(self, location_text: str) -> Optional[GeocodeResult]:
+        """
+        Resolve free-form location text
+
+        Returns:
+            The location, or None if nobody could resolve it
+
+        Raises:
+            GeocodingUnavailable: The remote geocoder timed out or is down, or
+                its pool is full (never cached, so the next request tries again)
+        """
+        query = normalize_query(location_text)
+
+        cached = self.cache.get(query)
+        if cached is not None and cached is not NOT_FOUND:
+            return cached
+
+        # Checked before a cached miss is honoured: the location may have
+        # been added to the database since the remote geocoder missed it
+        gazetteer = self.gazetteer
+        if gazetteer is not None:
+            place = gazetteer.lookup(query)
+            if place is not None:
+                return place
+        if cached is NOT_FOUND:
+            return None
+
+        if self.remote_pool is None:
+            return self._geocode_remote(query, location_text)
+        try:
+            # A late answer is still cached by the pooled call
+            return self.remote_pool.run(self._geocode_remote, query, location_text,
+                                        timeout=self.remote_timeout)
+        except PoolSaturated as e:
+            raise GeocodingUnavailable(str(e)) from e
+        except FutureTimeoutError as e:
+            raise GeocodingUnavailable('Timed out waiting for the remote geocoder') from e
+
+    def _geocode_remote(self, query: str, location_text: str) -> Optional[GeocodeResult]:
+        from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
+        try:
+            location = self.remote.geocode(self._remote_query(location_text))
+        except (GeocoderTimedOut, GeocoderUnavailable) as e:
+            raise GeocodingUnavailable(str(e)) from e
+        if location is None:
+            self.cache.put(query, None)
+            return None
+
+        result = GeocodeResult(location.latitude, location.longitude, location.address, 'remote')
+        self.cache.put(query, result)
+        return result
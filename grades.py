@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""Boulder grades: one parser for V, Font and range grades
+
+Every grade is reduced to a canonical V grade, ordered by GRADE_DIFFICULTY:
+
+    V4, v4, V 4, V4+, V4-        -> V4   (+/- only distinguish V0-/V0/V0+)
+    V4-5, V4/5, V4/V5, V4 - V5   -> V4   (ranges and slash grades: the lower grade)
+    VB, V-easy, Veasy            -> VB
+    6B, 6b+, f6B, Font 6B        -> V4   (FONT_TO_V)
+    Font 6B/6B+                  -> V4
+    f5+, Font 4                  -> V2, V0
+    5, 5+, 7                     -> None (ambiguous: Font needs a letter or prefix)
+
+Canonical strings are answered from the lookup tables without touching the
+regular expression, and other strings are memoized, so converting a whole
+table costs one parse per distinct grade. Rewrite stored grades in place
+with:
+
+    python -m grades normalize --db boulders.db
+"""
+import argparse
+import json
+import re
+import sqlite3
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+# Canonical V grades, easiest first
+V_GRADES = ('VB', 'V0-', 'V0', 'V0+') + tuple(f'V{n}' for n in range(1, 18))
+
+# Ordinal difficulty of each V grade
+GRADE_DIFFICULTY: Dict[str, int] = {grade: ordinal for ordinal, grade in enumerate(V_GRADES)}
+
+# Fontainebleau grades and their usual V equivalents
+FONT_TO_V: Dict[str, str] = {
+    '3': 'VB', '4-': 'V0-', '4': 'V0', '4+': 'V0+', '5': 'V1', '5+': 'V2',
+    '6A': 'V3', '6A+': 'V3', '6B': 'V4', '6B+': 'V4', '6C': 'V5', '6C+': 'V5',
+    '7A': 'V6', '7A+': 'V7', '7B': 'V8', '7B+': 'V8', '7C': 'V9', '7C+': 'V10',
+    '8A': 'V11', '8A+': 'V12', '8B': 'V13', '8B+': 'V14', '8C': 'V15', '8C+': 'V16',
+    '9A': 'V17',
+}
+
+# One alternative per scale. A modifier is only taken when no digit follows,
+# so the "-" of "V4-5" starts a range instead. A Font grade needs a letter or
+# a Font prefix: a bare "5" is as likely a V grade written without its V.
+_GRADE_PATTERN = re.compile(r'''
+    (?<![A-Za-z0-9.])
+    (?:
+        V\s?(?P<v_easy>B|-?easy)(?:[+-](?!\d))?
+      | V\s?(?P<v>\d{1,2})(?P<v_mod>[+-](?!\d))?(?:\s?[-/]\s?V?\s?\d{1,2}[+-]?)?
+      | (?:font:?\s?|fb?\s?|(?=[3-9][abc]))
+        (?P<font>[3-9][abc]?)(?P<font_mod>\+|-(?![\dabc]))?
+        (?:\s?[-/]\s?[3-9][abc]?[+-]?)?
+    )
+    (?![A-Za-z0-9.])
+''', re.VERBOSE | re.IGNORECASE)
+
+def _from_match(match: 're.Match') -> Optional[str]:
+    if match.group('v_easy'):
+        return 'VB'
+    if match.group('v') is not None:
+        number = int(match.group('v'))
+        if number == 0 and match.group('v_mod'):
+            return 'V0' + match.group('v_mod')
+        grade = f'V{number}'
+        return grade if grade in GRADE_DIFFICULTY else None
+    return FONT_TO_V.get(match.group('font').upper() + (match.group('font_mod') or ''))
+
+@lru_cache(maxsize=4096)
+def _parse(text: str, v_only: bool) -> Optional[str]:
+    for match in _GRADE_PATTERN.finditer(text):
+        if v_only and match.group('font'):
+            continue
+        grade = _from_match(match)
+        if grade is not None:
+            return grade
+    return None
+
+def parse_grade(text: Optional[str], v_only: bool = False) -> Optional[str]:
+    """
+    Canonical V grade of a V, Font or range grade
+
+    Args:
+        text: Grade text, e.g. "V4-5", "Font 6B+" or a Mountain Project grade cell
+        v_only: Ignore Font grades, for text that may hold French sport grades
+
+    Returns:
+        The canonical grade, or None if the text holds no recognizable grade
+    """
+    if not text:
+        return None
+    if text in GRADE_DIFFICULTY:
+        return text
+    return _parse(text.strip(), v_only)
+
+def grade_ordinal(text: Optional[str]) -> int:
+    """GRADE_DIFFICULTY ordinal of a grade, or -1 if it is not recognized"""
+    ordinal = GRADE_DIFFICULTY.get(text)
+    if ordinal is not None:
+        return ordinal
+    grade = parse_grade(text)
+    return GRADE_DIFFICULTY[grade] if grade is not None else -1
+
+def canonical_grades(texts: Iterable[Optional[str]]) -> List[Optional[str]]:
+    """parse_grade for many grades, parsing each distinct one once"""
+    memo: Dict[Optional[str], Optional[str]] = {}
+    result = []
+    for text in texts:
+        if text not in memo:
+            memo[text] = parse_grade(text)
+        result.append(memo[text])
+    return result
+
+def grade_ordinals(texts: Iterable[Optional[str]]) -> List[int]:
+    """grade_ordinal for many grades, parsing each distinct one once"""
+    return [GRADE_DIFFICULTY[grade] if grade is not None else -1
+            for grade in canonical_grades(texts)]
+
+def normalize_grades(db_path: str, dry_run: bool = False) -> Dict:
+    """
+    Rewrite every stored grade that parses to a different canonical grade
+
+    One UPDATE per distinct grade, so the cost follows the number of
+    distinct spellings rather than the number of rows.
+
+    Returns:
+        {original grade: [canonical grade, rows]} for every rewritten grade,
+        and the rows whose grade is not recognized at all
+    """
+    conn = sqlite3.connect(db_path)
+    counts = conn.execute('SELECT grade, COUNT(*) FROM boulders GROUP BY grade').fetchall()
+    grades = [grade for grade, _ in counts]
+    changes = {}
+    unrecognized = 0
+    for (grade, count), canonical in zip(counts, canonical_grades(grades)):
+        if canonical is None:
+            unrecognized += count
+        elif canonical != grade:
+            changes[grade] = [canonical, count]
+    if changes and not dry_run:
+        with conn:
+            conn.executemany('UPDATE boulders SET grade = ? WHERE grade = ?',
+                             [(canonical, grade) for grade, (canonical, _) in changes.items()])
+    conn.close()
+    return {'changes': changes, 'unrecognized_rows': unrecognized}
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse grades and normalize stored ones")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    normalize = subparsers.add_parser('normalize', help='Rewrite stored grades to canonical V grades')
+    normalize.add_argument('--db', default='boulders.db')
+    normalize.add_argument('--dry-run', action='store_true', help='Report changes without writing them')
+    parse = subparsers.add_parser('parse', help='Print the canonical grade of each argument')
+    parse.add_argument('grades', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'normalize':
+        print(json.dumps(normalize_grades(args.db, dry_run=args.dry_run), indent=2))
+    elif args.command == 'parse':
+        for text in args.grades:
+            print(f"{text!r:24} {parse_grade(text)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+"""gunicorn settings for production serving (used by the Procfile)
+
+Threaded workers let a request waiting on I/O, such as a remote geocode,
+give up the CPU to other requests. serving.py bounds how many threads each
+kind of slow work can hold, so threads stay free for recommendations.
+"""
+import multiprocessing
+import os
+
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 4)))
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+timeout = 60
+keepalive = 5
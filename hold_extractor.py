@@ -0,0 +1,51 @@
+"""Hold types mentioned in free-text route descriptions
+
+All synonyms of every hold type are compiled into one regular expression
+with a named group per type, so a description is scanned once however many
+terms there are. Terms match on word boundaries ("crimp" but not
+"scrimp"), take plural endings, and accept a space or hyphen wherever the
+term has a space ("side pull", "side-pull", "sidepull").
+"""
+import re
+from typing import Dict, List
+
+# Canonical hold types, in the order extract_holds reports them
+HOLD_TYPES = ['crimps', 'jugs', 'slopers', 'pinches', 'pockets', 'sidepulls',
+              'underclings', 'mantles']
+
+# Terms for each hold type; plural endings are added automatically
+HOLD_SYNONYMS: Dict[str, List[str]] = {
+    'crimps': ['crimp', 'crimpy', 'crimping', 'crimper', 'razor crimp', 'micro crimp'],
+    'jugs': ['jug', 'juggy', 'bucket', 'jug haul'],
+    'slopers': ['sloper', 'slopey', 'slopy', 'sloping hold', 'slopy hold'],
+    'pinches': ['pinch', 'pinchy', 'pinching'],
+    'pockets': ['pocket', 'pockety', 'mono', 'two finger pocket'],
+    'sidepulls': ['side pull', 'sidepulling', 'side pulling'],
+    'underclings': ['under cling', 'undercut', 'under clinging'],
+    'mantles': ['mantle', 'mantel', 'mantling', 'mantleing'],
+}
+
+def _term_pattern(term: str) -> str:
+    words = [re.escape(word) for word in term.split()]
+    return r'[\s-]?'.join(words) + r'(?:e?s)?'
+
+def _compile() -> 're.Pattern':
+    groups = []
+    for hold in HOLD_TYPES:
+        # Longest terms first so "jug haul" wins over "jug"
+        terms = sorted(HOLD_SYNONYMS[hold], key=len, reverse=True)
+        groups.append(f"(?P<{hold}>{'|'.join(_term_pattern(term) for term in terms)})")
+    return re.compile(r'\b(?:' + '|'.join(groups) + r')\b', re.IGNORECASE)
+
+HOLD_PATTERN = _compile()
+
+def extract_holds(text: str) -> List[str]:
+    """Canonical hold types mentioned in text, in HOLD_TYPES order"""
+    if not text:
+        return []
+    found = {match.lastgroup for match in HOLD_PATTERN.finditer(text)}
+    return [hold for hold in HOLD_TYPES if hold in found]
+
+def merge_holds(existing: List[str], extracted: List[str]) -> List[str]:
+    """Existing holds followed by extracted ones not already present"""
+    return existing + [hold for hold in extracted if hold not in existing]
@@ -0,0 +1,251 @@
+"""GeoJSON map tiles of the boulders table, addressed by z/x/y
+
+Tiles use the Web Mercator scheme Leaflet uses for its base layer. Below
+CLUSTER_BELOW_ZOOM a tile holds one point per occupied cell of a coarse
+grid, carrying the number of problems it stands for; from that zoom on it
+holds one point per problem with just enough properties for a popup.
+
+Built tiles are written to disk and kept in an in-memory LRU. Memory hits are
+checked against the file's mtime, so a tile invalidated by one worker
+process is rebuilt by every worker. Every invalidation also rewrites a
+generation stamp in the cache directory; a tile whose build overlapped an
+invalidation is served but not cached, since it may predate the change.
+"""
+import argparse
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Set, Tuple
+
+from metrics import timed
+from serialization import dumps
+
+MAX_ZOOM = 18
+
+# Lower zooms get clustered points rather than individual problems
+CLUSTER_BELOW_ZOOM = 11
+
+# Clusters per tile side at low zoom
+CLUSTER_GRID = 32
+
+# Rewritten on every invalidation; see TileCache.get
+GENERATION_FILE = 'generation'
+
+# Web Mercator stops short of the poles
+MAX_LATITUDE = 85.0511287798
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) of a tile in degrees"""
+    n = 2 ** z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return south, west, north, east
+
+def tile_for(latitude: float, longitude: float, z: int) -> Tuple[int, int]:
+    """(x, y) of the tile at zoom z containing a point"""
+    n = 2 ** z
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude))
+    x = int((longitude + 180.0) / 360.0 * n)
+    lat_rad = math.radians(latitude)
+    y = int((1 - math.asinh(math.tan(lat_rad)) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+def tiles_for_points(points: Iterable[Tuple[float, float]]) -> Set[Tuple[int, int, int]]:
+    """Every tile, at every zoom, that contains one of the points"""
+    tiles = set()
+    for latitude, longitude in points:
+        if latitude is None or longitude is None:
+            continue
+        for z in range(MAX_ZOOM + 1):
+            tiles.add((z, *tile_for(latitude, longitude, z)))
+    return tiles
+
+def _tile_filter(z: int, x: int, y: int) -> Tuple[str, Tuple]:
+    """WHERE clause selecting exactly the rows tile_for() puts in this tile"""
+    south, west, north, east = tile_bounds(z, x, y)
+    n = 2 ** z
+    # Tiles own their north and west edges; the last row and column also
+    # own the clamped south and east edges
+    lat_clause = 'latitude >= ?' if y == n - 1 else 'latitude > ?'
+    lon_clause = 'longitude <= ?' if x == n - 1 else 'longitude < ?'
+    if y == 0:
+        north = 90.0
+    if y == n - 1:
+        south = -90.0
+    return (f'{lat_clause} AND latitude <= ? AND longitude >= ? AND {lon_clause}',
+            (south, north, west, east))
+
+def build_tile(db_path: str, z: int, x: int, y: int) -> bytes:
+    """Encode one tile as a GeoJSON FeatureCollection"""
+    where, params = _tile_filter(z, x, y)
+    conn = sqlite3.connect(db_path)
+    with timed('tiles.build'):
+        if z < CLUSTER_BELOW_ZOOM:
+            south, west, north, east = tile_bounds(z, x, y)
+            cell_lat = (north - south) / CLUSTER_GRID
+            cell_lon = (east - west) / CLUSTER_GRID
+            rows = conn.execute(f'''
+                SELECT COUNT(*), AVG(latitude), AVG(longitude), MAX(rating)
+                FROM boulders WHERE {where} AND duplicate_of IS NULL
+                GROUP BY CAST((latitude - ?) / ? AS INTEGER), CAST((longitude - ?) / ? AS INTEGER)
+            ''', (*params, south, cell_lat, west, cell_lon)).fetchall()
+            features = [{
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [round(lon, 5), round(lat, 5)]},
+                'properties': {'count': count, 'max_rating': rating}
+            } for count, lat, lon, rating in rows]
+        else:
+            rows = conn.execute(f'''
+                SELECT id, name, grade, rating, latitude, longitude FROM boulders
+                WHERE {where} AND duplicate_of IS NULL
+            ''', params).fetchall()
+            features = [{
+                'type': 'Feature',
+                'id': boulder_id,
+                'geometry': {'type': 'Point', 'coordinates': [round(lon, 6), round(lat, 6)]},
+                'properties': {'name': name, 'grade': grade, 'rating': rating}
+            } for boulder_id, name, grade, rating, lat, lon in rows]
+    conn.close()
+    return dumps({'type': 'FeatureCollection', 'features': features})
+
+class TileCache:
+    """Disk and in-memory cache of built tiles"""
+
+    def __init__(self, db_path: str, cache_dir: str, memory_size: int = 2048):
+        self.db_path = db_path
+        self.cache_dir = cache_dir
+        self.memory_size = memory_size
+        self._memory: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, z: int, x: int, y: int) -> str:
+        return os.path.join(self.cache_dir, str(z), str(x), f'{y}.geojson')
+
+    def _generation(self) -> Optional[bytes]:
+        try:
+            with open(os.path.join(self.cache_dir, GENERATION_FILE), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _remember(self, key: Tuple[int, int, int], body: bytes, mtime: int):
+        with self._lock:
+            self._memory[key] = (body, mtime)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, z: int, x: int, y: int) -> bytes:
+        """Return a tile, building and caching it on a miss"""
+        key = (z, x, y)
+        path = self._path(z, x, y)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        if mtime is not None:
+            with self._lock:
+                entry = self._memory.get(key)
+                if entry is not None and entry[1] == mtime:
+                    self._memory.move_to_end(key)
+                    return entry[0]
+            try:
+                with open(path, 'rb') as f:
+                    body = f.read()
+                self._remember(key, body, mtime)
+                return body
+            except FileNotFoundError:
+                pass  # Invalidated between the stat and the read
+
+        generation = self._generation()
+        body = build_tile(self.db_path, z, x, y)
+        if self._generation() != generation:
+            return body
+        mtime = self._write(path, body)
+        # An invalidation that bumped the stamp after the check above may
+        # have removed its files before this write; the stamp is bumped
+        # before removal, so checking again after writing catches it
+        if self._generation() != generation:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return body
+        self._remember(key, body, mtime)
+        return body
+
+    def _write(self, path: str, body: bytes) -> int:
+        """Atomically write a tile file and return its mtime"""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+        return os.stat(path).st_mtime_ns
+
+    def invalidate(self, points: Iterable[Tuple[float, float]]) -> int:
+        """Drop every cached tile containing one of the (lat, lon) points; return how many"""
+        tiles = tiles_for_points(points)
+        if not tiles:
+            return 0
+        # Bumped first, so a build that read rows before the change is not cached
+        self._write(os.path.join(self.cache_dir, GENERATION_FILE), os.urandom(8).hex().encode())
+        for key in tiles:
+            with self._lock:
+                self._memory.pop(key, None)
+            try:
+                os.remove(self._path(*key))
+            except FileNotFoundError:
+                pass
+        return len(tiles)
+
+    def invalidate_since(self, created_after: str) -> int:
+        """Drop tiles touched by rows created at or after a 'YYYY-MM-DD HH:MM:SS' UTC timestamp"""
+        conn = sqlite3.connect(self.db_path)
+        points = conn.execute('''
+            SELECT DISTINCT latitude, longitude FROM boulders WHERE created_at >= ?
+        ''', (created_after,)).fetchall()
+        conn.close()
+        return self.invalidate(points)
+
+def default_cache_dir(db_path: str) -> str:
+    """Tile cache directory kept next to the database"""
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), 'tile_cache')
+
+def tile_cache_dir(db_path: str) -> str:
+    """The served tile cache: BOULDER_TILE_DIR, or tile_cache next to the database"""
+    return os.environ.get('BOULDER_TILE_DIR') or default_cache_dir(db_path)
+
+def invalidate_cached_tiles(db_path: str, points: Iterable[Tuple[float, float]]) -> int:
+    """Drop the served tiles containing the points, for writers outside the web app"""
+    cache_dir = tile_cache_dir(db_path)
+    if not os.path.isdir(cache_dir):
+        return 0
+    return TileCache(db_path, cache_dir).invalidate(points)
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Manage the GeoJSON map tile cache")
+    parser.add_argument('--db', default='boulders.db')
+    parser.add_argument('--cache-dir', help='Defaults to BOULDER_TILE_DIR or tile_cache next to the database')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    invalidate = subparsers.add_parser('invalidate', help='Drop tiles touched by recently added rows')
+    invalidate.add_argument('--since', required=True, help="UTC timestamp, e.g. '2024-05-01 12:00:00'")
+    args = parser.parse_args(argv)
+
+    cache = TileCache(args.db, args.cache_dir or tile_cache_dir(args.db))
+    if args.command == 'invalidate':
+        count = cache.invalidate_since(args.since)
+        print(f"Invalidated {count} tiles")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+# Upper bounds (seconds) of the latency buckets; wide enough for both
+# sub-millisecond filters and multi-second page fetches
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Stage timings for the request being served, when Server-Timing is on
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar(
+    'request_timings', default=None)
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus style"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        """Cumulative bucket counts, sum and count"""
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for c in counts:
+            running += c
+            cumulative.append(running)
+        return cumulative, total, count
+
+class _Timer:
+    __slots__ = ('registry', 'stage', 'start')
+
+    def __init__(self, registry: 'MetricsRegistry', stage: str):
+        self.registry = registry
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP_TIMER = _NoopTimer()
+
+class MetricsRegistry:
+    """Per-stage latency histograms
+
+    When disabled, timer() hands back one shared no-op context manager, so
+    instrumented code pays a method call and nothing else.
+    """
+
+    def __init__(self, enabled: bool = True, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def timer(self, stage: str):
+        """Context manager timing a block as `stage`"""
+        if not self.enabled:
+            return _NOOP_TIMER
+        return _Timer(self, stage)
+
+    def observe(self, stage: str, seconds: float):
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, Histogram(self.buckets))
+        histogram.observe(seconds)
+
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, seconds))
+
+    def render_prometheus(self) -> str:
+        """All histograms in the Prometheus text exposition format"""
+        lines = [
+            '# HELP boulderbot_stage_seconds Time spent in each processing stage',
+            '# TYPE boulderbot_stage_seconds histogram',
+        ]
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        for stage, histogram in histograms:
+            cumulative, total, count = histogram.snapshot()
+            for bound, value in zip(self.buckets, cumulative):
+                lines.append(f'boulderbot_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {value}')
+            lines.append(f'boulderbot_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {cumulative[-1]}')
+            lines.append(f'boulderbot_stage_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'boulderbot_stage_seconds_count{{stage="{stage}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+def start_request_timing():
+    """Begin collecting stage timings for the current request"""
+    return _request_timings.set([])
+
+def finish_request_timing(token) -> str:
+    """Stop collecting and return a Server-Timing header value"""
+    timings = _request_timings.get() or []
+    _request_timings.reset(token)
+    totals: Dict[str, float] = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ', '.join(f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in totals.items())
+
+@contextmanager
+def collect_timings():
+    """Collect the stage timings of a block into the yielded list
+
+    For work done in another process, whose timings have to be sent back
+    and observed in the serving process.
+    """
+    timings: List[Tuple[str, float]] = []
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+# Process-wide registry; BOULDERBOT_METRICS=0 turns instrumentation off
+REGISTRY = MetricsRegistry(enabled=os.environ.get('BOULDERBOT_METRICS', '1') != '0')
+
+def timed(stage: str):
+    """Time a block against the process-wide registry"""
+    return REGISTRY.timer(stage)
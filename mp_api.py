@@ -1,24 +1,47 @@
 import requests
-import time
-from typing import List, Dict, Optional
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Iterable
 from dataclasses import dataclass
 import os
 from bouldering_agent import Boulder
+from dedup import duplicate_links
+from grades import parse_grade
+from hold_extractor import extract_holds
+from map_tiles import invalidate_cached_tiles
+from region_sweep import BBox, RegionSweep
 
 class MountainProjectAPI:
     """Client for the Mountain Project API"""
     
     BASE_URL = "https://www.mountainproject.com/data"
+    MAX_ROUTE_IDS = 200  # Largest routeIds list get-routes accepts per call
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, base_url: Optional[str] = None,
+                 timeout: float = 30, max_workers: int = 4):
         self.api_key = api_key
+        self.base_url = (base_url or self.BASE_URL).rstrip('/')
+        self.timeout = timeout
+        self.max_workers = max_workers
+        
+        # One pooled keep-alive session, sized for the concurrent batch fetches
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+    
+    def _get(self, endpoint: str, params: Dict) -> Dict:
+        """GET an API endpoint on the shared session and decode the JSON body"""
+        response = self.session.get(f"{self.base_url}/{endpoint}",
+                                    params={'key': self.api_key, **params},
+                                    timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
         
     def get_area_by_lat_lon(self, lat: float, lon: float, max_distance: float = 50,
                            max_results: int = 500) -> List[Dict]:
         """Get areas within a radius of coordinates"""
-        endpoint = f"{self.BASE_URL}/get-routes-for-lat-lon"
         params = {
-            'key': self.api_key,
             'lat': lat,
             'lon': lon,
             'maxDistance': max_distance,
@@ -26,30 +49,68 @@ class MountainProjectAPI:
             'type': 'boulder'  # Only get boulder problems
         }
         
-        response = requests.get(endpoint, params=params)
-        response.raise_for_status()
-        return response.json()['routes']
+        return self._get('get-routes-for-lat-lon', params)['routes']
     
     def get_area_by_id(self, area_id: int) -> Dict:
         """Get details for a specific area by ID"""
-        endpoint = f"{self.BASE_URL}/get-routes"
-        params = {
-            'key': self.api_key,
-            'routeIds': area_id
-        }
+        return self.get_routes([area_id])[0]
+
+    def get_routes(self, route_ids: Iterable[int]) -> List[Dict]:
+        """
+        Get details for many routes by ID
         
-        response = requests.get(endpoint, params=params)
-        response.raise_for_status()
-        return response.json()['routes'][0]
+        IDs are split into the largest batches get-routes accepts and the
+        batches are fetched concurrently over the pooled session.
+        
+        Args:
+            route_ids: Mountain Project route IDs
+            
+        Returns:
+            Route dicts in the order the batches were requested
+        """
+        route_ids = list(route_ids)
+        batches = [route_ids[i:i + self.MAX_ROUTE_IDS]
+                   for i in range(0, len(route_ids), self.MAX_ROUTE_IDS)]
+        if not batches:
+            return []
+        
+        def fetch_batch(batch: List[int]) -> List[Dict]:
+            params = {'routeIds': ','.join(str(route_id) for route_id in batch)}
+            return self._get('get-routes', params)['routes']
+        
+        if len(batches) == 1:
+            return fetch_batch(batches[0])
+        
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+            results = executor.map(fetch_batch, batches)
+            return [route for batch_routes in results for route in batch_routes]
+
+    def sweep_region(self, bbox: BBox, checkpoint_path: str = "sweep_checkpoint.db",
+                     on_routes=None, **sweep_options) -> List[Dict]:
+        """
+        Get every boulder route in a bounding box, past the maxResults cap
+        
+        Args:
+            bbox: (min_lat, min_lon, max_lat, max_lon)
+            checkpoint_path: SQLite file recording finished tiles, so an
+                interrupted sweep resumes instead of starting over
+            on_routes: Optional callback for each batch of new routes
+            **sweep_options: Passed to RegionSweep (max_workers, rate_limiter, ...)
+            
+        Returns:
+            Routes found by this run, deduplicated by route ID
+        """
+        sweep = RegionSweep(self, checkpoint_path, **sweep_options)
+        try:
+            return sweep.sweep(bbox, on_routes)
+        finally:
+            sweep.close()
 
     def convert_to_boulder(self, mp_route: Dict) -> Boulder:
         """Convert Mountain Project route data to our Boulder format"""
         
         # Extract holds from route description
-        holds = []
-        desc_lower = mp_route.get('description', '').lower()
-        possible_holds = ['crimps', 'jugs', 'slopers', 'pinches', 'pockets', 'sidepulls', 'underclings']
-        holds = [hold for hold in possible_holds if hold in desc_lower]
+        holds = extract_holds(mp_route.get('description', ''))
         
         # Convert YDS grade to V-scale if needed
         grade = self._normalize_grade(mp_route.get('rating', ''))
@@ -73,10 +134,8 @@ class MountainProjectAPI:
     def _normalize_grade(self, grade: str) -> str:
         """Normalize Mountain Project grades to V-scale"""
         # MP already uses V-scale for boulders, but sometimes includes ranges
-        # Convert "V1-2" to "V1" etc.
-        if '-' in grade:
-            grade = grade.split('-')[0]
-        return grade.strip()
+        # ("V1-2" becomes "V1"); grades that do not parse are kept as given
+        return parse_grade(grade) or grade.strip()
 
 def fetch_and_store_area_data(api: MountainProjectAPI, db, lat: float, lon: float,
                             radius: float = 50) -> int:
@@ -97,29 +156,51 @@ def fetch_and_store_area_data(api: MountainProjectAPI, db, lat: float, lon: floa
         # Get all routes in the area
         routes = api.get_area_by_lat_lon(lat, lon, radius)
         
-        count = 0
+        boulders = []
         for route in routes:
             try:
                 # Convert to our Boulder format
-                boulder = api.convert_to_boulder(route)
-                
-                # Add to database
-                db.add_boulder(boulder)
-                count += 1
-                
-                # Be nice to the API
-                time.sleep(0.1)
-                
+                boulders.append(api.convert_to_boulder(route))
             except Exception as e:
                 print(f"Error processing route {route.get('id', 'unknown')}: {e}")
                 continue
         
-        return count
+        # Add to database in one transaction
+        added = db.add_boulders(boulders, duplicate_links(db.db_path, boulders))
+        invalidate_cached_tiles(db.db_path, [(b.latitude, b.longitude) for b in boulders])
+        return added
         
     except Exception as e:
         print(f"Error fetching area data: {e}")
         return 0
 
+def fetch_and_store_region_data(api: MountainProjectAPI, db, bbox: BBox,
+                                checkpoint_path: str = "sweep_checkpoint.db") -> int:
+    """
+    Sweep a whole region and store every boulder problem in it
+    
+    Each tile's routes are stored as soon as it completes, so a resumed
+    sweep never loses work.
+    
+    Returns:
+        Number of boulders added to database
+    """
+    count = 0
+    
+    def store(routes: List[Dict]):
+        nonlocal count
+        boulders = []
+        for route in routes:
+            try:
+                boulders.append(api.convert_to_boulder(route))
+            except Exception as e:
+                print(f"Error processing route {route.get('id', 'unknown')}: {e}")
+        count += db.add_boulders(boulders, duplicate_links(db.db_path, boulders))
+        invalidate_cached_tiles(db.db_path, [(b.latitude, b.longitude) for b in boulders])
+    
+    api.sweep_region(bbox, checkpoint_path, on_routes=store)
+    return count
+
 def main():
     """Example usage of the Mountain Project API client"""
     # Get API key from environment variable
@@ -128,8 +209,8 @@ def main():
         print("Please set the MP_API_KEY environment variable")
         return
     
-    # Initialize API client
-    api = MountainProjectAPI(api_key)
+    # Initialize API client (MP_API_BASE_URL points it at a local stand-in server)
+    api = MountainProjectAPI(api_key, base_url=os.getenv('MP_API_BASE_URL'))
     
     # Example: Get boulders near Boulder, CO
     try:
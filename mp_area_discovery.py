@@ -3,16 +3,31 @@ import requests
 from bs4 import BeautifulSoup, Tag
 import time
 import random
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Optional, Tuple
 from queue import Queue
 import json
+import argparse
+from page_archive import PageArchive, FETCH_MODES, LIVE, RECORD, REPLAY
+from crawl_policy import CrawlStats, RetryPolicy, fetch_with_policy
+from metrics import timed
 
 class AreaDiscovery:
     """Discovers all bouldering areas on Mountain Project"""
     
     BASE_URL = "https://www.mountainproject.com"
     
-    def __init__(self):
+    def __init__(self, archive: Optional[PageArchive] = None, mode: str = LIVE,
+                 retry_policy: Optional[RetryPolicy] = None, rate_limiter=None):
+        if mode not in FETCH_MODES:
+            raise ValueError(f"Unknown fetch mode: {mode}")
+        if mode != LIVE and archive is None:
+            raise ValueError(f"Fetch mode '{mode}' requires a page archive")
+        self.archive = archive
+        self.mode = mode
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = rate_limiter  # Replaces the random politeness delay when set
+        self.stats = CrawlStats()
+
         # Use a realistic user agent
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36'
@@ -38,30 +53,29 @@ class AreaDiscovery:
                 
             try:
                 print(f"Exploring {current_url}")
-                response = self.session.get(current_url)
-                response.raise_for_status()
-                soup = BeautifulSoup(response.text, 'html.parser')
+                with timed('discovery.fetch'):
+                    html = self._fetch_html(current_url)
+                if html is None:
+                    print(f"Could not fetch {current_url}")
+                    self.visited_urls.add(current_url)
+                    continue
                 
                 # Mark as visited
                 self.visited_urls.add(current_url)
                 
-                # Check if this is a bouldering area
-                if self._is_bouldering_area(soup):
-                    area_name = self._get_area_name(soup)
-                    print(f"Found bouldering area: {area_name}")
-                    self.bouldering_areas.append({
-                        'name': area_name,
-                        'url': current_url
-                    })
+                with timed('discovery.parse'):
+                    soup = BeautifulSoup(html, 'html.parser')
+                    area, sub_areas = self._analyze_page(current_url, soup)
+                if area:
+                    self.bouldering_areas.append(area)
                 
-                # Find sub-areas
-                sub_areas = self._get_sub_areas(soup)
                 for sub_area in sub_areas:
                     if sub_area not in self.visited_urls:
                         queue.put(sub_area)
                 
                 # Be nice to the server
-                time.sleep(random.uniform(1, 2))
+                if self.mode != REPLAY and self.rate_limiter is None:
+                    time.sleep(random.uniform(1, 2))
                 
             except Exception as e:
                 print(f"Error processing {current_url}: {e}")
@@ -69,6 +83,31 @@ class AreaDiscovery:
         
         return self.bouldering_areas
     
+    def _fetch_html(self, url: str) -> Optional[str]:
+        """Fetch a page body from the network or, in replay mode, the archive"""
+        if self.mode == REPLAY:
+            return self.archive.get(url)
+
+        response = fetch_with_policy(self.session, url, self.retry_policy, self.stats,
+                                     rate_limiter=self.rate_limiter)
+        if response is None:
+            return None
+        if self.mode == RECORD:
+            self.archive.record(url, response.text, response.status_code)
+        return response.text
+
+    def _analyze_page(self, url: str, soup: BeautifulSoup) -> Tuple[Optional[Dict], Set[str]]:
+        """Return the bouldering area on a page (if it is one) and its sub-area links"""
+        area = None
+        if self._is_bouldering_area(soup):
+            area_name = self._get_area_name(soup)
+            print(f"Found bouldering area: {area_name}")
+            area = {
+                'name': area_name,
+                'url': url
+            }
+        return area, self._get_sub_areas(soup)
+
     def _is_bouldering_area(self, soup: BeautifulSoup) -> bool:
         """Check if the page represents a bouldering area"""
         # Look for indicators that this is a bouldering area
@@ -126,12 +165,23 @@ class AreaDiscovery:
 
 def main():
     """Discover all bouldering areas on Mountain Project"""
-    discoverer = AreaDiscovery()
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--record', metavar='ARCHIVE', help='Write every fetched page to this archive')
+    parser.add_argument('--replay', metavar='ARCHIVE', help='Read pages from this archive instead of the network')
+    args = parser.parse_args()
+
+    if args.replay:
+        discoverer = AreaDiscovery(PageArchive(args.replay), mode=REPLAY)
+    elif args.record:
+        discoverer = AreaDiscovery(PageArchive(args.record), mode=RECORD)
+    else:
+        discoverer = AreaDiscovery()
     
     print("Starting area discovery...")
     areas = discoverer.discover_areas()
     
     print(f"\nFound {len(areas)} bouldering areas!")
+    print(f"Crawl stats: {discoverer.stats.as_dict()}")
     discoverer.save_areas()
 
 if __name__ == "__main__":
@@ -5,6 +5,11 @@ import random
 from typing import List, Dict, Optional, Union
 import re
 from bouldering_agent import Boulder, BoulderDatabase
+from grades import parse_grade
+from hold_extractor import extract_holds
+from page_archive import PageArchive, FETCH_MODES, LIVE, RECORD, REPLAY
+from crawl_policy import CrawlStats, RetryPolicy, fetch_with_policy
+from metrics import timed
 import logging
 from urllib.parse import urljoin
 
@@ -17,7 +22,18 @@ class MountainProjectScraper:
     
     BASE_URL = "https://www.mountainproject.com"
     
-    def __init__(self):
+    def __init__(self, archive: Optional[PageArchive] = None, mode: str = LIVE,
+                 retry_policy: Optional[RetryPolicy] = None, rate_limiter=None):
+        if mode not in FETCH_MODES:
+            raise ValueError(f"Unknown fetch mode: {mode}")
+        if mode != LIVE and archive is None:
+            raise ValueError(f"Fetch mode '{mode}' requires a page archive")
+        self.archive = archive
+        self.mode = mode
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = rate_limiter  # Replaces the random politeness delay when set
+        self.stats = CrawlStats()
+
         # Create a session to maintain cookies
         self.session = requests.Session()
         
@@ -37,33 +53,34 @@ class MountainProjectScraper:
         }
         self.session.headers.update(self.headers)
 
-    def _get_page(self, url: str, retry_count: int = 3) -> Optional[BeautifulSoup]:
+    def _get_page(self, url: str) -> Optional[BeautifulSoup]:
         """Get a page with retries and random delays"""
-        for attempt in range(retry_count):
-            try:
-                # Add random delay between requests
-                delay = random.uniform(5.0, 10.0)
-                logger.info(f"Waiting {delay:.2f} seconds before request...")
-                time.sleep(delay)
-                
-                logger.info(f"Fetching page: {url}")
-                response = self.session.get(url, timeout=30)
-                response.raise_for_status()
-                
-                if response.status_code == 200:
-                    return BeautifulSoup(response.text, 'html.parser')
-                elif response.status_code == 429:  # Too Many Requests
-                    logger.warning("Rate limited, waiting longer...")
-                    time.sleep(120)  # Wait two minutes before retrying
-                else:
-                    logger.warning(f"Got status code {response.status_code}")
-                    
-            except Exception as e:
-                logger.error(f"Error fetching {url}: {str(e)}")
-                if attempt < retry_count - 1:
-                    time.sleep(30)  # Wait 30 seconds before retrying
-                
-        return None
+        if self.mode == REPLAY:
+            with timed('scraper.fetch'):
+                html = self.archive.get(url)
+            if html is None:
+                logger.warning(f"Page not in archive: {url}")
+                return None
+            with timed('scraper.parse'):
+                return BeautifulSoup(html, 'html.parser')
+
+        # Politeness delay between pages; retries use the policy's backoff instead
+        if self.rate_limiter is None:
+            delay = random.uniform(5.0, 10.0)
+            logger.info(f"Waiting {delay:.2f} seconds before request...")
+            time.sleep(delay)
+
+        logger.info(f"Fetching page: {url}")
+        with timed('scraper.fetch'):
+            response = fetch_with_policy(self.session, url, self.retry_policy, self.stats,
+                                         rate_limiter=self.rate_limiter)
+        if response is None:
+            return None
+
+        if self.mode == RECORD:
+            self.archive.record(url, response.text, response.status_code)
+        with timed('scraper.parse'):
+            return BeautifulSoup(response.text, 'html.parser')
 
     def get_area_boulders(self, area_url: str) -> List[Dict]:
         """Get all boulder problems in an area"""
@@ -73,23 +90,13 @@ class MountainProjectScraper:
             return boulders
 
         # Find all route links in the area
-        route_links = soup.find_all('a', href=re.compile(r'/route/\d+/'))
-        if not route_links:
+        route_urls = self._get_route_links(soup)
+        if not route_urls:
             logger.warning(f"No route links found at {area_url}")
             return boulders
 
-        for link in route_links:
+        for route_url in route_urls:
             try:
-                if not isinstance(link, Tag):
-                    continue
-                    
-                href = link.get('href')
-                if not href or not isinstance(href, str):
-                    continue
-
-                # Make sure it's an absolute URL
-                route_url = urljoin(self.BASE_URL, href)
-
                 # Get detailed boulder info
                 boulder_data = self._parse_boulder_page(route_url)
                 if boulder_data:
@@ -102,12 +109,40 @@ class MountainProjectScraper:
 
         return boulders
 
+    def _get_route_links(self, soup: BeautifulSoup) -> List[str]:
+        """Extract absolute route URLs from an area page, in page order"""
+        route_urls = []
+        seen = set()
+        for link in soup.find_all('a', href=re.compile(r'/route/\d+/')):
+            if not isinstance(link, Tag):
+                continue
+
+            href = link.get('href')
+            if not href or not isinstance(href, str):
+                continue
+
+            # Make sure it's an absolute URL
+            route_url = urljoin(self.BASE_URL, href)
+            if route_url not in seen:
+                seen.add(route_url)
+                route_urls.append(route_url)
+
+        return route_urls
+
     def _parse_boulder_page(self, url: str) -> Optional[Dict]:
         """Parse a boulder problem page"""
         soup = self._get_page(url)
         if not soup:
             return None
+        return self._parse_boulder_soup(url, soup)
+
+    def _parse_boulder_soup(self, url: str, soup: BeautifulSoup) -> Optional[Dict]:
+        """Parse an already fetched boulder problem page"""
+        with timed('scraper.parse'):
+            return self._extract_boulder(url, soup)
 
+    def _extract_boulder(self, url: str, soup: BeautifulSoup) -> Optional[Dict]:
+        """Pull the name, grade, description and location out of a route page"""
         try:
             # Get name from the h1 title
             name_elem = soup.find('h1')
@@ -130,8 +165,9 @@ class MountainProjectScraper:
             if not grade:
                 return None
                 
-            # Only process boulder problems (V grades)
-            if not any(x in grade for x in ['V0', 'V1', 'V2', 'V3', 'V4', 'V5', 'V6', 'V7', 'V8', 'V9', 'V10', 'V11', 'V12', 'V13', 'V14', 'V15', 'V16']):
+            # Only process boulder problems (V grades); route pages list
+            # French grades that look like Font grades, so those are ignored
+            if parse_grade(grade, v_only=True) is None:
                 return None
             
             # Get description from the route description section
@@ -162,13 +198,9 @@ class MountainProjectScraper:
 
     def convert_to_boulder(self, mp_data: Dict) -> Boulder:
         """Convert Mountain Project data to a Boulder object"""
-        # Extract V-grade number
-        grade_match = re.search(r'V(\d+)', mp_data['grade'])
-        v_grade = f"V{grade_match.group(1)}" if grade_match else "VB"
-        
         return Boulder(
             name=mp_data['name'],
-            grade=v_grade,
+            grade=parse_grade(mp_data['grade'], v_only=True) or "VB",
             description=mp_data['description'],
             location=mp_data['location'],
             url=mp_data['url'],
@@ -176,7 +208,7 @@ class MountainProjectScraper:
             longitude=0.0,
             approach_distance=0.0,
             route_type='boulder',
-            holds=[],
+            holds=extract_holds(mp_data['description']),
             rating=0.0
         )
 
@@ -202,5 +234,7 @@ def main():
             print(f"Error adding boulder to database: {e}")
             continue
 
+    print(f"Crawl stats: {scraper.stats.as_dict()}")
+
 if __name__ == "__main__":
     main() 
\ No newline at end of file
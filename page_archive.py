@@ -0,0 +1,90 @@
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+from typing import Iterator, Optional, Tuple
+
+# Fetch modes shared by the scrapers
+LIVE = 'live'      # Fetch from the network only
+RECORD = 'record'  # Fetch from the network and write every page to the archive
+REPLAY = 'replay'  # Serve pages from the archive, never touch the network
+
+FETCH_MODES = (LIVE, RECORD, REPLAY)
+
+class PageArchive:
+    """Compact local archive of fetched pages for offline re-parsing
+
+    Each page is stored once per URL with the time it was fetched and a
+    zlib-compressed body, so a full region can be re-parsed from disk after
+    a parser change instead of being re-crawled.
+    """
+
+    def __init__(self, path: str = "page_archive.db", compression_level: int = 6):
+        self.path = path
+        self.compression_level = compression_level
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                fetched_at TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                body BLOB NOT NULL
+            )
+        ''')
+        self._conn.commit()
+
+    def record(self, url: str, body: str, status: int = 200,
+               fetched_at: Optional[datetime] = None):
+        """Store (or replace) the page body fetched from a URL"""
+        fetched_at = fetched_at or datetime.utcnow()
+        compressed = zlib.compress(body.encode('utf-8'), self.compression_level)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO pages (url, fetched_at, status, body) VALUES (?, ?, ?, ?)',
+                (url, fetched_at.isoformat(), status, compressed)
+            )
+            self._conn.commit()
+
+    def get(self, url: str) -> Optional[str]:
+        """Return the archived body for a URL, or None if it was never recorded"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT body FROM pages WHERE url = ?', (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def fetched_at(self, url: str) -> Optional[datetime]:
+        """Return when a URL was recorded, or None if it is not archived"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT fetched_at FROM pages WHERE url = ?', (url,)
+            ).fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def urls(self) -> Iterator[Tuple[str, datetime]]:
+        """Iterate over (url, fetched_at) for every archived page"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT url, fetched_at FROM pages ORDER BY url'
+            ).fetchall()
+        for url, fetched_at in rows:
+            yield url, datetime.fromisoformat(fetched_at)
+
+    def __contains__(self, url: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM pages WHERE url = ?', (url,)
+            ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
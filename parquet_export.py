@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""Partitioned Parquet export of the boulders table and a fast loader
+
+The export is an append-only, hive-partitioned dataset (region=CA/... or
+grade_group=V4/...). Each run writes only the rows added since the last
+run, tracked by id in an export state file, so a nightly export costs time
+proportional to the new rows:
+
+    python -m parquet_export export --db boulders.db --out exports/boulders --partition-by region
+
+Analytics jobs can read the dataset with any Parquet reader. ColumnarBoulders
+loads it (or some partitions of it) into columns the recommendation agent
+can query directly, without decoding a single SQLite row:
+
+    store = ColumnarBoulders.load('exports/boulders', regions=['CA'])
+    agent = BoulderingRecommendationAgent(store)
+
+pyarrow is imported where it is used, so importing this module stays cheap.
+"""
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from bouldering_agent import COLUMNS, BoulderDatabase, BoulderRow
+from grades import grade_ordinals, parse_grade
+from metrics import timed
+
+STATE_FILE = '_export_state.json'
+
+# Partition column written for each --partition-by choice
+PARTITION_COLUMNS = {'region': 'region', 'grade': 'grade_group'}
+
+# Rows read from SQLite and written per Parquet file
+EXPORT_CHUNK = 100000
+
+_UNSAFE_PATH_CHARS = re.compile(r'[^A-Za-z0-9 _.,+-]+')
+
+def region_of(location: Optional[str]) -> str:
+    """Top-level region of a location: the first breadcrumb segment, or the
+    state in "Bishop, CA"
+    """
+    if not location:
+        return 'unknown'
+    if '>' in location:
+        region = location.split('>', 1)[0]
+    else:
+        region = location.rsplit(',', 1)[-1]
+    return _partition_value(region)
+
+def grade_group_of(grade: Optional[str]) -> str:
+    """The canonical V grade of a grade, or "other" if it is not recognized"""
+    return parse_grade(grade) or 'other'
+
+def _partition_value(text: str) -> str:
+    # Partition values become directory names
+    value = _UNSAFE_PATH_CHARS.sub('_', text).strip(' _')
+    return value or 'unknown'
+
+def _schema(partition_column: str):
+    import pyarrow as pa
+    return pa.schema([
+        ('id', pa.int64()),
+        ('name', pa.string()),
+        ('grade', pa.string()),
+        ('grade_ordinal', pa.int16()),
+        ('location', pa.string()),
+        ('latitude', pa.float64()),
+        ('longitude', pa.float64()),
+        ('approach_distance', pa.float64()),
+        ('route_type', pa.string()),
+        ('holds', pa.list_(pa.string())),
+        ('description', pa.string()),
+        ('url', pa.string()),
+        ('rating', pa.float64()),
+        ('height', pa.float64()),
+        ('fa', pa.string()),
+        ('created_at', pa.string()),
+        (partition_column, pa.string()),
+    ])
+
+def read_state(out_dir: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(out_dir, STATE_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _write_state(out_dir: str, state: Dict):
+    path = os.path.join(out_dir, STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+def export_parquet(db_path: str, out_dir: str, partition_by: str = 'region',
+                   full: bool = False, chunk_size: int = EXPORT_CHUNK) -> Dict:
+    """
+    Append the rows added since the last export to a partitioned Parquet dataset
+
+    Args:
+        db_path: SQLite database to export
+        out_dir: Dataset root; holds the export state file
+        partition_by: 'region' or 'grade'
+        full: Discard the existing export and start again from the first row
+        chunk_size: Rows per written file (per partition)
+
+    Returns:
+        The new export state: last exported id, run number and row counts
+
+    Raises:
+        ValueError: partition_by differs from the existing export's
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if partition_by not in PARTITION_COLUMNS:
+        raise ValueError(f"partition_by must be one of {sorted(PARTITION_COLUMNS)}")
+    partition_column = PARTITION_COLUMNS[partition_by]
+
+    state = read_state(out_dir)
+    if state is not None and full:
+        shutil.rmtree(out_dir)
+        state = None
+    if state is not None and state['partition_by'] != partition_by:
+        raise ValueError(f"{out_dir} is partitioned by {state['partition_by']}; "
+                         f"pass full=True to re-export by {partition_by}")
+    if state is None:
+        state = {'partition_by': partition_by, 'last_id': 0, 'runs': 0, 'rows': 0}
+    os.makedirs(out_dir, exist_ok=True)
+
+    run = state['runs'] + 1
+    schema = _schema(partition_column)
+    partition_of = region_of if partition_by == 'region' else grade_group_of
+    exported = 0
+    last_id = state['last_id']
+
+    BoulderDatabase(db_path)  # Brings older schemas up to date
+    conn = sqlite3.connect(db_path)
+    cursor = conn.execute(f'''
+        SELECT {', '.join(COLUMNS)}, created_at FROM boulders
+        WHERE id > ? AND duplicate_of IS NULL ORDER BY id
+    ''', (last_id,))
+    chunk_no = 0
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        with timed('export.write'):
+            data = {name: [] for name in schema.names}
+            ordinals = grade_ordinals(row[COLUMNS.index('grade')] for row in rows)
+            for row, ordinal in zip(rows, ordinals):
+                record = dict(zip(COLUMNS + ('created_at',), row))
+                record['holds'] = json.loads(record['holds']) if record['holds'] else []
+                record['grade_ordinal'] = ordinal
+                key = 'location' if partition_by == 'region' else 'grade'
+                record[partition_column] = partition_of(record[key])
+                for name in schema.names:
+                    data[name].append(record[name])
+            table = pa.Table.from_pydict(data, schema=schema)
+            pq.write_to_dataset(
+                table, root_path=out_dir, partition_cols=[partition_column],
+                basename_template=f"part-{run:06d}-{chunk_no:05d}-{{i}}.parquet",
+                existing_data_behavior='overwrite_or_ignore')
+        exported += len(rows)
+        last_id = rows[-1][0]
+        chunk_no += 1
+    conn.close()
+
+    # The watermark only moves once every file of the run is written
+    state.update({'last_id': last_id, 'runs': run, 'rows': state['rows'] + exported,
+                  'last_run_rows': exported, 'exported_at': time.time()})
+    _write_state(out_dir, state)
+    return state
+
+class ColumnarRow(BoulderRow):
+    """BoulderRow reading its columns from a ColumnarBoulders store on access"""
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store: 'ColumnarBoulders', index: int, distance: Optional[float] = None):
+        super().__init__((), distance)
+        self._store = store
+        self._index = index
+
+    def _value(self, name: str):
+        column = self._store.columns.get(name)
+        if column is None:
+            raise KeyError(name)
+        return column[self._index].as_py()
+
+class ColumnarBoulders:
+    """Boulders loaded from a Parquet export into Arrow columns, sorted by latitude
+
+    Offers the same get_boulders_near_location contract as BoulderDatabase, so
+    it can back a BoulderingRecommendationAgent. Only latitude and longitude
+    are converted to numpy up front; other columns are read per returned row.
+    """
+
+    def __init__(self, table):
+        import pyarrow.compute as pc
+
+        table = table.filter(pc.and_(pc.is_valid(table['latitude']), pc.is_valid(table['longitude'])))
+        table = table.sort_by('latitude')
+        self.table = table
+        self.columns = {name: table.column(name).combine_chunks()
+                        for name in COLUMNS if name in table.column_names}
+        self.latitudes = table.column('latitude').to_numpy()
+        self.longitudes = table.column('longitude').to_numpy()
+
+    @classmethod
+    def load(cls, path: str, regions: Optional[Sequence[str]] = None,
+             grades: Optional[Sequence[str]] = None) -> 'ColumnarBoulders':
+        """
+        Load an export, optionally only some of its partitions
+
+        Args:
+            path: Dataset root written by export_parquet
+            regions: Region partitions to read (exports partitioned by region)
+            grades: Grade partitions to read (exports partitioned by grade)
+        """
+        import pyarrow.parquet as pq
+
+        filters = []
+        if regions:
+            filters.append(('region', 'in', list(regions)))
+        if grades:
+            filters.append(('grade_group', 'in', list(grades)))
+        with timed('parquet.load'):
+            table = pq.read_table(path, columns=list(COLUMNS), filters=filters or None)
+            return cls(table)
+
+    def __len__(self) -> int:
+        return len(self.latitudes)
+
+    def get_boulders_near_location(self, lat: float, lon: float,
+                                   radius_miles: float = 50) -> List[BoulderRow]:
+        """Same contract as BoulderDatabase.get_boulders_near_location"""
+        import numpy as np
+        from geopy.distance import geodesic
+
+        with timed('parquet.band'):
+            # Latitude band by binary search, then a vectorized great-circle
+            # cut with slack for the sphere/ellipsoid difference
+            lat_delta = radius_miles / 68.7 * 1.01
+            start = int(np.searchsorted(self.latitudes, lat - lat_delta, side='left'))
+            end = int(np.searchsorted(self.latitudes, lat + lat_delta, side='right'))
+            band_lat = np.radians(self.latitudes[start:end])
+            band_lon = np.radians(self.longitudes[start:end])
+            lat_r, lon_r = math.radians(lat), math.radians(lon)
+            a = (np.sin((band_lat - lat_r) / 2) ** 2 +
+                 math.cos(lat_r) * np.cos(band_lat) * np.sin((band_lon - lon_r) / 2) ** 2)
+            approx_miles = 2 * 3958.8 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+            candidates = np.nonzero(approx_miles <= radius_miles * 1.01 + 0.01)[0] + start
+
+        user_location = (lat, lon)
+        nearby_boulders = []
+        with timed('parquet.distance'):
+            for i in candidates.tolist():
+                distance = geodesic(user_location, (self.latitudes[i], self.longitudes[i])).miles
+                if distance <= radius_miles:
+                    nearby_boulders.append(ColumnarRow(self, i, distance))
+        nearby_boulders.sort(key=lambda boulder: boulder.distance)
+        return nearby_boulders
+
+def main(argv: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description="Export boulders to partitioned Parquet")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export = subparsers.add_parser('export', help='Append rows added since the last export')
+    export.add_argument('--db', default='boulders.db')
+    export.add_argument('--out', default='exports/boulders')
+    export.add_argument('--partition-by', choices=sorted(PARTITION_COLUMNS), default='region')
+    export.add_argument('--full', action='store_true', help='Discard the existing export and start over')
+    status = subparsers.add_parser('status', help='Show the export state')
+    status.add_argument('--out', default='exports/boulders')
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        start = time.perf_counter()
+        state = export_parquet(args.db, args.out, args.partition_by, full=args.full)
+        print(f"Exported {state['last_run_rows']} rows in {time.perf_counter() - start:.1f}s "
+              f"({state['rows']} total, up to id {state['last_id']})")
+    elif args.command == 'status':
+        print(json.dumps(read_state(args.out), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 import time
 import random
+import argparse
 from mp_scraper import MountainProjectScraper
 from bouldering_agent import BoulderDatabase
+from page_archive import PageArchive, RECORD, REPLAY
+from boulder_snapshot import publish_snapshot
+from map_tiles import invalidate_cached_tiles
 import logging
 
 # Set up logging
@@ -19,10 +23,23 @@ TEST_AREAS = [
 
 def main():
     """Populate database with boulder problems from test area"""
-    scraper = MountainProjectScraper()
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--record', metavar='ARCHIVE', help='Write every fetched page to this archive')
+    parser.add_argument('--replay', metavar='ARCHIVE', help='Re-parse pages from this archive with no network access')
+    parser.add_argument('--publish-snapshot', metavar='DIR',
+                        help='Publish a memory-mapped snapshot for the web workers after ingest')
+    args = parser.parse_args()
+
+    if args.replay:
+        scraper = MountainProjectScraper(PageArchive(args.replay), mode=REPLAY)
+    elif args.record:
+        scraper = MountainProjectScraper(PageArchive(args.record), mode=RECORD)
+    else:
+        scraper = MountainProjectScraper()
     db = BoulderDatabase('boulders.db')
     
     total_boulders = 0
+    written = []  # Points of rows inserted or updated
     
     # Process test area
     for area in TEST_AREAS:
@@ -34,9 +51,12 @@ def main():
         for mp_data in boulders:
             try:
                 boulder = scraper.convert_to_boulder(mp_data)
-                db.add_boulder(boulder)
-                area_count += 1
-                logger.info(f"Added {boulder.name} ({boulder.grade})")
+                status, latitude, longitude = db.record_fetch(boulder)
+                if status == 'new':
+                    area_count += 1
+                if status != 'unchanged':
+                    written.append((latitude, longitude))
+                logger.info(f"{boulder.name} ({boulder.grade}): {status}")
             except Exception as e:
                 logger.error(f"Error adding boulder to database: {e}")
                 continue
@@ -45,6 +65,16 @@ def main():
         logger.info(f"Added {area_count} boulders from {area['name']}")
     
     logger.info(f"\nTotal boulders added: {total_boulders}")
+    logger.info(f"Crawl stats: {scraper.stats.as_dict()}")
+
+    # Only the map tiles containing new or changed problems need rebuilding
+    if written:
+        invalidated = invalidate_cached_tiles(db.db_path, written)
+        logger.info(f"Invalidated {invalidated} map tiles")
+
+    if args.publish_snapshot:
+        path = publish_snapshot(db.db_path, args.publish_snapshot)
+        logger.info(f"Published snapshot {path}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""Incremental re-crawl: refetch the pages most likely to have changed
+
+A full crawl refetches every route and area page. Most of them have not
+changed since the last fetch, so instead the scheduler scores every known
+page and queues only the best ones, up to a daily request budget, for the
+existing crawl workers:
+
+    python -m recrawl plan --budget 500       # show what would be queued
+    python -m recrawl schedule --budget 500   # queue it
+    python -m crawl_worker work
+
+A page's score is the chance it changed since its last fetch, weighted by
+popularity. Change rates are estimated per page from how often past fetches
+found different content (Poisson, with a prior of one change per
+PRIOR_DAYS so pages with little history are neither ignored nor
+favoured). Popularity is the route's star rating, or for an area, its
+number of problems. Pages never fetched by a tracking crawler score as
+certainly stale.
+
+Run `schedule` from cron; running it more than once a day only fills the
+rest of that day's budget. New routes found on refetched areas are queued
+as ordinary crawl jobs and are not counted against the budget.
+"""
+import argparse
+import heapq
+import json
+import math
+import sqlite3
+import time
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from crawl_queue import AREA, ROUTE, CrawlQueue
+
+# Prior for the change-rate estimate: PRIOR_CHANGES changes over PRIOR_DAYS
+PRIOR_CHANGES = 1.0
+PRIOR_DAYS = 90.0
+
+# Pages fetched more recently than this are never rescheduled
+MIN_AGE_DAYS = 1.0
+
+DAY_SECONDS = 86400
+
+ROUTE_URL_PREFIX = 'https://www.mountainproject.com/route/'
+
+class Candidate(NamedTuple):
+    """A page that could be refetched, and why"""
+    score: float
+    url: str
+    kind: str
+    age_days: Optional[float]  # None if never fetched with tracking
+    changes_per_day: float
+
+def change_rate(changes: int, first_fetched: Optional[float], last_fetched: Optional[float]) -> float:
+    """Estimated changes per day from a page's fetch history"""
+    observed_days = ((last_fetched - first_fetched) / DAY_SECONDS
+                     if first_fetched is not None and last_fetched is not None else 0.0)
+    return (changes + PRIOR_CHANGES) / (observed_days + PRIOR_DAYS)
+
+def refresh_score(age_days: Optional[float], changes_per_day: float, popularity: float) -> float:
+    """Popularity-weighted probability that a page changed in the last age_days"""
+    stale = 1.0 if age_days is None else 1.0 - math.exp(-changes_per_day * age_days)
+    return stale * (1.0 + math.log1p(max(popularity or 0.0, 0.0)))
+
+def _candidate(url: str, kind: str, popularity: float, first_fetched: Optional[float],
+               last_fetched: Optional[float], changes: int, now: float) -> Optional[Candidate]:
+    age_days = (now - last_fetched) / DAY_SECONDS if last_fetched is not None else None
+    if age_days is not None and age_days < MIN_AGE_DAYS:
+        return None
+    rate = change_rate(changes, first_fetched, last_fetched)
+    return Candidate(refresh_score(age_days, rate, popularity), url, kind, age_days, rate)
+
+def _route_candidates(db_path: str, now: float) -> Iterator[Candidate]:
+    conn = sqlite3.connect(db_path)
+    # Rows sharing a URL are one page
+    cursor = conn.execute('''
+        SELECT url, MAX(rating), MIN(first_fetched), MAX(last_fetched), MAX(change_count)
+        FROM boulders WHERE url LIKE ? GROUP BY url
+    ''', (ROUTE_URL_PREFIX + '%',))
+    for url, rating, first_fetched, last_fetched, changes in cursor:
+        candidate = _candidate(url, ROUTE, rating, first_fetched, last_fetched, changes or 0, now)
+        if candidate is not None:
+            yield candidate
+    conn.close()
+
+def _area_candidates(queue: CrawlQueue, now: float) -> Iterator[Candidate]:
+    for url, route_count, first_fetched, last_fetched, changes in queue.area_fetch_stats():
+        candidate = _candidate(url, AREA, route_count, first_fetched, last_fetched, changes, now)
+        if candidate is not None:
+            yield candidate
+
+def plan_refresh(db_path: str, queue: CrawlQueue, limit: int,
+                 now: Optional[float] = None) -> Tuple[List[Candidate], int]:
+    """
+    Pick the pages most worth refetching
+
+    Args:
+        db_path: Boulder database whose route pages are considered
+        queue: Crawl queue holding the discovered areas
+        limit: Most pages to return
+        now: Scoring time (defaults to the current time)
+
+    Returns:
+        The top `limit` candidates, best first, and the number of pages scored
+    """
+    now = now if now is not None else time.time()
+    active = queue.active_urls()
+    scored = 0
+
+    def candidates():
+        nonlocal scored
+        for source in (_area_candidates(queue, now), _route_candidates(db_path, now)):
+            for candidate in source:
+                scored += 1
+                if candidate.url not in active:
+                    yield candidate
+
+    best = heapq.nlargest(limit, candidates())
+    return best, scored
+
+def today(now: Optional[float] = None) -> str:
+    """The UTC day budgets are counted against"""
+    return time.strftime('%Y-%m-%d', time.gmtime(now))
+
+def schedule_refresh(db_path: str, queue: CrawlQueue, budget: int,
+                     now: Optional[float] = None) -> dict:
+    """
+    Queue today's share of refetches for the crawl workers
+
+    Args:
+        db_path: Boulder database whose route pages are considered
+        queue: Crawl queue to add the jobs to
+        budget: Most refetches queued per UTC day
+        now: Scheduling time (defaults to the current time)
+
+    Returns:
+        Pages scored, jobs queued now and the day's total so far
+    """
+    day = today(now)
+    remaining = budget - queue.refresh_scheduled(day)
+    if remaining <= 0:
+        return {'day': day, 'scored': 0, 'queued': 0, 'scheduled_today': budget - remaining}
+    best, scored = plan_refresh(db_path, queue, remaining, now)
+    queued = queue.schedule_refresh([(c.url, c.kind) for c in best], day, budget)
+    return {'day': day, 'scored': scored, 'queued': queued,
+            'scheduled_today': queue.refresh_scheduled(day)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Schedule refetches of the pages most likely to have changed")
+    parser.add_argument('--db', default='boulders.db', help='Boulder database')
+    parser.add_argument('--queue', default='crawl_queue.db', help='Shared job queue database')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    plan = subparsers.add_parser('plan', help='Show the pages that would be queued')
+    plan.add_argument('--budget', type=int, default=500)
+    plan.add_argument('--show', type=int, default=20, help='Candidates to print')
+
+    schedule = subparsers.add_parser('schedule', help="Queue today's refetches")
+    schedule.add_argument('--budget', type=int, default=500, help='Most refetches per UTC day')
+    args = parser.parse_args()
+
+    queue = CrawlQueue(args.queue)
+    if args.command == 'plan':
+        best, scored = plan_refresh(args.db, queue, args.budget)
+        for candidate in best[:args.show]:
+            age = f"{candidate.age_days:.0f}d" if candidate.age_days is not None else 'never'
+            print(f"{candidate.score:6.3f}  {candidate.kind:5}  age {age:>5}  "
+                  f"{candidate.changes_per_day * 30:.2f}/month  {candidate.url}")
+        print(f"{len(best)} of {scored} pages would be refetched")
+    elif args.command == 'schedule':
+        print(json.dumps(schedule_refresh(args.db, queue, args.budget), indent=2))
+    queue.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import logging
+import math
+import sqlite3
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from crawl_policy import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# (min_lat, min_lon, max_lat, max_lon)
+BBox = Tuple[float, float, float, float]
+
+EARTH_RADIUS_MILES = 3958.8
+
+def haversine_miles(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in miles"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+@dataclass(frozen=True)
+class Tile:
+    """A rectangular piece of the sweep region, queried as one radius search"""
+    min_lat: float
+    min_lon: float
+    max_lat: float
+    max_lon: float
+    depth: int = 0
+
+    @property
+    def key(self) -> str:
+        return f"{self.min_lat:.6f},{self.min_lon:.6f},{self.max_lat:.6f},{self.max_lon:.6f}"
+
+    @property
+    def center(self) -> Tuple[float, float]:
+        return (self.min_lat + self.max_lat) / 2, (self.min_lon + self.max_lon) / 2
+
+    def radius_miles(self, overlap: float) -> float:
+        """Radius of a circle around the centre that covers the whole tile"""
+        lat, lon = self.center
+        corner = max(haversine_miles(lat, lon, corner_lat, corner_lon)
+                     for corner_lat in (self.min_lat, self.max_lat)
+                     for corner_lon in (self.min_lon, self.max_lon))
+        return corner * (1 + overlap)
+
+    def contains(self, lat: float, lon: float) -> bool:
+        return self.min_lat <= lat <= self.max_lat and self.min_lon <= lon <= self.max_lon
+
+    def split(self) -> List['Tile']:
+        """Quarter the tile"""
+        mid_lat, mid_lon = self.center
+        depth = self.depth + 1
+        return [
+            Tile(self.min_lat, self.min_lon, mid_lat, mid_lon, depth),
+            Tile(self.min_lat, mid_lon, mid_lat, self.max_lon, depth),
+            Tile(mid_lat, self.min_lon, self.max_lat, mid_lon, depth),
+            Tile(mid_lat, mid_lon, self.max_lat, self.max_lon, depth),
+        ]
+
+class RegionSweep:
+    """Complete ingest of a bounding box past the API's maxResults cap
+
+    The region is covered with tiles, each queried with the smallest radius
+    that covers it (plus a small overlap). A tile whose query hits the result
+    cap may have been truncated, so it is quartered and its children queried
+    instead. Sparse regions therefore cost a handful of requests and dense
+    ones are refined only where needed. Tile progress and the route IDs
+    already seen are checkpointed in SQLite, so an interrupted sweep resumes
+    where it stopped.
+    """
+
+    def __init__(self, api, checkpoint_path: str = "sweep_checkpoint.db",
+                 max_distance: float = 200, max_results: int = 500,
+                 overlap: float = 0.05, max_depth: int = 12, max_workers: int = 4,
+                 rate_limiter: Optional[RateLimiter] = None):
+        self.api = api
+        self.max_distance = max_distance
+        self.max_results = max_results
+        self.overlap = overlap
+        self.max_depth = max_depth
+        self.max_workers = max_workers
+        self.rate_limiter = rate_limiter or RateLimiter(min_interval=0.5)
+        self.stats = {'requests': 0, 'tiles_split': 0, 'tiles_truncated': 0,
+                      'tiles_failed': 0, 'routes': 0, 'duplicates': 0}
+
+        self._conn = sqlite3.connect(checkpoint_path)
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS sweep_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS tiles (
+                key TEXT PRIMARY KEY,
+                min_lat REAL, min_lon REAL, max_lat REAL, max_lon REAL,
+                depth INTEGER,
+                status TEXT NOT NULL DEFAULT 'pending'  -- pending, done
+            );
+            CREATE TABLE IF NOT EXISTS seen_routes (
+                id INTEGER PRIMARY KEY
+            );
+        ''')
+
+    def initial_tiles(self, bbox: BBox) -> List[Tile]:
+        """Fewest equal tiles whose covering radius stays within max_distance"""
+        min_lat, min_lon, max_lat, max_lon = bbox
+        # Widest east-west span is on the parallel nearest the equator
+        widest_lat = 0.0 if min_lat <= 0 <= max_lat else min(abs(min_lat), abs(max_lat))
+        height = haversine_miles(min_lat, min_lon, max_lat, min_lon)
+        width = haversine_miles(widest_lat, min_lon, widest_lat, max_lon)
+        side = self.max_distance * math.sqrt(2) / (1 + self.overlap)
+        rows = max(1, math.ceil(height / side))
+        cols = max(1, math.ceil(width / side))
+
+        lat_step = (max_lat - min_lat) / rows
+        lon_step = (max_lon - min_lon) / cols
+        return [Tile(min_lat + r * lat_step, min_lon + c * lon_step,
+                     min_lat + (r + 1) * lat_step, min_lon + (c + 1) * lon_step)
+                for r in range(rows) for c in range(cols)]
+
+    def _load_pending(self, bbox: BBox) -> List[Tile]:
+        """Resume from the checkpoint, or seed it for a new sweep"""
+        bbox_key = ','.join(f"{value:.6f}" for value in bbox)
+        row = self._conn.execute("SELECT value FROM sweep_meta WHERE key = 'bbox'").fetchone()
+        if row and row[0] != bbox_key:
+            raise ValueError(f"Checkpoint belongs to a different region ({row[0]})")
+
+        if row is None:
+            tiles = self.initial_tiles(bbox)
+            with self._conn:
+                self._conn.execute("INSERT INTO sweep_meta (key, value) VALUES ('bbox', ?)", (bbox_key,))
+                self._save_tiles(tiles)
+            return tiles
+
+        rows = self._conn.execute('''
+            SELECT min_lat, min_lon, max_lat, max_lon, depth FROM tiles WHERE status = 'pending'
+        ''').fetchall()
+        return [Tile(*row) for row in rows]
+
+    def _save_tiles(self, tiles: List[Tile]):
+        self._conn.executemany('''
+            INSERT OR IGNORE INTO tiles (key, min_lat, min_lon, max_lat, max_lon, depth)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(t.key, t.min_lat, t.min_lon, t.max_lat, t.max_lon, t.depth) for t in tiles])
+
+    def _fetch_tile(self, tile: Tile) -> List[Dict]:
+        self.rate_limiter.wait(self.api.base_url)
+        lat, lon = tile.center
+        return self.api.get_area_by_lat_lon(lat, lon, tile.radius_miles(self.overlap),
+                                            self.max_results)
+
+    def sweep(self, bbox: BBox,
+              on_routes: Optional[Callable[[List[Dict]], None]] = None) -> List[Dict]:
+        """
+        Fetch every route in a bounding box exactly once
+
+        Args:
+            bbox: (min_lat, min_lon, max_lat, max_lon)
+            on_routes: Called with each batch of new routes before the tile that
+                produced it is checkpointed, e.g. to store them
+
+        Returns:
+            New routes found by this run (routes seen by an earlier, interrupted
+            run of the same sweep are not returned again)
+        """
+        pending = self._load_pending(bbox)
+        region = Tile(*bbox)
+        found = []
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._fetch_tile, tile): tile for tile in pending}
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    tile = futures.pop(future)
+                    self.stats['requests'] += 1
+                    try:
+                        routes = future.result()
+                    except Exception as e:
+                        # Left pending in the checkpoint for the next run
+                        logger.error(f"Tile {tile.key} failed: {e}")
+                        self.stats['tiles_failed'] += 1
+                        continue
+
+                    children = []
+                    if len(routes) >= self.max_results:
+                        if tile.depth < self.max_depth:
+                            children = tile.split()
+                            self.stats['tiles_split'] += 1
+                        else:
+                            logger.warning(f"Tile {tile.key} still capped at max depth; results may be truncated")
+                            self.stats['tiles_truncated'] += 1
+
+                    new_routes = [] if children else self._new_routes(routes, region)
+                    if new_routes and on_routes:
+                        on_routes(new_routes)
+                    found.extend(new_routes)
+
+                    with self._conn:
+                        self._save_tiles(children)
+                        self._conn.executemany('INSERT OR IGNORE INTO seen_routes (id) VALUES (?)',
+                                               [(route['id'],) for route in new_routes])
+                        self._conn.execute("UPDATE tiles SET status = 'done' WHERE key = ?", (tile.key,))
+
+                    for child in children:
+                        futures[executor.submit(self._fetch_tile, child)] = child
+
+        self.stats['routes'] += len(found)
+        return found
+
+    def _new_routes(self, routes: List[Dict], region: Tile) -> List[Dict]:
+        """Routes inside the region that no tile has produced yet"""
+        new_routes = []
+        batch_ids = set()
+        for route in routes:
+            route_id = route.get('id')
+            if route_id is None or route_id in batch_ids:
+                continue
+            if not region.contains(float(route['latitude']), float(route['longitude'])):
+                continue
+            seen = self._conn.execute('SELECT 1 FROM seen_routes WHERE id = ?', (route_id,)).fetchone()
+            if seen:
+                self.stats['duplicates'] += 1
+                continue
+            batch_ids.add(route_id)
+            new_routes.append(route)
+        return new_routes
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,141 @@
+import gzip
+import hashlib
+import json
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the standard library encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Optional: only gzip is offered without it
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = 1024
+
+# NDJSON rows are compressed and flushed to the client in groups of this many
+STREAM_CHUNK_ROWS = 100
+
+def dumps(obj) -> bytes:
+    """Encode to compact JSON bytes with the fastest available encoder"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+def parse_fields(value, allowed: Iterable[str]) -> Optional[List[str]]:
+    """
+    Parse a field projection given as "a,b,c" or a list
+
+    Raises:
+        ValueError: A requested field is not one of `allowed`
+    """
+    if not value:
+        return None
+    fields = value.split(',') if isinstance(value, str) else list(value)
+    fields = [field.strip() for field in fields if field.strip()]
+    unknown = sorted(set(fields) - set(allowed))
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+def project(rows: Iterable[Dict], fields: Optional[Sequence[str]]) -> Iterator[Dict]:
+    """Yield rows restricted to `fields` (all fields when None)"""
+    if fields is None:
+        yield from rows
+        return
+    for row in rows:
+        yield {field: row.get(field) for field in fields}
+
+def negotiate_encoding(accept_encoding) -> Optional[str]:
+    """Best content coding we support from an Accept-Encoding header"""
+    if brotli is not None and accept_encoding['br'] > 0:
+        if accept_encoding['br'] >= accept_encoding['gzip']:
+            return 'br'
+    if accept_encoding['gzip'] > 0:
+        return 'gzip'
+    return None
+
+def _compress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+def encoded_response(body: bytes, mimetype: str, status: int = 200) -> Response:
+    """
+    Wrap an encoded body with a weak ETag and negotiated compression
+
+    A request whose If-None-Match matches the ETag gets an empty 304.
+    """
+    etag = hashlib.sha1(body).hexdigest()[:20]
+    if status == 200 and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    encoding = negotiate_encoding(request.accept_encodings) if len(body) >= MIN_COMPRESS_BYTES else None
+    response = Response(_compress(body, encoding), status=status, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(etag, weak=True)
+    return response
+
+def json_response(payload, status: int = 200) -> Response:
+    """Encode a JSON response with a weak ETag and negotiated compression"""
+    return encoded_response(dumps(payload), 'application/json', status)
+
+class _StreamCompressor:
+    """Incremental compressor that flushes after every chunk"""
+
+    def __init__(self, encoding: Optional[str]):
+        self.encoding = encoding
+        if encoding == 'gzip':
+            self._gzip = zlib.compressobj(6, zlib.DEFLATED, 31)
+        elif encoding == 'br':
+            self._brotli = brotli.Compressor(quality=5)
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == 'gzip':
+            return self._gzip.compress(data) + self._gzip.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == 'br':
+            return self._brotli.process(data) + self._brotli.flush()
+        return data
+
+    def finish(self) -> bytes:
+        if self.encoding == 'gzip':
+            return self._gzip.flush(zlib.Z_FINISH)
+        if self.encoding == 'br':
+            return self._brotli.finish()
+        return b''
+
+def ndjson_response(rows: Iterable[Dict]) -> Response:
+    """Stream rows as newline-delimited JSON, encoding each as it is produced"""
+    encoding = negotiate_encoding(request.accept_encodings)
+
+    def generate():
+        compressor = _StreamCompressor(encoding)
+        buffer = []
+        for row in rows:
+            buffer.append(dumps(row))
+            if len(buffer) >= STREAM_CHUNK_ROWS:
+                yield compressor.chunk(b'\n'.join(buffer) + b'\n')
+                buffer = []
+        if buffer:
+            yield compressor.chunk(b'\n'.join(buffer) + b'\n')
+        tail = compressor.finish()
+        if tail:
+            yield tail
+
+    response = Response(generate(), mimetype='application/x-ndjson')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
@@ -0,0 +1,175 @@
+"""Bounded executors that keep slow work from starving the web workers
+
+Under gunicorn's threaded workers (gunicorn.conf.py) every request holds
+a thread until it is answered. Without limits a burst of geocode misses,
+each waiting on Nominatim, could take every thread and leave none for
+/api/recommend. So slow work runs in pools of its own:
+
+- Remote geocoder calls get a small pool and a short wait queue. Once both
+  are full, callers are refused at once (503) instead of piling up.
+- Recommendations run in a pool of threads, or of processes with
+  RECOMMEND_EXECUTOR=process so scoring uses more than one core per worker.
+
+Sizes come from the environment: GEOCODE_CONCURRENCY, GEOCODE_QUEUE,
+GEOCODE_TIMEOUT, RECOMMEND_EXECUTOR, RECOMMEND_WORKERS, RECOMMEND_QUEUE and
+RECOMMEND_TIMEOUT.
+"""
+import contextvars
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from metrics import REGISTRY, collect_timings, timed
+
+class PoolSaturated(Exception):
+    """Every worker and queue place of a BoundedExecutor is taken"""
+
+class BoundedExecutor:
+    """An executor running at most max_workers tasks with max_queued more waiting
+
+    submit() never blocks: past that limit it raises PoolSaturated, so a
+    caller can shed load instead of holding a request thread in a queue.
+    For thread pools, run() carries the caller's context into the worker
+    thread, so stages timed there reach the request's Server-Timing, and
+    time spent queued is recorded as the '<name>.queue' metrics stage.
+    """
+
+    def __init__(self, executor: Executor, name: str, max_workers: int, max_queued: int):
+        self._executor = executor
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self._slots = threading.BoundedSemaphore(max_workers + max_queued)
+
+    @classmethod
+    def threads(cls, name: str, max_workers: int, max_queued: int) -> 'BoundedExecutor':
+        executor = ThreadPoolExecutor(max_workers, thread_name_prefix=name)
+        return cls(executor, name, max_workers, max_queued)
+
+    @classmethod
+    def processes(cls, name: str, max_workers: int, max_queued: int,
+                  initializer: Optional[Callable] = None, initargs: Tuple = ()) -> 'BoundedExecutor':
+        # Spawned rather than forked: the parent is a multi-threaded server
+        executor = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=initializer, initargs=initargs)
+        return cls(executor, name, max_workers, max_queued)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Schedule fn(*args, **kwargs); raise PoolSaturated if the pool is full"""
+        if not self._slots.acquire(blocking=False):
+            raise PoolSaturated(f"The {self.name} pool is full")
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        """
+        Run fn in the pool and wait for its result
+
+        Raises:
+            PoolSaturated: The pool and its queue are full
+            concurrent.futures.TimeoutError: No result within timeout seconds
+                (the task still runs to completion)
+        """
+        if isinstance(self._executor, ThreadPoolExecutor):
+            context = contextvars.copy_context()
+            future = self.submit(context.run, _timed_call, self.name, time.perf_counter(),
+                                 fn, *args, **kwargs)
+        else:
+            future = self.submit(fn, *args, **kwargs)
+        return future.result(timeout)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+def _timed_call(name: str, queued_at: float, fn: Callable, *args, **kwargs):
+    REGISTRY.observe(f'{name}.queue', time.perf_counter() - queued_at)
+    return fn(*args, **kwargs)
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+def geocode_pool_from_env() -> Tuple[BoundedExecutor, float]:
+    """The remote geocoder pool and how long a request waits on it"""
+    # Public Nominatim allows about one request a second, so keep this small
+    pool = BoundedExecutor.threads('geocode', _env_int('GEOCODE_CONCURRENCY', 2),
+                                   _env_int('GEOCODE_QUEUE', 4))
+    return pool, _env_float('GEOCODE_TIMEOUT', 10.0)
+
+# Agent used by recommendation worker processes, built by _init_process_agent
+_process_agent = None
+
+def _init_process_agent(db_path: str, snapshot_dir: Optional[str]):
+    global _process_agent
+    from bouldering_agent import BoulderDatabase, BoulderingRecommendationAgent
+
+    store = BoulderDatabase(db_path)
+    if snapshot_dir:
+        from boulder_snapshot import SnapshotStore
+        store = SnapshotStore(snapshot_dir, fallback=store)
+    _process_agent = BoulderingRecommendationAgent(store)
+
+def _recommend(agent, options: Dict, with_statistics: bool) -> Tuple[List[Dict], Optional[Dict]]:
+    with timed('app.recommend'):
+        recommendations = agent.recommend_routes(**options)
+        statistics = (agent.get_area_statistics(options['user_location'], options['search_radius'])
+                      if with_statistics else None)
+    return recommendations, statistics
+
+def _recommend_in_process(options: Dict, with_statistics: bool):
+    # The parent's registry and request never see this process's timings,
+    # so collect them and send them back with the result
+    with collect_timings() as timings:
+        result = _recommend(_process_agent, options, with_statistics)
+    return result, timings
+
+class RecommendationPool:
+    """Runs the recommendation agent in a bounded thread or process pool"""
+
+    def __init__(self, agent, db_path: str, snapshot_dir: Optional[str] = None,
+                 kind: str = 'thread', max_workers: int = 4, max_queued: int = 32,
+                 timeout: Optional[float] = 30.0):
+        if kind not in ('thread', 'process'):
+            raise ValueError("kind must be 'thread' or 'process'")
+        self.agent = agent
+        self.kind = kind
+        self.timeout = timeout
+        if kind == 'process':
+            self.pool = BoundedExecutor.processes('recommend', max_workers, max_queued,
+                                                  _init_process_agent, (db_path, snapshot_dir))
+        else:
+            self.pool = BoundedExecutor.threads('recommend', max_workers, max_queued)
+
+    @classmethod
+    def from_env(cls, agent, db_path: str, snapshot_dir: Optional[str] = None) -> 'RecommendationPool':
+        return cls(agent, db_path, snapshot_dir,
+                   kind=os.environ.get('RECOMMEND_EXECUTOR', 'thread'),
+                   max_workers=_env_int('RECOMMEND_WORKERS', 4),
+                   max_queued=_env_int('RECOMMEND_QUEUE', 32),
+                   timeout=_env_float('RECOMMEND_TIMEOUT', 30.0))
+
+    def recommend(self, options: Dict, with_statistics: bool = True) -> Tuple[List[Dict], Optional[Dict]]:
+        """
+        Recommendations for recommend_routes keyword arguments, plus area statistics
+
+        Raises:
+            PoolSaturated: Too many recommendations are already in progress
+            concurrent.futures.TimeoutError: The work took longer than the timeout
+        """
+        if self.kind == 'process':
+            result, timings = self.pool.run(_recommend_in_process, options, with_statistics,
+                                            timeout=self.timeout)
+            for stage, seconds in timings:
+                REGISTRY.observe(stage, seconds)
+            return result
+        return self.pool.run(_recommend, self.agent, options, with_statistics, timeout=self.timeout)
@@ -0,0 +1,66 @@
+"""Bulk imports report bad rows instead of aborting or guessing"""
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bouldering_agent import BoulderDatabase
+from bulk_import import MAX_LINE_BYTES, import_records, iter_csv
+
+HEADER = b'name,grade,location,latitude,longitude,description\n'
+
+def _row(name: str, description: bytes = b'', grade: bytes = b'V3') -> bytes:
+    return name.encode('utf-8') + b',' + grade + b',Bishop,37.36,-118.39,' + description + b'\n'
+
+class IterCsvTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.directory.name, 'boulders.db')
+        self.db = BoulderDatabase(self.db_path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _import(self, body: bytes):
+        # One row per batch, so rows before a failure are already committed
+        return import_records(self.db, iter_csv(io.BytesIO(body)), batch_size=1,
+                              link_duplicates=False)
+
+    def _names(self):
+        conn = sqlite3.connect(self.db_path)
+        names = [name for name, in conn.execute('SELECT name FROM boulders ORDER BY id')]
+        conn.close()
+        return names
+
+    def test_long_field_is_imported(self):
+        # Longer than the csv module's default field size limit of 128 KiB
+        body = HEADER + _row('A') + _row('B', b'x' * 200000) + _row('C')
+        report = self._import(body)
+        self.assertEqual((report['imported'], report['failed']), (3, 0))
+        self.assertEqual(self._names(), ['A', 'B', 'C'])
+
+    def test_unclosed_quote_fails_its_row(self):
+        # The open quote swallows the following lines until the field is too long
+        filler = b''.join(_row(f'F{i}', b'x' * 1000) for i in range(MAX_LINE_BYTES // 1000 + 1))
+        body = HEADER + _row('A') + _row('B') + _row('Q', b'"unclosed') + filler
+        report = self._import(body)
+        self.assertEqual(self._names()[:2], ['A', 'B'])
+        self.assertGreaterEqual(report['failed'], 1)
+        self.assertIn('Invalid CSV', report['errors'][0]['error'])
+        self.assertEqual(report['errors'][0]['row'], 4)
+
+    def test_bare_number_grade_fails_its_row(self):
+        # "5" could be V5 or Font 5 (V1), so it is reported rather than guessed
+        body = HEADER + _row('A', grade=b'5') + _row('B', grade=b'6B') + _row('C', grade=b'f5+')
+        report = self._import(body)
+        self.assertEqual((report['imported'], report['failed']), (2, 1))
+        self.assertIn('Unrecognized grade', report['errors'][0]['error'])
+        self.assertEqual(report['errors'][0]['row'], 2)
+        self.assertEqual(self._names(), ['B', 'C'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""MountainProjectAPI against a local stand-in for the Mountain Project API"""
+import json
+import os
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mp_api import MountainProjectAPI
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers get-routes and get-routes-for-lat-lon, recording every request"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        self.server.requests.append((url.path, params))
+        if params.get('key') != 'test-key':
+            return self._send(403, {'error': 'bad key'})
+        if url.path == '/data/get-routes':
+            routes = [{'id': int(route_id), 'name': f'Route {route_id}'}
+                      for route_id in params['routeIds'].split(',')]
+        elif url.path == '/data/get-routes-for-lat-lon':
+            routes = [{'id': 1, 'name': 'Nearby', 'latitude': float(params['lat'])}]
+        else:
+            return self._send(404, {'error': 'no such endpoint'})
+        self._send(200, {'routes': routes, 'success': 1})
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class MountainProjectAPITest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.daemon_threads = True
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}/data/'
+        self.api = MountainProjectAPI('test-key', base_url=self.base_url)
+
+    def tearDown(self):
+        self.api.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_sends_key_and_params(self):
+        routes = self.api.get_area_by_lat_lon(40.015, -105.27)
+        self.assertEqual(routes, [{'id': 1, 'name': 'Nearby', 'latitude': 40.015}])
+        path, params = self.server.requests[0]
+        self.assertEqual(path, '/data/get-routes-for-lat-lon')
+        self.assertEqual(params['key'], 'test-key')
+        self.assertEqual(params['type'], 'boulder')
+
+    def test_get_raises_on_error_status(self):
+        api = MountainProjectAPI('wrong-key', base_url=self.base_url)
+        with self.assertRaises(requests.HTTPError):
+            api.get_routes([1])
+        api.session.close()
+
+    def test_get_routes_batches_ids(self):
+        route_ids = list(range(1, 451))
+        routes = self.api.get_routes(route_ids)
+
+        # Batches may arrive in any order, but results keep the requested order
+        self.assertEqual([route['id'] for route in routes], route_ids)
+        batches = sorted([int(route_id) for route_id in params['routeIds'].split(',')]
+                         for path, params in self.server.requests)
+        self.assertEqual([len(batch) for batch in batches], [200, 200, 50])
+        self.assertEqual([batch[0] for batch in batches], [1, 201, 401])
+        self.assertTrue(all(path == '/data/get-routes' for path, _ in self.server.requests))
+
+    def test_get_routes_without_ids_sends_nothing(self):
+        self.assertEqual(self.api.get_routes([]), [])
+        self.assertEqual(self.server.requests, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+"""BoulderDatabase.record_fetch keeps values a route page does not provide"""
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bouldering_agent import Boulder, BoulderDatabase
+
+URL = 'https://www.mountainproject.com/route/1/midnight-lightning'
+
+def _boulder(**changes) -> Boulder:
+    fields = dict(name='Midnight Lightning', grade='V8', location='Camp 4',
+                  latitude=37.74, longitude=-119.60, approach_distance=0.1,
+                  route_type='Boulder', holds=['crimps'], description='The lightning bolt.',
+                  url=URL, rating=4.5, height=5.0, fa='Ron Kauk, 1978')
+    fields.update(changes)
+    return Boulder(**fields)
+
+class RecordFetchTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.directory.name, 'boulders.db')
+        self.db = BoulderDatabase(self.db_path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _stored(self):
+        conn = sqlite3.connect(self.db_path)
+        row = conn.execute('SELECT grade, description, rating, height, fa FROM boulders '
+                           'WHERE url = ?', (URL,)).fetchone()
+        conn.close()
+        return row
+
+    def test_refetch_keeps_fields_the_page_lacks(self):
+        self.db.add_boulder(_boulder())
+        # What MountainProjectScraper.convert_to_boulder produces for the page
+        scraped = _boulder(grade='V9', description='', rating=0.0, height=None, fa=None)
+        self.assertEqual(self.db.record_fetch(scraped).status, 'baseline')
+        self.assertEqual(self._stored(), ('V9', 'The lightning bolt.', 4.5, 5.0, 'Ron Kauk, 1978'))
+
+    def test_placeholder_changes_are_not_page_changes(self):
+        self.db.record_fetch(_boulder())
+        self.assertEqual(self.db.record_fetch(_boulder(rating=0.0, fa=None)).status, 'unchanged')
+        self.assertEqual(self.db.record_fetch(_boulder(grade='V9')).status, 'changed')
+
+if __name__ == '__main__':
+    unittest.main()